@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2015 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301,
+#  USA.
+"""
+Test script to show how local clients can read log data from the ZMQ server
+through shared memory. The server has to run on the same host.
+
+The log block is created with the shm encoding, the server then writes the
+data to a ring buffer and only publishes the sequence number of the newest
+sample on the log socket.
+"""
+import json
+import signal
+
+try:
+    import zmq
+except ImportError as e:
+    raise Exception("ZMQ library probably not installed ({})".format(e))
+
+from cfzmq.shm import LogRingReader
+
+signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+SRV_ADDR = "tcp://127.0.0.1"
+CF_URI = "radio://0/10/250K"
+
+context = zmq.Context()
+client_conn = context.socket(zmq.REQ)
+client_conn.connect("{}:2000".format(SRV_ADDR))
+
+log_conn = context.socket(zmq.SUB)
+log_conn.connect("{}:2001".format(SRV_ADDR))
+log_conn.setsockopt_string(zmq.SUBSCRIBE, u"Stabilizer")
+
+client_conn.send_json({"version": 1, "cmd": "connect", "uri": CF_URI})
+resp = client_conn.recv_json()
+if resp["status"] != 0:
+    raise Exception("Could not connect: {}".format(resp["msg"]))
+
+client_conn.send_json({
+    "version": 1,
+    "cmd": "log",
+    "action": "create",
+    "name": "Stabilizer",
+    "period": 10,
+    "encoding": "shm",
+    "variables": [
+        "stabilizer.roll",
+        "stabilizer.pitch",
+        "stabilizer.yaw"
+    ]
+})
+resp = client_conn.recv_json()
+if resp["status"] != 0:
+    raise Exception("Could not create block: {}".format(resp["msg"]))
+
+reader = LogRingReader(resp["shm_name"])
+print("Reading {} from {}".format(reader.variables, resp["shm_name"]))
+
+client_conn.send_json({"version": 1, "cmd": "log", "action": "start",
+                       "name": "Stabilizer"})
+client_conn.recv_json()
+
+lost = 0
+while True:
+    [_, msg] = log_conn.recv_multipart()
+    event = json.loads(msg)
+    if event["event"] != "shm":
+        continue
+    for (seq, ts, _, values) in reader.read(event["seq"]):
+        print(seq, ts, dict(zip(reader.variables, values)))
+    if reader.lost != lost:
+        lost = reader.lost
+        print("Lost {} samples in total".format(lost))
@@ -32,6 +32,7 @@ NOTE! If connected to a Crazyflie this will power on the motors!
 """
 
 from threading import Thread
+import json
 import signal
 import time
 import sys
@@ -41,6 +42,9 @@ try:
 except ImportError as e:
     raise Exception("ZMQ library probably not installed ({})".format(e))
 
+# First byte of log data frames sent using the binary encoding
+LOG_BINARY_MAGIC = 0xCF
+
 
 class _LogThread(Thread):
 
@@ -50,7 +54,12 @@ class _LogThread(Thread):
 
     def run(self):
         while True:
-            log = self._socket.recv_json()
+            # The first frame is the name of the log block
+            [_, msg] = self._socket.recv_multipart()
+            if msg[0] == LOG_BINARY_MAGIC:
+                print(msg)
+                continue
+            log = json.loads(msg)
             if log["event"] == "data":
                 print(log)
             if log["event"] == "created":
@@ -252,6 +261,27 @@ if resp["status"] == 0:
 else:
     print("fail! {}".format(resp["msg"]))
 
+params_cmd = {
+    "version": 1,
+    "cmd": "params",
+    "params": [
+        {"name": "system.selftestPassed"},
+        {"name": "flightctrl.xmode", "value": 0}
+    ]
+}
+
+print("Accessing {} params ...".format(len(params_cmd["params"])), end=' ')
+client_conn.send_json(params_cmd)
+resp = client_conn.recv_json()
+if resp["status"] == 0:
+    print("done!")
+else:
+    print("fail! {}".format(resp["msg"]))
+for p in resp["params"]:
+    if p["status"] == 0:
+        print("\t{} = {}".format(p["name"], p["value"]))
+    else:
+        print("\t{} failed: {}".format(p["name"], p["msg"]))
 
 # Start sending control commands
 ctrl = _CtrlThread(ctrl_conn)
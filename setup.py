@@ -147,7 +147,10 @@ setup(
             'cfclient=cfclient.gui:main',
             'cfheadless=cfclient.headless:main',
             'cfloader=cfloader:main',
-            'cfzmq=cfzmq:main'
+            'cfzmq=cfzmq:main',
+            'cfzmq-bench=cfzmq.bench:main',
+            'cflog-recover=cfclient.utils.logrecovery:main',
+            'cfrecord=cfclient.record:main'
         ],
     },
 
@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+"""
+Headless recorder that writes log blocks of a Crazyflie to disk.
+
+The log configurations are read from the same JSON files as the client uses
+and are written with the LogWriter, Qt is not needed.
+"""
+import argparse
+import datetime
+import logging
+import os
+import re
+import signal
+import sys
+from threading import Event
+from threading import Thread
+
+import cfclient
+import cflib.crtp
+from cfclient.utils.blackbox import BlackBoxRecorder
+from cfclient.utils.blackbox import POST_TRIGGER
+from cfclient.utils.blackbox import PRE_TRIGGER
+from cfclient.utils.config import Config
+from cfclient.utils.logconfigreader import log_config_files
+from cfclient.utils.logconfigreader import read_log_config
+from cfclient.utils.logdatawriter import LOG_COMPRESSIONS
+from cfclient.utils.logdatawriter import LOG_FORMAT_CSV
+from cfclient.utils.logdatawriter import LOG_FORMATS
+from cfclient.utils.logdatawriter import LogSessionWriter
+from cfclient.utils.logdatawriter import LogWriter
+from cfclient.utils.logdatawriter import SESSION_EXTENSION
+from cflib.crazyflie import Crazyflie
+
+__author__ = 'Bitcraze AB'
+__all__ = ['Recorder']
+
+logger = logging.getLogger(__name__)
+
+# Black box threshold given on the command line, like stabilizer.roll>30
+_THRESHOLD = re.compile(r"^\s*(\S+?)\s*([<>])\s*(\S+)\s*$")
+
+
+class Recorder():
+    """Records log blocks of a Crazyflie to files"""
+
+    def __init__(self, configs, directory, session=False, blackbox=False,
+                 pre_trigger=PRE_TRIGGER, post_trigger=POST_TRIGGER,
+                 thresholds=(), **writer_args):
+        """Initialize the recorder with the log configurations to record.
+        The files are written to directory, in one session file if session
+        is set, writer_args are passed to the writers.
+
+        With blackbox only the data around triggers is written, see
+        BlackBoxRecorder. thresholds is a list of (variable, above, below)
+        that trigger it."""
+        self._configs = configs
+        self._dir = directory
+        self._session = session
+        self._writer_args = writer_args
+        self._writers = []
+        self._blackbox = None
+        self._blackbox_args = None
+        if blackbox:
+            self._blackbox_args = (pre_trigger, post_trigger, thresholds)
+        self.error = None
+        self.finished = Event()
+
+        cflib.crtp.init_drivers(
+            enable_debug_driver=Config().get("enable_debug_driver"))
+        self._cf = Crazyflie(ro_cache=None,
+                             rw_cache=cfclient.config_path + "/cache")
+        self._cf.connected.add_callback(self._connected)
+        self._cf.connection_failed.add_callback(self._connection_failed)
+        self._cf.connection_lost.add_callback(self._connection_lost)
+
+    def connect(self, link_uri):
+        """Connect to a Crazyflie and start recording once connected"""
+        print("Connecting to {}".format(link_uri))
+        self._cf.open_link(link_uri)
+
+    def _connected(self, link_uri):
+        """Callback for a successful Crazyflie connection."""
+        print("Connected to {}".format(link_uri))
+        added = []
+        for conf in self._configs:
+            try:
+                self._cf.log.add_config(conf)
+            except (KeyError, AttributeError) as e:
+                logger.warning("Could not add log block [%s]: %s",
+                               conf.name, e)
+                continue
+            conf.error_cb.add_callback(self._log_error)
+            added.append(conf)
+        if not added:
+            self._finish("No log blocks could be started")
+            return
+
+        if self._blackbox_args:
+            self._start_blackbox(added, *self._blackbox_args)
+        elif self._session:
+            session = LogSessionWriter(
+                os.path.join(self._dir, "session-{}{}".format(
+                    datetime.datetime.now().strftime("%Y%m%dT%H-%M-%S"),
+                    SESSION_EXTENSION)),
+                fsync_interval=self._writer_args.get("fsync_interval"))
+            session.start()
+            self._writers.append(session)
+            for conf in added:
+                session.add_block(conf)
+        else:
+            for conf in added:
+                writer = LogWriter(conf, directory=self._dir,
+                                   **self._writer_args)
+                writer.start()
+                self._writers.append(writer)
+
+        for conf in added:
+            conf.start()
+            print("Recording {}".format(conf.name))
+
+    def _start_blackbox(self, configs, pre_trigger, post_trigger,
+                        thresholds):
+        blackbox = BlackBoxRecorder(configs, self._dir, pre_trigger,
+                                    post_trigger)
+        for name, above, below in thresholds:
+            for conf in configs:
+                if name in [v.name for v in conf.variables]:
+                    blackbox.add_threshold(conf, name, above, below)
+                    break
+            else:
+                logger.warning("No started log block has [%s]", name)
+        blackbox.start()
+        self._blackbox = blackbox
+
+    def trigger(self, reason="manual"):
+        """Trigger the black box"""
+        if self._blackbox:
+            self._blackbox.trigger(reason)
+
+    def _log_error(self, logconf, msg):
+        logger.warning("Error in log block [%s]: %s", logconf.name, msg)
+
+    def _connection_failed(self, link_uri, message):
+        """Callback for a failed Crazyflie connection"""
+        self._finish("Connection failed on {}: {}".format(link_uri, message))
+
+    def _connection_lost(self, link_uri, message):
+        """Callback for a lost Crazyflie connection"""
+        self.trigger("connection lost")
+        self._finish("Connection lost on {}: {}".format(link_uri, message))
+
+    def _finish(self, error=None):
+        if error and not self.error:
+            self.error = error
+        self.finished.set()
+
+    def stop(self):
+        """Stop the recording, close the files and disconnect"""
+        if self._blackbox:
+            self._blackbox.stop()
+            for path in self._blackbox.captures:
+                print("Black box data written to {}".format(path))
+        for conf in self._configs:
+            if conf.started:
+                try:
+                    conf.stop()
+                except Exception as e:
+                    logger.warning("Could not stop log block [%s]: %s",
+                                   conf.name, e)
+        for writer in self._writers:
+            writer.stop()
+        self._writers = []
+        self._cf.close_link()
+
+
+def _read_configs(args):
+    """Return the log configurations to record"""
+    if args.files:
+        return [read_log_config(f) for f in args.files]
+
+    log_path = args.config_dir or os.path.join(cfclient.config_path, "log")
+    if not os.path.isdir(log_path):
+        # Same defaults as the client copies to the user config
+        log_path = os.path.join(cfclient.module_path, "configs", "log")
+    configs = []
+    for name, path in sorted(log_config_files(log_path)):
+        name = name.replace(".json", "")
+        if args.blocks and name not in args.blocks:
+            continue
+        try:
+            configs.append(read_log_config(path, name))
+        except Exception as e:
+            logger.warning("Could not read log config [%s]: %s", path, e)
+    return configs
+
+
+def _read_triggers(recorder):
+    """Trigger the black box when enter is pressed"""
+    for _ in sys.stdin:
+        recorder.trigger()
+
+
+def main():
+    """Main Crazyflie recorder application"""
+    parser = argparse.ArgumentParser(prog="cfrecord")
+    parser.add_argument("-u", "--uri", action="store", dest="uri", type=str,
+                        default="radio://0/10/250K",
+                        help="URI to use for connection to the Crazyradio"
+                             " dongle, defaults to radio://0/10/250K")
+    parser.add_argument("-b", "--block", action="append", dest="blocks",
+                        help="Name of a log config to record (category/name"
+                             " for configs in a category), can be repeated."
+                             " All configs are recorded by default")
+    parser.add_argument("-f", "--file", action="append", dest="files",
+                        help="Log config file to record instead of the"
+                             " configs in the config directory, can be"
+                             " repeated")
+    parser.add_argument("--config-dir", dest="config_dir",
+                        help="Directory with log configs, defaults to the"
+                             " one of the client")
+    parser.add_argument("--list", action="store_true", dest="list_configs",
+                        help="Only list the log configs and exit")
+    parser.add_argument("-o", "--output", dest="output",
+                        help="Directory to write to, defaults to a new"
+                             " directory in the logdata directory of the"
+                             " client")
+    parser.add_argument("-t", "--time", type=float, dest="time",
+                        help="Seconds to record, until stopped by default")
+    parser.add_argument("--format", choices=LOG_FORMATS,
+                        help="File format, defaults to csv")
+    parser.add_argument("--compression", choices=LOG_COMPRESSIONS,
+                        help="Compress the files")
+    parser.add_argument("--level", type=int, dest="compression_level",
+                        help="Compression level")
+    parser.add_argument("--session", action="store_true",
+                        help="Write all blocks to one session file")
+    parser.add_argument("--fsync", type=float, dest="fsync_interval",
+                        help="Max seconds before written data is synced to"
+                             " disk")
+    parser.add_argument("--segment-size", type=int, dest="segment_size",
+                        help="Start a new CSV file every this many bytes")
+    parser.add_argument("--segment-time", type=float, dest="segment_time",
+                        help="Start a new CSV file every this many seconds")
+    parser.add_argument("--blackbox", action="store_true",
+                        help="Only write the data around triggers: a"
+                             " threshold, pressing enter, SIGUSR1 or a lost"
+                             " connection")
+    parser.add_argument("--pre", type=float, default=PRE_TRIGGER,
+                        dest="pre_trigger",
+                        help="Seconds of black box data before a trigger,"
+                             " defaults to {}".format(PRE_TRIGGER))
+    parser.add_argument("--post", type=float, default=POST_TRIGGER,
+                        dest="post_trigger",
+                        help="Seconds of black box data after a trigger,"
+                             " defaults to {}".format(POST_TRIGGER))
+    parser.add_argument("--trigger", action="append", dest="thresholds",
+                        default=[],
+                        help="Black box threshold like 'stabilizer.roll>30'"
+                             ", can be repeated")
+    parser.add_argument("-d", "--debug", action="store_true", dest="debug",
+                        help="Enable debug output")
+    args = parser.parse_args()
+
+    if args.session:
+        # The session file has a format of its own
+        ignored = [flag for (flag, value) in (
+            ("--format", args.format),
+            ("--compression", args.compression),
+            ("--level", args.compression_level),
+            ("--segment-size", args.segment_size),
+            ("--segment-time", args.segment_time)) if value is not None]
+        if ignored:
+            parser.error("{} can't be used with --session".format(
+                ", ".join(ignored)))
+
+    thresholds = []
+    for threshold in args.thresholds:
+        match = _THRESHOLD.match(threshold)
+        try:
+            value = float(match.group(3)) if match else None
+        except ValueError:
+            value = None
+        if value is None:
+            parser.error("Bad trigger [{}]".format(threshold))
+        if match.group(2) == ">":
+            thresholds.append((match.group(1), value, None))
+        else:
+            thresholds.append((match.group(1), None, value))
+
+    if args.debug:
+        logging.basicConfig(level=logging.DEBUG)
+    else:
+        logging.basicConfig(level=logging.INFO)
+
+    configs = _read_configs(args)
+    if args.list_configs:
+        for conf in configs:
+            print("{} ({} ms): {}".format(
+                conf.name, conf.period_in_ms,
+                ", ".join(v.name for v in conf.variables)))
+        return
+    if not configs:
+        print("No log configs to record, exiting!")
+        sys.exit(-1)
+
+    directory = args.output or os.path.join(
+        cfclient.config_path, "logdata",
+        datetime.datetime.now().strftime("%Y%m%dT%H-%M-%S"))
+    os.makedirs(directory, exist_ok=True)
+    recorder = Recorder(configs, directory, args.session,
+                        blackbox=args.blackbox,
+                        pre_trigger=args.pre_trigger,
+                        post_trigger=args.post_trigger,
+                        thresholds=thresholds,
+                        file_format=args.format or LOG_FORMAT_CSV,
+                        compression=args.compression,
+                        compression_level=args.compression_level,
+                        fsync_interval=args.fsync_interval,
+                        segment_size=args.segment_size,
+                        segment_time=args.segment_time)
+
+    signal.signal(signal.SIGINT, lambda signum, frame: recorder._finish())
+    signal.signal(signal.SIGTERM, lambda signum, frame: recorder._finish())
+    if args.blackbox:
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1,
+                          lambda signum, frame: recorder.trigger())
+        if sys.stdin.isatty():
+            print("Press enter to trigger the black box")
+            Thread(target=_read_triggers, args=(recorder,),
+                   daemon=True).start()
+    recorder.connect(args.uri)
+    recorder.finished.wait(args.time)
+    recorder.stop()
+    if recorder.error:
+        print(recorder.error)
+        sys.exit(-1)
+    print("Recorded to {}".format(directory))
+
+
+if __name__ == "__main__":
+    main()
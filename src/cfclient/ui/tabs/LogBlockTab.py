@@ -37,13 +37,18 @@ from PyQt5.QtCore import Qt, pyqtSignal
 import cfclient
 from cfclient.ui.tab import Tab
 
+import datetime
 import logging
+import os
 
 from PyQt5.QtWidgets import QApplication, QStyledItemDelegate
 from PyQt5.QtWidgets import QAbstractItemView, QStyleOptionButton, QStyle
 from PyQt5.QtCore import QAbstractItemModel, QModelIndex
 
+from cfclient.utils.config import Config
+from cfclient.utils.logdatawriter import LogSessionWriter
 from cfclient.utils.logdatawriter import LogWriter
+from cfclient.utils.logdatawriter import SESSION_EXTENSION
 
 __author__ = 'Bitcraze AB'
 __all__ = ['LogBlockTab']
@@ -68,12 +73,38 @@ class LogBlockChildItem(object):
         return 0
 
 
+class SessionBlockWriter(object):
+    """Writes a log block to the session file shared by all blocks of the
+    connection, the file is created when the first block is written"""
+
+    def __init__(self, session, block):
+        self._session = session
+        self._block = block
+        self._writing = False
+
+    def writing(self):
+        """Return True if the block is written to the session file"""
+        return self._writing
+
+    def start(self):
+        """Start writing the block to the session file"""
+        self._session.start()
+        self._session.add_block(self._block)
+        self._writing = True
+
+    def stop(self):
+        """Stop writing the block to the session file"""
+        self._session.remove_block(self._block)
+        self._writing = False
+
+
 class LogBlockItem(object):
     """Class that acts as a parent in the tree view and represents a complete
     log block"""
 
-    def __init__(self, block, model, connected_ts):
-        """Initialize the parent node"""
+    def __init__(self, block, model, connected_ts, session=None):
+        """Initialize the parent node, the block is written to the session
+        file if session is given"""
         super(LogBlockItem, self).__init__()
         self._block = block
         self.parent = None
@@ -82,7 +113,10 @@ class LogBlockItem(object):
         self.id = block.id
         self.period = block.period_in_ms
         self._model = model
-        self._log_file_writer = LogWriter(block, connected_ts)
+        if session:
+            self._log_file_writer = SessionBlockWriter(session, block)
+        else:
+            self._log_file_writer = self._file_writer(block, connected_ts)
 
         self._block.started_cb.add_callback(self._set_started)
         self._block.added_cb.add_callback(self._set_added)
@@ -98,6 +132,18 @@ class LogBlockItem(object):
         self._block_started = False
         self._doing_transaction = False
 
+    @staticmethod
+    def _file_writer(block, connected_ts):
+        """Return the writer of the block to its own file"""
+        try:
+            return LogWriter(
+                block, connected_ts,
+                file_format=Config().get("log_file_format"),
+                compression=Config().get("log_compression"))
+        except Exception as e:
+            logger.warning("Logging to CSV instead: %s", e)
+            return LogWriter(block, connected_ts)
+
     def _log_error(self, logconfig, msg):
         """
         Callback when there's an error starting the block in the Crazyflie
@@ -172,12 +218,30 @@ class LogBlockModel(QAbstractItemModel):
                                 'Write to file', 'Contents']
         self._view = view
         self._nodes_written_to_file = []
+        self._session = None
 
     def add_block(self, block, connected_ts):
-        self._nodes.append(LogBlockItem(block, self, connected_ts))
+        if self._session is None and Config().get("log_session"):
+            self._session = LogSessionWriter(
+                self._session_filename(connected_ts))
+        self._nodes.append(LogBlockItem(block, self, connected_ts,
+                                        self._session))
         self.layoutChanged.emit()
         self._nodes.sort(key=lambda conf: conf.name.lower())
 
+    @staticmethod
+    def _session_filename(connected_ts):
+        """Return the name of the session file of a connection, in the same
+        directory as the files of the blocks"""
+        if connected_ts is None:
+            connected_ts = datetime.datetime.now()
+        return os.path.join(
+            cfclient.config_path, "logdata",
+            connected_ts.strftime("%Y%m%dT%H-%M-%S"),
+            "session-{}{}".format(
+                datetime.datetime.now().strftime("%Y%m%dT%H-%M-%S"),
+                SESSION_EXTENSION))
+
     def refresh(self):
         """Force a refresh of the view though the model"""
         self.layoutChanged.emit()
@@ -274,6 +338,9 @@ class LogBlockModel(QAbstractItemModel):
         for node in self._nodes:
             if node.writing_to_file():
                 node.stop_writing_to_file()
+        if self._session:
+            self._session.stop()
+            self._session = None
         self._nodes = []
         self.layoutChanged.emit()
 
@@ -29,14 +29,23 @@ pre-configured.
 """
 
 import logging
+import os
+import time
 
 from cfclient.ui.tab import Tab
 from cfclient.ui.widgets.plotwidget import PlotWidget
+from cfclient.utils.config import Config
+from cfclient.utils.logdatawriter import TIMESTAMP_COLUMN
+from cfclient.utils.logplayback import LogPlayback
+from cfclient.utils.logplayback import SPEEDS
 from PyQt5 import uic
 from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtCore import QAbstractItemModel
 from PyQt5.QtCore import QModelIndex
 from PyQt5.QtCore import Qt
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QAbstractSlider
+from PyQt5.QtWidgets import QFileDialog
 from PyQt5.QtWidgets import QMessageBox
 
 import cfclient
@@ -49,13 +58,20 @@ logger = logging.getLogger(__name__)
 plot_tab_class = uic.loadUiType(cfclient.module_path +
                                 "/ui/tabs/plotTab.ui")[0]
 
+# Interval of the playback timer in ms
+PLAYBACK_INTERVAL = 33
+# Data shown before the position when a log is opened or seeked, in ms
+PLAYBACK_HISTORY = 10000
+
 
 class LogConfigModel(QAbstractItemModel):
-    """Model for log configurations in the ComboBox"""
+    """Model for checkable log configurations in the list"""
 
     def __init__(self, parent=None):
         super(LogConfigModel, self).__init__(parent)
         self._nodes = []
+        # Checked configurations in the order they were checked
+        self._checked = []
 
     def add_block(self, block):
         self._nodes.append(block)
@@ -69,6 +85,8 @@ class LogConfigModel(QAbstractItemModel):
     def remove_block(self, block):
         """Remove a block from the view"""
         self._nodes.remove(block)
+        if block in self._checked:
+            self._checked.remove(block)
 
     def columnCount(self, parent):
         """Re-implemented method to get the number of columns"""
@@ -102,16 +120,47 @@ class LogConfigModel(QAbstractItemModel):
             return None
         if role == Qt.DisplayRole:
             return self._nodes[index.row()].name
+        if role == Qt.CheckStateRole:
+            if self._nodes[index.row()] in self._checked:
+                return Qt.Checked
+            return Qt.Unchecked
         return None
 
+    def setData(self, index, value, role):
+        """Re-implemented method to check or uncheck a configuration"""
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        node = self._nodes[index.row()]
+        if value == Qt.Checked and node not in self._checked:
+            self._checked.append(node)
+        elif value != Qt.Checked and node in self._checked:
+            self._checked.remove(node)
+        self.dataChanged.emit(index, index)
+        return True
+
+    def flags(self, index):
+        """Re-implemented method to make the configurations checkable"""
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
     def reset(self):
         """Reset the model"""
         self._nodes = []
+        self._checked = []
         self.layoutChanged.emit()
 
     def get_config(self, i):
         return self._nodes[i]
 
+    def uncheck_all(self):
+        """Uncheck all configurations"""
+        self._checked = []
+        self.layoutChanged.emit()
+
+    def get_checked(self):
+        """Return the checked configurations in the order they were
+        checked"""
+        return list(self._checked)
+
 
 class PlotTab(Tab, plot_tab_class):
     """Tab for plotting logging data"""
@@ -142,7 +191,10 @@ class PlotTab(Tab, plot_tab_class):
 
         self._log_error_signal.connect(self._logging_error)
 
-        self._plot = PlotWidget(fps=30)
+        self._plot = PlotWidget(
+            fps=30, history=Config().get("plot_history"),
+            spill_dir=Config().get("plot_spill_dir") or None,
+            decimation=Config().get("plot_decimation") or None)
         # Check if we could find the PyQtImport. If not, then
         # set this tab as disabled
         self.enabled = self._plot.can_enable
@@ -165,25 +217,47 @@ class PlotTab(Tab, plot_tab_class):
                 self._connected_signal.emit)
 
             self.helper.cf.log.block_added_cb.add_callback(self._config_added)
-            self.dataSelector.currentIndexChanged.connect(
-                self._selection_changed)
-
-        self._previous_config = None
-        self._started_previous = False
+            self._model.dataChanged.connect(self._selection_changed)
+            self.subplotsCheckBox.stateChanged.connect(self._subplots_changed)
+
+            self.openLogButton.clicked.connect(self._open_log_clicked)
+            self.playButton.clicked.connect(self._play_clicked)
+            self.speedSelector.currentIndexChanged.connect(
+                self._speed_changed)
+            self.positionSlider.sliderReleased.connect(self._slider_released)
+            self.positionSlider.actionTriggered.connect(self._slider_action)
+        else:
+            self.openLogButton.setEnabled(False)
+
+        for speed in SPEEDS:
+            self.speedSelector.addItem("{}x".format(speed))
+        self.positionSlider.setPageStep(PLAYBACK_HISTORY)
+        self._playback = None
+        self._playback_timer = QTimer(self)
+        self._playback_timer.timeout.connect(self._play)
+        self._played = None
+
+        # Plotted configurations by name and the names of the ones that
+        # were started by the tab
+        self._configs = {}
+        self._started = set()
+        self._color_selector = 0
 
     def _connected(self, link_uri):
         """Callback when the Crazyflie has been connected"""
+        if self._playback:
+            return
         self._plot.removeAllDatasets()
         self._plot.set_title("")
+        self._color_selector = 0
 
     def _disconnected(self, link_uri):
         """Callback for when the Crazyflie has been disconnected"""
         self._model.beginResetModel()
         self._model.reset()
         self._model.endResetModel()
-        self.dataSelector.setCurrentIndex(-1)
-        self._previous_config = None
-        self._started_previous = False
+        self._configs = {}
+        self._started = set()
 
     def _log_data_signal_wrapper(self, ts, data, logconf):
         """Wrapper for signal"""
@@ -201,45 +275,186 @@ class PlotTab(Tab, plot_tab_class):
         # removed as callbacks.
         self._log_error_signal.emit(config, msg)
 
-    def _selection_changed(self, i):
-        """Callback from ComboBox when a new item has been selected"""
-
-        # Check if we have disconnected
-        if i < 0:
-            return
-        # First check if we need to stop the old block
-        if self._started_previous and self._previous_config:
-            logger.debug("Should stop config [%s], stopping!",
-                         self._previous_config.name)
-            self._previous_config.delete()
-
-        # Remove our callback for the previous config
-        if self._previous_config:
-            self._previous_config.data_received_cb.remove_callback(
-                self._log_data_signal_wrapper)
-            self._previous_config.error_cb.remove_callback(
-                self._log_error_signal_wrapper)
-
-        lg = self._model.get_config(i)
+    def _selection_changed(self, *args):
+        """Callback from the model when log configurations are checked or
+        unchecked, only the curves of the changed configurations are added
+        or removed"""
+        checked = self._model.get_checked()
+        for lg in list(self._configs.values()):
+            if lg not in checked:
+                self._stop_plotting(lg)
+        for lg in checked:
+            if lg.name not in self._configs:
+                self._start_plotting(lg)
+        self._plot.set_title(", ".join(lg.name for lg in checked))
+
+    def _start_plotting(self, lg):
+        """Start the config if needed and plot its variables"""
         if not lg.started:
             logger.debug("Config [%s] not started, starting!", lg.name)
-            self._started_previous = True
+            self._started.add(lg.name)
             lg.start()
-        else:
-            self._started_previous = False
+        self._add_curves(lg.name, [d.name for d in lg.variables])
+        lg.data_received_cb.add_callback(self._log_data_signal_wrapper)
+        lg.error_cb.add_callback(self._log_error_signal_wrapper)
+        self._configs[lg.name] = lg
+
+    def _stop_plotting(self, lg):
+        """Remove the curves of the config and stop it if it was started
+        by the tab"""
+        if lg.name in self._started:
+            logger.debug("Should stop config [%s], stopping!", lg.name)
+            self._started.remove(lg.name)
+            lg.delete()
+
+        # Remove our callback for the config
+        lg.data_received_cb.remove_callback(self._log_data_signal_wrapper)
+        lg.error_cb.remove_callback(self._log_error_signal_wrapper)
+        self._plot.remove_source(lg.name)
+        del self._configs[lg.name]
+
+    def _add_curves(self, source, names):
+        """Add a curve for each variable of a config or played back log, in
+        a subplot of its own if one plot per config is checked"""
+        axis = None
+        if self.subplotsCheckBox.isChecked():
+            axis = source
+        for name in names:
+            self._plot.add_curve(name, self.colors[
+                self._color_selector % len(self.colors)], source, axis)
+            self._color_selector += 1
+
+    def _add_playback_curves(self):
+        for block in self._playback.blocks:
+            self._add_curves(block, [
+                name for name in self._playback.reader.columns(block)
+                if name != TIMESTAMP_COLUMN])
+
+    def _subplots_changed(self, state):
+        """Callback from the checkbox when configs are moved to subplots
+        of their own or back to the main plot"""
         self._plot.removeAllDatasets()
-        color_selector = 0
+        self._color_selector = 0
+        for lg in self._configs.values():
+            self._add_curves(lg.name, [d.name for d in lg.variables])
+        if self._playback:
+            self._add_playback_curves()
+            self._seek(self._playback.position)
+
+    def _open_log_clicked(self):
+        """Callback from the open button, opens a recorded session directory
+        for playback or closes the one that is played back"""
+        if self._playback:
+            self._close_log()
+            return
+        directory = QFileDialog.getExistingDirectory(
+            self, "Open log session",
+            os.path.join(cfclient.config_path, "logdata"))
+        if not directory:
+            return
+        try:
+            playback = LogPlayback(directory)
+        except Exception as e:
+            QMessageBox.about(
+                self, "Playback error", "Could not open log [%s]: %s" % (
+                    directory, e))
+            return
 
-        self._plot.set_title(lg.name)
+        # Live data is not plotted during the playback
+        for lg in list(self._configs.values()):
+            self._stop_plotting(lg)
+        self._model.uncheck_all()
+        self.dataSelector.setEnabled(False)
 
-        for d in lg.variables:
-            self._plot.add_curve(d.name, self.colors[
-                color_selector % len(self.colors)])
-            color_selector += 1
-        lg.data_received_cb.add_callback(self._log_data_signal_wrapper)
-        lg.error_cb.add_callback(self._log_error_signal_wrapper)
+        self._playback = playback
+        self._plot.removeAllDatasets()
+        self._color_selector = 0
+        self._add_playback_curves()
+        self._plot.set_title(os.path.basename(directory))
+
+        self.openLogButton.setText("Close log")
+        self.positionSlider.setRange(0, playback.end - playback.start)
+        for widget in (self.playButton, self.speedSelector,
+                       self.positionSlider):
+            widget.setEnabled(True)
+        self._speed_changed(self.speedSelector.currentIndex())
+        self._seek(playback.start)
+
+    def _close_log(self):
+        """Stop the playback and go back to plotting live data"""
+        self._pause()
+        self._playback.close()
+        self._playback = None
+        self._plot.removeAllDatasets()
+        self._plot.set_title("")
 
-        self._previous_config = lg
+        self.openLogButton.setText("Open log...")
+        self.positionLabel.setText("")
+        for widget in (self.playButton, self.speedSelector,
+                       self.positionSlider):
+            widget.setEnabled(False)
+        self.dataSelector.setEnabled(True)
+
+    def _play_clicked(self):
+        """Callback from the play button, plays or pauses the playback"""
+        if self._playback.playing:
+            self._pause()
+            return
+        if self._playback.position >= self._playback.end:
+            self._seek(self._playback.start)
+        self._playback.play()
+        self._played = time.monotonic()
+        self._playback_timer.start(PLAYBACK_INTERVAL)
+        self.playButton.setText("Pause")
+
+    def _pause(self):
+        self._playback.pause()
+        self._playback_timer.stop()
+        self.playButton.setText("Play")
+
+    def _play(self):
+        """Called by the playback timer, adds the rows played since the
+        last call to the plot"""
+        now = time.monotonic()
+        self._add_rows(self._playback.advance(now - self._played))
+        self._played = now
+        self._show_position()
+        if not self._playback.playing:
+            self._pause()
+
+    def _speed_changed(self, i):
+        if self._playback and i >= 0:
+            self._playback.set_speed(SPEEDS[i])
+
+    def _slider_released(self):
+        self._seek(self._playback.start + self.positionSlider.value())
+
+    def _slider_action(self, action):
+        """Callback from the slider when it's moved by clicking or keys,
+        seeks when the slider is released if it's dragged"""
+        if action != QAbstractSlider.SliderMove:
+            self._seek(self._playback.start +
+                       self.positionSlider.sliderPosition())
+
+    def _seek(self, ts):
+        """Move the playback to ts and show the data before it"""
+        self._playback.seek(ts)
+        self._plot.clear_data()
+        self._add_rows(self._playback.history(PLAYBACK_HISTORY))
+        self._show_position()
+
+    def _add_rows(self, rows):
+        for block, columns in rows.items():
+            self._plot.add_columns(columns, columns[TIMESTAMP_COLUMN], block)
+
+    def _show_position(self):
+        """Show the position of the playback on the slider and label"""
+        position = self._playback.position - self._playback.start
+        if not self.positionSlider.isSliderDown():
+            self.positionSlider.setValue(position)
+        self.positionLabel.setText("{:.1f} / {:.1f} s".format(
+            position / 1000.0,
+            (self._playback.end - self._playback.start) / 1000.0))
 
     def _config_added(self, logconfig):
         """Callback from the log layer when a new config has been added"""
@@ -248,6 +463,10 @@ class PlotTab(Tab, plot_tab_class):
 
     def remove_config(self, logconfig):
         self._model.remove_block(logconfig)
+        if logconfig.name in self._configs:
+            # The config is deleted by the caller
+            self._started.discard(logconfig.name)
+            self._stop_plotting(self._configs[logconfig.name])
 
     def _logging_error(self, log_conf, msg):
         """Callback from the log layer when an error occurs"""
@@ -260,6 +479,5 @@ class PlotTab(Tab, plot_tab_class):
 
         # Check so that the incoming data belongs to what we are currently
         # logging
-        if self._previous_config:
-            if self._previous_config.name == logconf.name:
-                self._plot.add_data(data, timestamp)
+        if logconf.name in self._configs:
+            self._plot.add_data(data, timestamp, logconf.name)
@@ -37,19 +37,26 @@ from PyQt5 import QtWidgets, uic
 from time import time
 
 import logging
+import os
 
 from PyQt5.QtWidgets import QButtonGroup
+from PyQt5.QtCore import QTimer
 from PyQt5.QtCore import *  # noqa
 from PyQt5.QtWidgets import *  # noqa
 from PyQt5.Qt import *  # noqa
 
 import cfclient
+from cfclient.utils.decimation import DECIMATIONS
+from cfclient.utils.decimation import Decimator
 
 __author__ = 'Bitcraze AB'
 __all__ = ['PlotWidget']
 
 logger = logging.getLogger(__name__)
 
+# Number of samples kept for each curve
+PLOT_HISTORY = 100000
+
 (plot_widget_class, connect_widget_base_class) = (
     uic.loadUiType(cfclient.module_path + '/ui/widgets/plotter.ui'))
 
@@ -82,11 +89,30 @@ except Exception:
 class PlotItemWrapper:
     """Wrapper for PlotDataItem to handle what data is shown"""
 
-    def __init__(self, curve):
-        """Initialize"""
-        self.data = []
-        self.ts = []
+    def __init__(self, curve, history=PLOT_HISTORY, spill=None,
+                 decimation=None):
+        """
+        Initialize
+
+        curve - the PlotDataItem
+        history - number of points kept, older points are dropped
+        spill - file that older points are appended to (timestamp and value
+                as float64 pairs) instead of dropping them
+        decimation - name of the decimation (see DECIMATIONS) used when
+                     there are more points than pixels, None to show all
+        """
         self.curve = curve
+        self._size = history
+        # Every point is stored twice, history points apart, so the last
+        # history points can always be handed to the curve as one view
+        self._data = np.zeros(2 * history)
+        self._ts = np.zeros(2 * history)
+        self.count = 0
+        self._spill = spill
+        self._spill_file = None
+        self._decimator = None
+        if decimation in DECIMATIONS:
+            self._decimator = Decimator(decimation)
 
     def add_point(self, p, ts):
         """
@@ -95,29 +121,143 @@ class PlotItemWrapper:
         p - point
         ts - timestamp in ms
         """
-        self.data.append(p)
-        self.ts.append(ts)
+        i = self.count % self._size
+        if i == 0 and self.count and self._spill:
+            self._spill_points()
+        self._data[i] = self._data[i + self._size] = p
+        self._ts[i] = self._ts[i + self._size] = ts
+        self.count += 1
+
+    def add_points(self, points, ts):
+        """
+        Add arrays of points to the curve.
+
+        points - the points
+        ts - timestamps of the points in ms
+        """
+        done = 0
+        while done < len(points):
+            i = self.count % self._size
+            if i == 0 and self.count and self._spill:
+                self._spill_points()
+            n = min(len(points) - done, self._size - i)
+            self._data[i:i + n] = points[done:done + n]
+            self._data[i + self._size:i + self._size + n] = \
+                points[done:done + n]
+            self._ts[i:i + n] = ts[done:done + n]
+            self._ts[i + self._size:i + self._size + n] = ts[done:done + n]
+            self.count += n
+            done += n
+
+    def clear(self):
+        """Remove all points from the curve"""
+        self.count = 0
+        if self._decimator:
+            self._decimator.clear()
+        self.curve.setData(y=np.zeros(0), x=np.zeros(0))
+
+    def _spill_points(self):
+        """Write the points of the previous lap of the ring to the spill
+        file, they are overwritten from now on"""
+        try:
+            if not self._spill_file:
+                self._spill_file = open(self._spill, "ab")
+            np.column_stack((self._ts[:self._size],
+                             self._data[:self._size])).tofile(
+                self._spill_file)
+        except IOError as e:
+            logger.warning("Could not spill plot data to [%s]: %s",
+                           self._spill, e)
+            self._spill = None
+
+    def _window(self, start, stop):
+        """Limit start and stop to the points that are kept"""
+        stop = min(stop, self.count)
+        return min(max(start, self.count - self._size, 0), stop), stop
+
+    def points(self, start, stop):
+        """
+        Return views of the timestamps and values of the points from start
+        to stop (not included), counted from the first point added. Points
+        that are no longer kept are left out.
+        """
+        start, stop = self._window(start, stop)
+        i = start % self._size
+        n = stop - start
+        return self._ts[i:i + n], self._data[i:i + n]
+
+    def find(self, ts):
+        """
+        Return the number of the first kept point with a timestamp at or
+        after ts, counted from the first point added.
+        """
+        kept_ts, _ = self.points(0, self.count)
+        return self.count - len(kept_ts) + int(np.searchsorted(kept_ts, ts))
 
-    def show_data(self, start, stop):
+    def last_ts(self):
+        """Return the timestamp of the last point added"""
+        return self._ts[(self.count - 1) % self._size]
+
+    def decimated(self, start, stop, pixels):
+        """
+        Return the timestamps and values of the points from start to stop
+        reduced to about pixels buckets.
+        """
+        start, stop = self._window(start, stop)
+        if self._decimator:
+            decimated = self._decimator.decimate(
+                self.points, start, stop, pixels,
+                self._window(0, self.count)[0], self.count)
+            if decimated is not None:
+                return decimated
+        return self.points(start, stop)
+
+    def spilled(self):
+        """Return the timestamps and values written to the spill file"""
+        if not self._spill or not os.path.exists(self._spill):
+            return np.zeros(0), np.zeros(0)
+        if self._spill_file:
+            self._spill_file.flush()
+        points = np.fromfile(self._spill, dtype=np.float64).reshape(-1, 2)
+        return points[:, 0], points[:, 1]
+
+    def close(self):
+        """Close the spill file"""
+        if self._spill_file:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def show_data(self, start, stop, pixels=None):
         """
         Set what data should be shown from the curve. This is done to keep
-        performance when many points have been added.
+        performance when many points have been added. If the width of the
+        plot in pixels is given the data is decimated to about that many
+        points.
         """
-        limit = min(stop, len(self.data))
-        self.curve.setData(y=self.data[start:limit], x=self.ts[start:limit])
-        return [self.ts[start], self.ts[limit - 1]]
+        if pixels:
+            ts, data = self.decimated(start, stop, pixels)
+        else:
+            ts, data = self.points(start, stop)
+        self.curve.setData(y=data, x=ts)
+        if len(ts) == 0:
+            return None
+        return [ts[0], ts[-1]]
 
 
 class PlotWidget(QtWidgets.QWidget, plot_widget_class):
     """Wrapper widget for PyQtGraph adding some extra buttons"""
 
-    def __init__(self, parent=None, fps=100, title="", *args):
+    def __init__(self, parent=None, fps=100, title="", *args,
+                 history=PLOT_HISTORY, spill_dir=None, decimation=None):
         super(PlotWidget, self).__init__(*args)
         self.setupUi(self)
 
-        # Limit the plot update to 10Hz
-        self._ts = time()
-        self._delay = 0.1
+        # Points kept per curve, older points are written to files in
+        # spill_dir if it's set
+        self._history = history
+        self._spill_dir = spill_dir
+        # Curves with more points than pixels shown are decimated
+        self._decimation = decimation
 
         # Check if we could import PyQtGraph, if not then stop here
         if not _pyqtgraph_found:
@@ -126,8 +266,13 @@ class PlotWidget(QtWidgets.QWidget, plot_widget_class):
         else:
             self.can_enable = True
 
+        # Curves by source and title, a source is typically a log block
         self._items = {}
-        self._last_item = 0
+        # Axis the curves are shown on, None for the main plot
+        self._axes = {}
+        # Subplots by axis, stacked below the main plot with linked X-axis
+        self._plots = {}
+        self._next_row = 1
 
         self.setSizePolicy(QtWidgets.QSizePolicy(
             QtWidgets.QSizePolicy.MinimumExpanding,
@@ -138,15 +283,9 @@ class PlotWidget(QtWidgets.QWidget, plot_widget_class):
 
         pg.setConfigOption('background', 'w')
         pg.setConfigOption('foreground', 'k')
-        self._plot_widget = pg.PlotWidget()
-        self._plot_widget.hideButtons()
-        self._plot_widget.setLabel('bottom', "Time", "ms")
-        self._plot_widget.addLegend()
-        self._plot_widget.getViewBox().disableAutoRange(ViewBox.XAxis)
-        self._plot_widget.getViewBox().sigRangeChangedManually.connect(
-            self._manual_range_change)
-        self._plot_widget.getViewBox().setMouseEnabled(x=False, y=True)
-        self._plot_widget.getViewBox().setMouseMode(ViewBox.PanMode)
+        self._plot_widget = pg.GraphicsLayoutWidget()
+        self._plot = self._add_plot(0)
+        self._plot.setLabel('bottom', "Time", "ms")
 
         self.plotLayout.addWidget(self._plot_widget)
 
@@ -155,8 +294,9 @@ class PlotWidget(QtWidgets.QWidget, plot_widget_class):
         self._x_max = 500
         self._enable_auto_y.setChecked(True)
         self._enable_samples_x.setChecked(True)
-        self._last_ts = None
-        self._dtime = None
+        # First timestamp and time between the first samples by source
+        self._last_ts = {}
+        self._dtime = {}
 
         self._x_range = (
             float(self._range_x_min.text()), float(self._range_x_max.text()))
@@ -182,12 +322,51 @@ class PlotWidget(QtWidgets.QWidget, plot_widget_class):
         self._draw_graph = True
         self._auto_redraw.stateChanged.connect(self._auto_redraw_change)
 
+        # New data is only added to the curves, they are redrawn at fps
+        self._new_data = False
+        self._redraw_timer = QTimer(self)
+        self._redraw_timer.timeout.connect(self._redraw)
+        self._redraw_timer.start(int(1000 / fps))
+
+    def _add_plot(self, row):
+        """Add a plot at row of the layout, the X-axis is set by the widget
+        and the Y-axis can be panned with the mouse"""
+        plot = self._plot_widget.addPlot(row=row, col=0)
+        plot.hideButtons()
+        plot.addLegend()
+        view_box = plot.getViewBox()
+        view_box.disableAutoRange(ViewBox.XAxis)
+        view_box.sigRangeChangedManually.connect(
+            lambda mask: self._manual_range_change(view_box))
+        view_box.setMouseEnabled(x=False, y=True)
+        view_box.setMouseMode(ViewBox.PanMode)
+        return plot
+
+    def _plot_for(self, axis):
+        """Return the plot for axis, a subplot is added for a new axis"""
+        if axis is None:
+            return self._plot
+        if axis not in self._plots:
+            plot = self._add_plot(self._next_row)
+            plot.setXLink(self._plot)
+            self._next_row += 1
+            self._plots[axis] = plot
+            if self._enable_range_y.isChecked():
+                self._y_range_changed(None)
+        return self._plots[axis]
+
+    def _view_boxes(self):
+        """Return the view boxes of the main plot and all subplots"""
+        return [self._plot.getViewBox()] + [
+            plot.getViewBox() for plot in self._plots.values()]
+
     def _auto_redraw_change(self, state):
         """Callback from the auto redraw checkbox"""
         if state == 0:
             self._draw_graph = False
         else:
             self._draw_graph = True
+            self._new_data = True
 
     def _y_mode_change(self, box):
         """Callback when user changes the Y-axis mode"""
@@ -197,21 +376,23 @@ class PlotWidget(QtWidgets.QWidget, plot_widget_class):
             y_range = (
                 float(self._range_y_min.value()),
                 float(self._range_y_max.value()))
-            self._plot_widget.getViewBox().setRange(yRange=y_range)
+            for view_box in self._view_boxes():
+                view_box.setRange(yRange=y_range)
         else:
             self._range_y_min.setEnabled(False)
             self._range_y_max.setEnabled(False)
 
         if box == self._enable_auto_y:
-            self._plot_widget.getViewBox().enableAutoRange(ViewBox.YAxis)
+            for view_box in self._view_boxes():
+                view_box.enableAutoRange(ViewBox.YAxis)
 
-    def _manual_range_change(self, obj):
+    def _manual_range_change(self, view_box):
         """
-        Callback from pyqtplot when users changes the range of the plot using
+        Callback from pyqtplot when users changes the range of a plot using
         the mouse
         """
         [[x_min, x_max],
-         [y_min, y_max]] = self._plot_widget.getViewBox().viewRange()
+         [y_min, y_max]] = view_box.viewRange()
         self._range_y_min.setValue(y_min)
         self._range_y_max.setValue(y_max)
         self._range_y_min.setEnabled(True)
@@ -223,7 +404,8 @@ class PlotWidget(QtWidgets.QWidget, plot_widget_class):
         _y_range = (
             float(self._range_y_min.value()),
             float(self._range_y_max.value()))
-        self._plot_widget.getViewBox().setRange(yRange=_y_range, padding=0)
+        for view_box in self._view_boxes():
+            view_box.setRange(yRange=_y_range, padding=0)
 
     def _nbr_samples_changed(self, val):
         """Callback when user changes the number of samples to be shown"""
@@ -235,69 +417,148 @@ class PlotWidget(QtWidgets.QWidget, plot_widget_class):
 
         title - the new title
         """
-        self._plot_widget.setTitle(title)
+        self._plot.setTitle(title)
 
-    def add_curve(self, title, pen='r'):
+    def add_curve(self, title, pen='r', source=None, axis=None):
         """
         Add a new curve to the plot.
 
         title - the name of the data
         pen - color of curve (using r for red and so on..)
+        source - the source the data is added from, curves from different
+                 sources are shown on the same time axis
+        axis - the subplot the curve is shown in, None for the main plot
         """
-        self._items[title] = PlotItemWrapper(
-            self._plot_widget.plot(name=title, pen=pen))
+        spill = None
+        if self._spill_dir:
+            os.makedirs(self._spill_dir, exist_ok=True)
+            spill = os.path.join(self._spill_dir, "{}-{}.f8".format(
+                title if source is None else "{}-{}".format(source, title),
+                int(time())))
+        self._items[(source, title)] = PlotItemWrapper(
+            self._plot_for(axis).plot(name=title, pen=pen), self._history,
+            spill, self._decimation)
+        self._axes[(source, title)] = axis
+
+    def remove_source(self, source):
+        """
+        Remove the curves added for a source, subplots that are left
+        without curves are removed.
 
-    def add_data(self, data, ts):
+        source - the source given when adding the curves
+        """
+        for key in [key for key in self._items if key[0] == source]:
+            item = self._items.pop(key)
+            item.close()
+            self._plot_for(self._axes.pop(key)).removeItem(item.curve)
+        for axis in set(self._plots) - set(self._axes.values()):
+            self._plot_widget.removeItem(self._plots.pop(axis))
+        self._last_ts.pop(source, None)
+        self._dtime.pop(source, None)
+        self._new_data = True
+
+    def add_data(self, data, ts, source=None):
         """
         Add new data to the plot.
 
         data - dictionary sent from logging layer containing variable/value
                pairs
         ts - timestamp of the data in ms
+        source - the source given when adding the curves
+        """
+        if source not in self._last_ts:
+            self._last_ts[source] = ts
+        elif source not in self._dtime:
+            self._dtime[source] = ts - self._last_ts[source]
+
+        for name, value in data.items():
+            item = self._items.get((source, name))
+            if item:
+                item.add_point(value, ts)
+        self._new_data = True
+
+    def add_columns(self, columns, ts, source=None):
+        """
+        Add many samples to the plot at once.
+
+        columns - dictionary with an array of values per variable
+        ts - array with the timestamps of the samples in ms
+        source - the source given when adding the curves
         """
-        if not self._last_ts:
-            self._last_ts = ts
-        elif not self._last_ts:
-            self._dtime = ts - self._last_ts
-            self._last_ts = ts
-
-        x_min_limit = 0
-        x_max_limit = 0
-        # We are adding new datasets, calculate what we should show.
+        if not len(ts):
+            return
+        if source not in self._last_ts:
+            self._last_ts[source] = ts[0]
+        if source not in self._dtime and len(ts) > 1:
+            self._dtime[source] = ts[1] - ts[0]
+
+        for name, values in columns.items():
+            item = self._items.get((source, name))
+            if item:
+                item.add_points(values, ts)
+        self._new_data = True
+
+    def clear_data(self):
+        """Remove the data of all curves but keep the curves"""
+        for item in self._items.values():
+            item.clear()
+        self._last_ts = {}
+        self._dtime = {}
+        self._new_data = True
+
+    def _redraw(self):
+        """Show the data added since the last redraw, called at fps"""
+        if not self._new_data or not self._draw_graph:
+            return
+        self._new_data = False
+
+        items = [item for item in self._items.values() if item.count]
+        if not items:
+            return
+
+        # Calculate what we should show. Curves from different sources are
+        # merged by timestamp, the window holds the last samples of the
+        # fastest curve and the points of the others in the same time span
+        self._x_max = max(item.last_ts() for item in items)
         if self._enable_samples_x.isChecked():
-            x_min_limit = max(0, self._last_item - self._nbr_samples)
-            x_max_limit = max(self._last_item, self._nbr_samples)
-
-        for name in self._items:
-            self._items[name].add_point(data[name], ts)
-            if self._draw_graph and time() > self._ts + self._delay:
-                [self._x_min, self._x_max] = self._items[name].show_data(
-                    x_min_limit, x_max_limit)
-        if time() > self._ts + self._delay:
-            self._ts = time()
+            self._x_min = max(
+                item.points(item.count - self._nbr_samples, item.count)[0][0]
+                for item in items)
+        else:
+            self._x_min = min(item.points(0, item.count)[0][0]
+                              for item in items)
+
+        pixels = int(self._plot.getViewBox().width())
+        for item in items:
+            item.show_data(item.find(self._x_min), item.count, pixels)
         if (self._enable_samples_x.isChecked() and self._dtime and
-                self._last_item < self._nbr_samples):
-            self._x_max = self._x_min + self._nbr_samples * self._dtime
+                max(item.count for item in items) < self._nbr_samples):
+            self._x_max = (self._x_min +
+                           self._nbr_samples * min(self._dtime.values()))
 
-        self._last_item = self._last_item + 1
-        self._plot_widget.getViewBox().setRange(
+        self._plot.getViewBox().setRange(
             xRange=(self._x_min, self._x_max))
 
     def removeAllDatasets(self):
         """Reset the plot by removing all the datasets"""
-        for item in self._items:
-            self._plot_widget.removeItem(self._items[item])
+        for key in self._items:
+            self._items[key].close()
+            self._plot_for(self._axes[key]).removeItem(self._items[key].curve)
+        for plot in self._plots.values():
+            self._plot_widget.removeItem(plot)
 
         self._clear_legend()
 
         self._items = {}
-        self._last_item = 0
-        self._last_ts = None
-        self._dtime = None
-        self._plot_widget.clear()
+        self._axes = {}
+        self._plots = {}
+        self._next_row = 1
+        self._last_ts = {}
+        self._dtime = {}
+        self._plot.clear()
 
     def _clear_legend(self):
-        legend = self._plot_widget.plotItem.legend
+        legend = self._plot.legend
 
         while legend.layout.count() > 0:
             item = legend.items[0]
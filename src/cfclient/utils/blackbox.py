@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+
+"""
+Black box recording of log blocks.
+
+The data of each block is kept in a ring buffer in memory that holds the
+last seconds of data. When a trigger fires the buffers are written to disk
+together with the data that arrives during the seconds after the trigger,
+so only the data around an event ends up on disk.
+
+Each capture is written to a blackbox-<time> directory with a trigger.json
+describing the trigger and a directory of npz chunks per block, which can
+be read with cfclient.utils.logdataloader.load_session.
+"""
+
+import datetime
+import json
+import logging
+import math
+import os
+from threading import Lock
+from threading import Timer
+
+import numpy
+
+from cfclient.utils.logdatawriter import NPZ_CHUNK_NAME
+from cfclient.utils.logdatawriter import log_columns
+from cfclient.utils.logdatawriter import log_dtype
+from cfclient.utils.logdatawriter import log_raw_dtype
+
+__author__ = 'Bitcraze AB'
+__all__ = ['BlackBoxRecorder', 'LogRingBuffer']
+
+logger = logging.getLogger(__name__)
+
+# Seconds of data kept before and written after a trigger
+PRE_TRIGGER = 30.0
+POST_TRIGGER = 30.0
+# Extra rows in a ring, to cover some jitter in the log period
+RING_MARGIN = 1.1
+
+
+class LogRingBuffer():
+    """Keeps the last rows of a log block in a preallocated array"""
+
+    def __init__(self, logblock, seconds):
+        """Initialize a ring that holds seconds of data of the block"""
+        self.block = logblock
+        self.dtype = log_dtype(logblock.variables)
+        self.size = int(math.ceil(
+            seconds * 1000.0 / logblock.period_in_ms * RING_MARGIN)) + 1
+        self._rows = numpy.zeros(self.size,
+                                 dtype=log_raw_dtype(self.dtype))
+        self._columns = log_columns([v.name for v in logblock.variables])
+        self._lock = Lock()
+        # Number of rows written since the start
+        self.count = 0
+
+    def _new_data(self, timestamp, data, logconf):
+        """Callback when new data arrives from the Crazyflie"""
+        row = (timestamp,) + self._columns(data)
+        with self._lock:
+            self._rows[self.count % self.size] = row
+            self.count += 1
+
+    def start(self):
+        self.block.data_received_cb.add_callback(self._new_data)
+
+    def stop(self):
+        self.block.data_received_cb.remove_callback(self._new_data)
+
+    def rows(self, since=0):
+        """Return a copy of the rows written since the count was since, in
+        the order they were written, as many as the ring holds. Returns the
+        count of the first row and the rows."""
+        with self._lock:
+            first = max(since, self.count - self.size)
+            index = numpy.arange(first, self.count) % self.size
+            return first, self._rows[index].view(self.dtype)
+
+
+class _Capture():
+    """A trigger waiting for the data after it"""
+
+    def __init__(self, reason, counts, pre_rows):
+        self.reason = reason
+        self.time = datetime.datetime.now()
+        self.counts = counts
+        self.pre_rows = pre_rows
+        self.timer = None
+
+
+class BlackBoxRecorder():
+    """Keeps the last seconds of data of log blocks in memory and writes
+    them to disk when triggered"""
+
+    def __init__(self, logblocks, directory, pre_trigger=PRE_TRIGGER,
+                 post_trigger=POST_TRIGGER, compress=True):
+        """Initialize the recorder. When triggered pre_trigger seconds of
+        data before and post_trigger seconds after the trigger are written
+        to a new directory in directory."""
+        self._dir = directory
+        self._pre = pre_trigger
+        self._post = post_trigger
+        self._save = numpy.savez_compressed if compress else numpy.savez
+        self._rings = [LogRingBuffer(b, pre_trigger + post_trigger)
+                       for b in logblocks]
+        self._triggers = []
+        self._capture = None
+        self._lock = Lock()
+        self.captures = []
+
+    def start(self):
+        """Start keeping the data of the blocks"""
+        for ring in self._rings:
+            ring.start()
+
+    def stop(self):
+        """Stop keeping data and triggers, a capture in progress is written
+        with the data received so far"""
+        for caller, callback in self._triggers:
+            caller.remove_callback(callback)
+        self._triggers = []
+        for ring in self._rings:
+            ring.stop()
+        with self._lock:
+            capture = self._capture
+            self._capture = None
+            if capture:
+                capture.timer.cancel()
+        if capture:
+            self._write(capture)
+
+    def trigger(self, reason="manual"):
+        """Write the data before and after now to disk, the trigger is
+        ignored if a capture is already in progress. Returns True if a
+        capture was started."""
+        with self._lock:
+            if self._capture:
+                logger.info("Black box trigger [%s] during capture ignored",
+                            reason)
+                return False
+            capture = _Capture(
+                reason, [ring.count for ring in self._rings],
+                [int(math.ceil(self._pre * 1000.0 / ring.block.period_in_ms))
+                 for ring in self._rings])
+            capture.timer = Timer(self._post, self._finish, (capture,))
+            capture.timer.daemon = True
+            self._capture = capture
+        logger.info("Black box triggered by [%s]", reason)
+        capture.timer.start()
+        return True
+
+    def add_trigger(self, caller, reason, condition=None):
+        """Trigger when a callback of caller (a cflib Caller, for instance
+        Crazyflie.connection_lost or JoystickReader.emergency_stop_updated)
+        is called and condition (if given) returns True for its
+        arguments"""
+        def callback(*args):
+            if condition is None or condition(*args):
+                self.trigger(reason)
+        caller.add_callback(callback)
+        self._triggers.append((caller, callback))
+
+    def add_threshold(self, logblock, name, above=None, below=None):
+        """Trigger when the variable name of the block goes above or below
+        a value. It triggers again after the value has been back within
+        the limit."""
+        exceeded = [False]
+
+        def condition(timestamp, data, logconf):
+            value = data[name]
+            was_exceeded = exceeded[0]
+            exceeded[0] = ((above is not None and value > above) or
+                           (below is not None and value < below))
+            return exceeded[0] and not was_exceeded
+        if above is not None:
+            reason = "{} > {}".format(name, above)
+        else:
+            reason = "{} < {}".format(name, below)
+        self.add_trigger(logblock.data_received_cb, reason, condition)
+
+    def _finish(self, capture):
+        """Write a capture when the post-trigger time has passed, unless
+        stop has taken it already"""
+        with self._lock:
+            if self._capture is not capture:
+                return
+            self._capture = None
+        self._write(capture)
+
+    def _write(self, capture):
+        path = os.path.join(self._dir, "blackbox-{}".format(
+            capture.time.strftime("%Y%m%dT%H-%M-%S-%f")))
+        info = {"reason": capture.reason,
+                "time": capture.time.isoformat(),
+                "pre_trigger": self._pre,
+                "post_trigger": self._post,
+                "blocks": {}}
+        try:
+            os.makedirs(path, exist_ok=True)
+            for ring, count, pre_rows in zip(self._rings, capture.counts,
+                                             capture.pre_rows):
+                first, rows = ring.rows(count - pre_rows)
+                name = ring.block.name.replace("/", "-")
+                os.makedirs(os.path.join(path, name), exist_ok=True)
+                self._save(os.path.join(path, name, NPZ_CHUNK_NAME.format(0)),
+                           **{n: rows[n] for n in ring.dtype.names})
+                # Index of the first row after the trigger
+                info["blocks"][name] = {"rows": len(rows),
+                                        "trigger_row": max(count - first, 0)}
+            with open(os.path.join(path, "trigger.json"), "w") as f:
+                json.dump(info, f, indent=2)
+            logger.info("Black box data written to [%s]", path)
+            self.captures.append(path)
+        except (IOError, OSError) as e:
+            logger.error("Could not write black box data to [%s]: %s",
+                         path, e)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+
+"""
+Decimation of plot data, so a curve never has many more points than the
+plot has pixels.
+
+The data is split in buckets of a fixed number of points. minmax keeps the
+lowest and highest point of each bucket, which keeps the envelope of the
+data (spikes stay visible). lttb keeps one point per bucket, the one that
+forms the largest triangle with the averages of the buckets before and
+after it. This is a vectorized variant of Largest-Triangle-Three-Buckets,
+the original uses the point selected in the previous bucket instead of its
+average.
+
+A Decimator decimates a series that grows, in buckets aligned to the point
+count, and caches the decimated buckets so only buckets with new points
+are computed when points are added.
+"""
+
+import numpy as np
+
+__author__ = 'Bitcraze AB'
+__all__ = ['DECIMATIONS', 'Decimator', 'minmax', 'lttb']
+
+# Data with fewer points than this many per pixel is not decimated
+DECIMATION_THRESHOLD = 2
+# Number of bucket sizes (zoom levels) the decimated data is cached for
+DECIMATION_CACHE = 4
+
+
+def minmax(x, y, size):
+    """
+    Return the min and max point of each bucket of size points, in the
+    order they appear. Points after the last full bucket are left out.
+    """
+    n = len(x) // size
+    buckets = y[:n * size].reshape(n, size)
+    low = buckets.argmin(axis=1)
+    high = buckets.argmax(axis=1)
+    offset = np.arange(n) * size
+    index = np.column_stack((offset + np.minimum(low, high),
+                             offset + np.maximum(low, high))).ravel()
+    return x[index], y[index]
+
+
+def lttb(x, y, size):
+    """
+    Return one point of each bucket of size points, the one forming the
+    largest triangle with the averages of the neighbouring buckets. Points
+    after the last full bucket are left out.
+    """
+    n = len(x) // size
+    xb = x[:n * size].reshape(n, size)
+    yb = y[:n * size].reshape(n, size)
+    x_avg = xb.mean(axis=1)
+    y_avg = yb.mean(axis=1)
+    # The first and last buckets use their own average as the missing
+    # neighbour
+    x_prev = np.concatenate((x_avg[:1], x_avg[:-1]))
+    y_prev = np.concatenate((y_avg[:1], y_avg[:-1]))
+    x_next = np.concatenate((x_avg[1:], x_avg[-1:]))
+    y_next = np.concatenate((y_avg[1:], y_avg[-1:]))
+    area = np.abs((x_prev - x_next)[:, None] * (yb - y_prev[:, None]) -
+                  (x_prev[:, None] - xb) * (y_next - y_prev)[:, None])
+    index = np.arange(n) * size + area.argmax(axis=1)
+    return x[index], y[index]
+
+
+# Decimation functions by name and the number of points they keep per
+# bucket
+DECIMATIONS = {"minmax": (minmax, 2),
+               "lttb": (lttb, 1)}
+
+
+class Decimator():
+    """Decimates a series that points are added to, with a cache of the
+    decimated buckets per bucket size"""
+
+    def __init__(self, decimation):
+        """Initialize with the name of the decimation (see DECIMATIONS)"""
+        self._decimate, self._per_bucket = DECIMATIONS[decimation]
+        # Decimated data by bucket size: first bucket and the points
+        self._cache = {}
+
+    def clear(self):
+        self._cache = {}
+
+    def _buckets(self, points, size, first, last, kept, count):
+        """Decimate the buckets from first to last (not included). The
+        neighbouring buckets are passed along when they are complete, so
+        a bucket is decimated the same whatever buckets it's decimated
+        with."""
+        before = 1 if (first - 1) * size >= kept else 0
+        after = 1 if (last + 1) * size <= count else 0
+        ts, data = self._decimate(
+            *points((first - before) * size, (last + after) * size), size)
+        start = before * self._per_bucket
+        stop = len(ts) - after * self._per_bucket
+        return ts[start:stop], data[start:stop]
+
+    def decimate(self, points, start, stop, pixels, kept, count):
+        """
+        Return the timestamps and values of the points from start to stop
+        reduced to about pixels buckets, None if there are too few points
+        to decimate them.
+
+        points - function returning the timestamps and values of the
+                 points from a start to a stop point
+        kept - number of the first point that points can return
+        count - number of points in the series
+
+        Buckets are aligned to the point count and their size is a power of
+        two, so the decimated buckets are cached per zoom level.
+        """
+        size = int(stop - start) // max(int(pixels), 1)
+        if size < DECIMATION_THRESHOLD:
+            return None
+        size = 1 << (size.bit_length() - 1)
+        per_bucket = self._per_bucket
+
+        first = -(-start // size)
+        last = stop // size
+        ts, data = [], []
+        new = first
+        if size in self._cache:
+            cached_first, cached_ts, cached_data = self._cache[size]
+            # The last cached bucket is computed again, its next neighbour
+            # might have been missing. The first bucket is computed again
+            # if its previous neighbour is no longer kept.
+            cached_last = cached_first + len(cached_ts) // per_bucket - 1
+            reuse = first if (first - 1) * size >= kept else first + 1
+            end = min(cached_last, last)
+            if cached_first <= reuse < end:
+                if reuse > first:
+                    first_ts, first_data = self._buckets(
+                        points, size, first, reuse, kept, count)
+                    ts.append(first_ts)
+                    data.append(first_data)
+                ts.append(cached_ts[(reuse - cached_first) * per_bucket:
+                                    (end - cached_first) * per_bucket])
+                data.append(cached_data[(reuse - cached_first) * per_bucket:
+                                        (end - cached_first) * per_bucket])
+                new = end
+        if last > new:
+            new_ts, new_data = self._buckets(points, size, new, last, kept,
+                                             count)
+            ts.append(new_ts)
+            data.append(new_data)
+        if ts:
+            decimated_ts = np.concatenate(ts)
+            decimated_data = np.concatenate(data)
+            self._cache.pop(size, None)
+            self._cache[size] = (first, decimated_ts, decimated_data)
+            while len(self._cache) > DECIMATION_CACHE:
+                del self._cache[next(iter(self._cache))]
+        else:
+            decimated_ts = decimated_data = np.zeros(0)
+
+        # Points outside of the full buckets are shown as they are
+        head_ts, head_data = points(start, min(first * size, stop))
+        tail_ts, tail_data = points(max(last * size, start), stop)
+        if last < first:
+            tail_ts = tail_data = np.zeros(0)
+        return (np.concatenate((head_ts, decimated_ts, tail_ts)),
+                np.concatenate((head_data, decimated_data, tail_data)))
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+
+"""
+Measures the throughput of the log writers with the durability and
+compression settings, without a Crazyflie.
+
+Rows of a fake log block are written as fast as possible. For each setting
+the time it takes to hand the rows to the writer (the time spent in the
+log callback) and the time until all of them are on disk is measured.
+"""
+
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+from cflib.crazyflie.log import LogConfig
+
+from cfclient.utils.logdatawriter import LogSessionWriter
+from cfclient.utils.logdatawriter import LogWriter
+
+__author__ = 'Bitcraze AB'
+__all__ = ['main']
+
+# Name and writer arguments of each setting, cflog settings use a session
+# file
+SETTINGS = [
+    ("csv", {}),
+    ("csv fsync 1s", {"fsync_interval": 1.0}),
+    ("csv fsync 0.1s", {"fsync_interval": 0.1}),
+    ("csv fsync every batch", {"fsync_interval": 0}),
+    ("csv segments 1MB", {"segment_size": 1 << 20}),
+    ("csv segments 1MB fsync 1s", {"segment_size": 1 << 20,
+                                   "fsync_interval": 1.0}),
+    ("csv.gz", {"compression": "gzip"}),
+    ("csv.gz fsync 1s", {"compression": "gzip", "fsync_interval": 1.0}),
+    ("npz", {"file_format": "npz"}),
+    ("npz fsync every chunk", {"file_format": "npz",
+                               "fsync_interval": 0}),
+    ("cflog", {}),
+    ("cflog fsync 1s", {"fsync_interval": 1.0}),
+]
+
+
+def _size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def _run(name, kwargs, rows, variables, directory):
+    block = LogConfig("bench", 10)
+    for i in range(variables):
+        block.add_variable("bench.v{}".format(i), "float")
+    data = {v.name: 1.5 + i for i, v in enumerate(block.variables)}
+
+    path = os.path.join(directory, name.replace(" ", "_"))
+    if name.startswith("cflog"):
+        writer = LogSessionWriter(os.path.join(path, "session.cflog"),
+                                  **kwargs)
+        writer.start()
+        writer.add_block(block)
+    else:
+        writer = LogWriter(block, datetime.datetime.now(), path, **kwargs)
+        writer.start()
+
+    start = time.perf_counter()
+    for i in range(rows):
+        block.data_received_cb.call(i, data, block)
+    fed = time.perf_counter() - start
+    writer.stop()
+    done = time.perf_counter() - start
+    return {"setting": name,
+            "callback_us": fed / rows * 1e6,
+            "rows_per_s": rows / done,
+            "bytes": _size(path)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput of the log writers")
+    parser.add_argument("-r", "--rows", type=int, default=200000,
+                        help="Rows written with each setting")
+    parser.add_argument("-v", "--variables", type=int, default=6,
+                        help="Float variables in the log block")
+    parser.add_argument("-d", "--directory",
+                        help="Directory to write to (on the disk to test), "
+                             "a temporary directory by default")
+    parser.add_argument("-s", "--settings", nargs="*",
+                        help="Names of the settings to run, all by default")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(dir=args.directory)
+    print("{:28} {:>12} {:>12} {:>10}".format(
+        "setting", "callback us", "rows/s", "MB"))
+    try:
+        for name, kwargs in SETTINGS:
+            if args.settings and name not in args.settings:
+                continue
+            result = _run(name, kwargs, args.rows, args.variables,
+                          directory)
+            print("{:28} {:12.2f} {:12.0f} {:10.1f}".format(
+                name, result["callback_us"], result["rows_per_s"],
+                result["bytes"] / 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
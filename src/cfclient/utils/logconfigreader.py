@@ -45,10 +45,9 @@ import shutil
 import cfclient
 from cflib.crazyflie.log import LogVariable, LogConfig
 
-from PyQt5 import QtGui
-
 __author__ = 'Bitcraze AB'
-__all__ = ['LogVariable', 'LogConfigReader']
+__all__ = ['LogVariable', 'LogConfigReader', 'log_config_files',
+           'read_log_config']
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +55,47 @@ DEFAULT_CONF_NAME = 'log_config'
 DEFAULT_CATEGORY_NAME = 'category'
 
 
+def log_config_files(log_path=None):
+    """ Reads all configuration files from the log path (by default the one
+        in the user config) and returns a list of tuples with format:
+        (category/conf-name, absolute path).
+    """
+    if log_path is None:
+        log_path = os.path.join(cfclient.config_path, 'log')
+    filepaths = []
+
+    for files in os.listdir(log_path):
+        abspath = os.path.join(log_path, files)
+        if os.path.isdir(abspath):
+            for config in os.listdir(abspath):
+                if config.endswith('.json'):
+                    filepaths.append(('/'.join([files, config]),
+                                     os.path.join(abspath, config)))
+        else:
+            if files.endswith('.json'):
+                filepaths.append((files, os.path.join(abspath)))
+
+    return filepaths
+
+
+def read_log_config(conf_path, name=None):
+    """Read a log configuration file, the name in the file is used if no
+    name is given"""
+    with open(conf_path) as f:
+        data = json.load(f)
+    infoNode = data["logconfig"]["logblock"]
+
+    logConf = LogConfig(name or infoNode["name"], int(infoNode["period"]))
+    for v in infoNode["variables"]:
+        if v["type"] == "TOC":
+            logConf.add_variable(str(v["name"]), v["fetch_as"])
+        else:
+            logConf.add_variable("Mem", v["fetch_as"],
+                                 v["stored_as"],
+                                 int(v["address"], 16))
+    return logConf
+
+
 class LogConfigReader():
     """Reads logging configurations from file"""
 
@@ -74,6 +114,8 @@ class LogConfigReader():
         self._cf.connected.add_callback(self._connected)
 
     def get_icons(self):
+        # Qt is only needed by the user interface
+        from PyQt5 import QtGui
         client_path = os.path.abspath(os.path.join(os.path.dirname(__file__),
                                       os.pardir))
         icon_path = os.path.join(client_path, 'ui', 'icons')
@@ -242,41 +284,14 @@ class LogConfigReader():
             return DEFAULT_CONF_NAME + '1'
 
     def _get_conf(self, conf_path):
-        with open(conf_path) as f:
-            data = json.load(f)
-            infoNode = data["logconfig"]["logblock"]
-
-            logConf = LogConfig(infoNode["name"],
-                                int(infoNode["period"]))
-            for v in data["logconfig"]["logblock"]["variables"]:
-                if v["type"] == "TOC":
-                    logConf.add_variable(str(v["name"]), v["fetch_as"])
-                else:
-                    logConf.add_variable("Mem", v["fetch_as"],
-                                         v["stored_as"],
-                                         int(v["address"], 16))
-            return logConf
+        return read_log_config(conf_path)
 
     def _get_configpaths_recursively(self):
         """ Reads all configuration files from the log path and
             returns a list of tuples with format:
             (category/conf-name, absolute path).
         """
-        logpath = os.path.join(cfclient.config_path, 'log')
-        filepaths = []
-
-        for files in os.listdir(logpath):
-            abspath = os.path.join(logpath, files)
-            if os.path.isdir(abspath):
-                for config in os.listdir(abspath):
-                    if config.endswith('.json'):
-                        filepaths.append(('/'.join([files, config]),
-                                         os.path.join(abspath, config)))
-            else:
-                if files.endswith('.json'):
-                    filepaths.append((files, os.path.join(abspath)))
-
-        return filepaths
+        return log_config_files()
 
     def _read_config_files(self):
         """Read and parse log configurations"""
@@ -287,21 +302,8 @@ class LogConfigReader():
         for conf in configsfound:
             try:
                 logger.info("Parsing [%s]", conf[0])
-                json_data = open(conf[1])
-                self.data = json.load(json_data)
-                infoNode = self.data["logconfig"]["logblock"]
                 logConfName = conf[0].replace('.json', '')
-
-                logConf = LogConfig(logConfName, int(infoNode["period"]))
-                for v in self.data["logconfig"]["logblock"]["variables"]:
-                    if v["type"] == "TOC":
-                        logConf.add_variable(str(v["name"]), v["fetch_as"])
-                    else:
-                        logConf.add_variable("Mem", v["fetch_as"],
-                                             v["stored_as"],
-                                             int(v["address"], 16))
-                new_dsList.append(logConf)
-                json_data.close()
+                new_dsList.append(read_log_config(conf[1], logConfName))
             except Exception as e:
                 logger.warning("Exception while parsing logconfig file: %s", e)
         self.dsList = new_dsList
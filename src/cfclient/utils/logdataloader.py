@@ -0,0 +1,696 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+"""
+Used to read log data written by the LogWriter back into arrays.
+
+A session directory holds one entry per started log block: a .csv file
+(.csv.gz or .csv.zst if compressed, split in .NNNN.csv segments when
+rotated), a .parquet file or a directory of .npz
+chunks. Each entry is read as a dict with a numpy array per column, the
+timestamps in the Timestamp column.
+
+Session files (.cflog) hold all blocks of a session, LogSessionReader reads
+the rows of a time range from them using the index of the file. The
+timestamps it returns are unwrapped, they keep increasing when the 24 bit
+Crazyflie timestamps wrap, and the time ranges are given in them.
+LogDirectoryReader does the same for a whole session directory, loading
+only the chunks of the range that is read, for instance to play it back.
+The logs of a directory are unwrapped to one time base, so logs that
+started on either side of a wrap stay in sync.
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+
+import logging
+
+import numpy
+
+from cfclient.utils.logdatawriter import CHUNK_ROWS
+from cfclient.utils.logdatawriter import RECORD_CHUNK
+from cfclient.utils.logdatawriter import RECORD_INDEX
+from cfclient.utils.logdatawriter import RECORD_SCHEMA
+from cfclient.utils.logdatawriter import SESSION_EXTENSION
+from cfclient.utils.logdatawriter import SESSION_HEADER
+from cfclient.utils.logdatawriter import SESSION_INDEX_MAGIC
+from cfclient.utils.logdatawriter import SESSION_MAGIC
+from cfclient.utils.logdatawriter import SESSION_RECORD
+from cfclient.utils.logdatawriter import SESSION_TRAILER
+from cfclient.utils.logdatawriter import SESSION_VERSION
+from cfclient.utils.logdatawriter import TIMESTAMP_COLUMN
+from cfclient.utils.logdatawriter import TIMESTAMP_DTYPE
+from cfclient.utils.logdatawriter import TIMESTAMP_RANGE
+from cfclient.utils.logdatawriter import TRUNCATED_ERRORS
+from cfclient.utils.logdatawriter import nearest_timestamp
+from cfclient.utils.logdatawriter import open_log_file
+from cfclient.utils.logdatawriter import unwrap_timestamps
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+__author__ = 'Bitcraze AB'
+__all__ = ['LogSessionReader', 'LogDirectoryReader', 'load_log',
+           'load_session']
+
+logger = logging.getLogger(__name__)
+
+# Name of a segment of a CSV file (without extension)
+_SEGMENT = re.compile(r"^(.*)\.(\d{4})$")
+# Number of chunks the LogDirectoryReader keeps in memory
+CACHED_CHUNKS = 32
+
+
+def _load_csv(path):
+    lines = []
+    with open_log_file(path) as f:
+        names = f.readline().strip().split(",")
+        try:
+            for line in f:
+                lines.append(line)
+        except TRUNCATED_ERRORS as e:
+            # A compressed file that was not closed ends after its last
+            # sync point
+            logger.warning("[%s] is truncated: %s", path, e)
+    if lines and not lines[-1].endswith("\n"):
+        lines.pop()
+    if lines:
+        values = numpy.loadtxt(lines, delimiter=",", ndmin=2)
+    else:
+        values = numpy.empty((0, len(names)))
+    columns = {n: values[:, i] for i, n in enumerate(names)}
+    columns[TIMESTAMP_COLUMN] = columns[TIMESTAMP_COLUMN].astype(
+        TIMESTAMP_DTYPE)
+    return columns
+
+
+def _load_npz(path):
+    chunks = []
+    for name in sorted(glob.glob(os.path.join(path, "chunk-*.npz"))):
+        with numpy.load(name) as chunk:
+            chunks.append({n: chunk[n] for n in chunk.files})
+    if not chunks:
+        raise ValueError("No chunks in [{}]".format(path))
+    return {n: numpy.concatenate([c[n] for c in chunks])
+            for n in chunks[0]}
+
+
+def _load_parquet(path):
+    if pyarrow is None:
+        raise Exception("Reading Parquet files needs pyarrow")
+    table = pyarrow.parquet.read_table(path)
+    return {n: table.column(n).to_numpy() for n in table.column_names}
+
+
+class LogSessionReader():
+    """Reads the blocks of a session file. Files that were not closed, for
+    instance after a crash, are read up to the last complete record."""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        magic, version = SESSION_HEADER.unpack(
+            self._file.read(SESSION_HEADER.size))
+        if magic != SESSION_MAGIC or version != SESSION_VERSION:
+            self._file.close()
+            raise ValueError("{} is not a log session".format(path))
+        index = self._read_index()
+        self.complete = index is not None
+        # End of the last complete record of a file that was not closed
+        self.end = None
+        if index is None:
+            logger.warning("Session [%s] was not closed, scanning it", path)
+            index = self._scan()
+
+        self._streams = {}
+        for schema in index["streams"]:
+            dtype = numpy.dtype([tuple(c) for c in schema["dtype"]])
+            self._streams[schema["name"]] = (schema["id"], dtype)
+        # Offset, rows, first and last timestamp of the chunks per stream
+        # in time order, the unwrapped timestamps used to find the chunks of
+        # a range
+        chunks = numpy.array(index["chunks"], dtype=numpy.int64).reshape(
+            -1, 5)
+        self._chunks = {stream: chunks[chunks[:, 0] == stream, 1:]
+                        for stream, _ in self._streams.values()}
+
+    @property
+    def blocks(self):
+        """Names of the blocks in the session"""
+        return list(self._streams)
+
+    def time_range(self):
+        """Return the first and last timestamp in the session, None if there
+        is no data"""
+        chunks = [c for c in self._chunks.values() if len(c)]
+        if not chunks:
+            return None
+        return (int(min(c[:, 2].min() for c in chunks)),
+                int(max(c[:, 3].max() for c in chunks)))
+
+    def _read_record(self, offset):
+        self._file.seek(offset)
+        header = self._file.read(SESSION_RECORD.size)
+        if len(header) < SESSION_RECORD.size:
+            return None
+        kind, stream, rows, first, last, size = SESSION_RECORD.unpack(header)
+        data = self._file.read(size)
+        if len(data) < size:
+            return None
+        return kind, stream, rows, first, last, data
+
+    def _read_index(self):
+        self._file.seek(0, os.SEEK_END)
+        end = self._file.tell()
+        if end < SESSION_HEADER.size + SESSION_TRAILER.size:
+            return None
+        self._file.seek(end - SESSION_TRAILER.size)
+        offset, magic = SESSION_TRAILER.unpack(
+            self._file.read(SESSION_TRAILER.size))
+        if magic != SESSION_INDEX_MAGIC:
+            return None
+        record = self._read_record(offset)
+        if record is None or record[0] != RECORD_INDEX:
+            return None
+        return json.loads(record[5].decode("utf-8"))
+
+    def _scan(self):
+        """Build the index from the records of the file"""
+        index = {"streams": [], "chunks": []}
+        offset = SESSION_HEADER.size
+        while True:
+            record = self._read_record(offset)
+            if record is None:
+                break
+            kind, stream, rows, first, last, data = record
+            if kind == RECORD_SCHEMA:
+                index["streams"].append(json.loads(data.decode("utf-8")))
+            elif kind == RECORD_CHUNK:
+                index["chunks"].append([stream, offset, rows, first, last])
+            elif kind == RECORD_INDEX:
+                break
+            offset = self._file.tell()
+        self.end = offset
+        return index
+
+    @property
+    def index(self):
+        """The streams and chunks of the session, as stored in the index"""
+        streams = [{"id": stream, "name": name, "dtype": dtype.descr}
+                   for name, (stream, dtype) in self._streams.items()]
+        chunks = [[stream] + [int(v) for v in c]
+                  for stream, chunks in self._chunks.items()
+                  for c in chunks]
+        return streams, sorted(chunks, key=lambda c: c[1])
+
+    def columns(self, block):
+        """Names of the columns of a block"""
+        return list(self._streams[block][1].names)
+
+    def chunks(self, block):
+        """Return the first and last timestamp of the chunks of a block"""
+        return self._chunks[self._streams[block][0]][:, 2:]
+
+    def _read_rows(self, chunk, dtype):
+        """Return the rows of a chunk with the timestamps unwrapped from
+        the first timestamp in the index"""
+        offset, _, first, _ = chunk
+        record = self._read_record(offset)
+        rows = numpy.frombuffer(record[5], dtype=dtype).copy()
+        ts = rows[TIMESTAMP_COLUMN]
+        rows[TIMESTAMP_COLUMN] = unwrap_timestamps(ts, (ts[0], first))
+        return rows
+
+    def read_chunk(self, block, i):
+        """Return the rows of chunk i of a block as a dict with an array per
+        column"""
+        stream, dtype = self._streams[block]
+        rows = self._read_rows(self._chunks[stream][i], dtype)
+        return {n: rows[n] for n in dtype.names}
+
+    def read(self, start=None, end=None, blocks=None):
+        """Return the rows with a timestamp from start to end (inclusive)
+        of the blocks (by default all) as a dict with the block name as key
+        and a dict with an array per column as value"""
+        result = {}
+        for name in blocks if blocks is not None else self._streams:
+            stream, dtype = self._streams[name]
+            chunks = self._chunks[stream]
+            first = 0
+            last = len(chunks)
+            if start is not None:
+                first = numpy.searchsorted(chunks[:, 3], start, "left")
+            if end is not None:
+                last = numpy.searchsorted(chunks[:, 2], end, "right")
+            parts = [numpy.empty(0, dtype=dtype)]
+            for chunk in chunks[first:last]:
+                parts.append(self._read_rows(chunk, dtype))
+            rows = numpy.concatenate(parts)
+            ts = rows[TIMESTAMP_COLUMN]
+            mask = numpy.ones(len(rows), dtype=bool)
+            if start is not None:
+                mask &= ts >= start
+            if end is not None:
+                mask &= ts <= end
+            rows = rows[mask]
+            result[name] = {n: rows[n] for n in dtype.names}
+        return result
+
+    def close(self):
+        self._file.close()
+
+
+def _unwrap_columns(columns):
+    """Unwrap the timestamps of the columns of a log"""
+    columns[TIMESTAMP_COLUMN] = unwrap_timestamps(
+        columns[TIMESTAMP_COLUMN]).astype(TIMESTAMP_DTYPE)
+    return columns
+
+
+def load_log(path):
+    """Read one log file (or directory of chunks) written by the LogWriter
+    and return a dict with an array per column, the timestamps unwrapped"""
+    if os.path.isdir(path):
+        return _unwrap_columns(_load_npz(path))
+    if path.endswith(".parquet"):
+        return _unwrap_columns(_load_parquet(path))
+    return _unwrap_columns(_load_csv(path))
+
+
+def _session_files(directory):
+    """Return the logs in a session directory as three dicts with the name
+    of each log as key: the paths of .csv, .parquet files and npz
+    directories, the paths of the segments of rotated CSV files and the
+    paths of session files"""
+    files = {}
+    segments = {}
+    sessions = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        key, ext = os.path.splitext(name)
+        if ext in (".gz", ".zst"):
+            key, ext = os.path.splitext(key)
+        if os.path.isdir(path):
+            files[name] = path
+        elif ext == SESSION_EXTENSION:
+            sessions[key] = path
+        elif ext in (".csv", ".parquet"):
+            segment = _SEGMENT.match(key)
+            if segment:
+                segments.setdefault(segment.group(1), []).append(path)
+            else:
+                files[key] = path
+    return files, segments, sessions
+
+
+def _time_shifts(spans):
+    """Return the time to add to each log of a session directory so they
+    share one time base. spans holds the first and last timestamp of each
+    log, unwrapped on its own. Each log is placed to start within the time
+    of a longer log if possible, otherwise as close as possible to the
+    start of the longest log."""
+    shifts = [0] * len(spans)
+    order = sorted(range(len(spans)), reverse=True,
+                   key=lambda i: spans[i][1] - spans[i][0])
+    placed = []
+    for i in order:
+        first, last = spans[i]
+        start = first
+        if placed:
+            start = nearest_timestamp(first, (placed[0][0], placed[0][0]))
+            for placed_first, placed_last in placed:
+                covered = placed_first + (first - placed_first) % \
+                    TIMESTAMP_RANGE
+                if covered <= placed_last:
+                    start = covered
+                    break
+        shifts[i] = start - first
+        placed.append((start, last + shifts[i]))
+    # Keep the timestamps positive
+    earliest = min([start for start, _ in placed] or [0])
+    if earliest < 0:
+        wraps = -(earliest // TIMESTAMP_RANGE)
+        shifts = [shift + wraps * TIMESTAMP_RANGE for shift in shifts]
+    return shifts
+
+
+def load_session(directory):
+    """Read all logs in a session directory and return a dict with the name
+    of each log (without extension) as key and its columns as value. The
+    segments of a CSV file are joined, the blocks of session files are
+    named <file>/<block>."""
+    logs = {}
+    files, segments, sessions = _session_files(directory)
+    for key, path in sessions.items():
+        try:
+            reader = LogSessionReader(path)
+            try:
+                for block, columns in reader.read().items():
+                    logs["{}/{}".format(key, block)] = columns
+            finally:
+                reader.close()
+        except Exception as e:
+            logger.warning("Could not read [%s]: %s", path, e)
+    for key, path in files.items():
+        try:
+            logs[key] = load_log(path)
+        except Exception as e:
+            logger.warning("Could not read [%s]: %s", path, e)
+    for key, paths in segments.items():
+        parts = []
+        for path in paths:
+            try:
+                parts.append(load_log(path))
+            except Exception as e:
+                logger.warning("Could not read [%s]: %s", path, e)
+        if parts:
+            logs[key] = _unwrap_columns(
+                {n: numpy.concatenate([p[n] for p in parts])
+                 for n in parts[0]})
+    timed = [columns[TIMESTAMP_COLUMN] for columns in logs.values()
+             if len(columns[TIMESTAMP_COLUMN])]
+    shifts = _time_shifts([(int(ts[0]), int(ts[-1])) for ts in timed])
+    for ts, shift in zip(timed, shifts):
+        ts += shift
+    return logs
+
+
+def _unwrap_chunk(columns, first):
+    """Unwrap the timestamps of the columns of a chunk, first is the
+    unwrapped timestamp of its first row"""
+    ts = columns[TIMESTAMP_COLUMN]
+    columns[TIMESTAMP_COLUMN] = unwrap_timestamps(
+        ts, (ts[0], first)).astype(TIMESTAMP_DTYPE)
+    return columns
+
+
+class _CsvChunks():
+    """Chunks of rows of a CSV file or its segments. The file is scanned
+    once for the offset and first and last (unwrapped) timestamp of each
+    chunk."""
+
+    def __init__(self, paths, rows=CHUNK_ROWS):
+        self.names = None
+        # Path, offset and number of rows of the chunks
+        self._chunks = []
+        times = []
+        # Timestamp and unwrapped timestamp of the previous row
+        previous = None
+        for path in paths:
+            with open_log_file(path, "rb") as f:
+                header = f.readline()
+                if self.names is None:
+                    self.names = header.decode().strip().split(",")
+                offset = len(header)
+                count = 0
+                try:
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        ts = int(line.split(b",", 1)[0])
+                        if previous:
+                            previous = (ts, previous[1] + (
+                                ts - previous[0]) % TIMESTAMP_RANGE)
+                        else:
+                            previous = (ts, ts)
+                        ts = previous[1]
+                        if count == 0:
+                            chunk = [path, offset, 0]
+                            times.append([ts, ts])
+                            self._chunks.append(chunk)
+                        count += 1
+                        chunk[2] = count
+                        times[-1][1] = ts
+                        offset += len(line)
+                        if count == rows:
+                            count = 0
+                except TRUNCATED_ERRORS as e:
+                    logger.warning("[%s] is truncated: %s", path, e)
+        self.times = numpy.array(times, dtype=numpy.int64).reshape(-1, 2)
+        self._file = None
+        self._path = None
+        self._position = 0
+
+    def _seek(self, path, offset):
+        """Move to offset of path, compressed files are opened again to move
+        backwards"""
+        if self._path != path or offset < self._position:
+            self.close()
+            self._file = open_log_file(path, "rb")
+            self._path = path
+            self._position = 0
+        if self._file.seekable():
+            self._file.seek(offset)
+        else:
+            self._file.read(offset - self._position)
+        self._position = offset
+
+    def read(self, i):
+        path, offset, rows = self._chunks[i]
+        self._seek(path, offset)
+        lines = [self._file.readline() for _ in range(rows)]
+        self._position += sum(len(line) for line in lines)
+        values = numpy.loadtxt([line.decode() for line in lines],
+                               delimiter=",", ndmin=2)
+        columns = {n: values[:, i] for i, n in enumerate(self.names)}
+        return columns
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._path = None
+
+
+class _NpzChunks():
+    """Chunks of a directory of .npz files"""
+
+    def __init__(self, path):
+        self._paths = []
+        times = []
+        previous = None
+        for name in sorted(glob.glob(os.path.join(path, "chunk-*.npz"))):
+            with numpy.load(name) as chunk:
+                ts = chunk[TIMESTAMP_COLUMN]
+                self.names = chunk.files
+            if len(ts):
+                self._paths.append(name)
+                unwrapped = unwrap_timestamps(ts, previous)
+                previous = (ts[-1], unwrapped[-1])
+                times.append([unwrapped[0], unwrapped[-1]])
+        if not self._paths:
+            raise ValueError("No chunks in [{}]".format(path))
+        self.times = numpy.array(times, dtype=numpy.int64)
+
+    def read(self, i):
+        with numpy.load(self._paths[i]) as chunk:
+            return {n: chunk[n] for n in chunk.files}
+
+    def close(self):
+        pass
+
+
+class _ParquetChunks():
+    """Row groups of a Parquet file"""
+
+    def __init__(self, path):
+        if pyarrow is None:
+            raise Exception("Reading Parquet files needs pyarrow")
+        self._file = pyarrow.parquet.ParquetFile(path)
+        self.names = self._file.schema_arrow.names
+        # Row groups with rows and their first and last timestamp
+        self._groups = []
+        times = []
+        previous = None
+        for i in range(self._file.num_row_groups):
+            ts = self._file.read_row_group(
+                i, columns=[TIMESTAMP_COLUMN]).column(0).to_numpy()
+            if len(ts):
+                self._groups.append(i)
+                unwrapped = unwrap_timestamps(ts, previous)
+                previous = (ts[-1], unwrapped[-1])
+                times.append([unwrapped[0], unwrapped[-1]])
+        self.times = numpy.array(times, dtype=numpy.int64).reshape(-1, 2)
+
+    def read(self, i):
+        table = self._file.read_row_group(self._groups[i])
+        return {n: table.column(n).to_numpy() for n in table.column_names}
+
+    def close(self):
+        pass
+
+
+class _SessionChunks():
+    """Chunks of a block in a session file"""
+
+    def __init__(self, reader, block):
+        self._reader = reader
+        self._block = block
+        self.names = reader.columns(block)
+        self.times = reader.chunks(block)
+
+    def read(self, i):
+        return self._reader.read_chunk(self._block, i)
+
+    def close(self):
+        pass
+
+
+class LogDirectoryReader():
+    """Reads the logs of a session directory in chunks, named as by
+    load_session. Only the first and last timestamp of each chunk is read
+    (and unwrapped) when opening the directory, the rows of a chunk are
+    loaded when a time range that overlaps it is read and the last chunks
+    are kept."""
+
+    def __init__(self, directory, cached_chunks=CACHED_CHUNKS):
+        self._logs = {}
+        self._sessions = []
+        # Loaded chunks by log and chunk number, oldest first
+        self._cache = {}
+        self._cached_chunks = cached_chunks
+
+        files, segments, sessions = _session_files(directory)
+        for key, path in sessions.items():
+            try:
+                reader = LogSessionReader(path)
+                self._sessions.append(reader)
+                for block in reader.blocks:
+                    self._logs["{}/{}".format(key, block)] = _SessionChunks(
+                        reader, block)
+            except Exception as e:
+                logger.warning("Could not read [%s]: %s", path, e)
+        for key, path in files.items():
+            try:
+                if os.path.isdir(path):
+                    self._logs[key] = _NpzChunks(path)
+                elif path.endswith(".parquet"):
+                    self._logs[key] = _ParquetChunks(path)
+                else:
+                    self._logs[key] = _CsvChunks([path])
+            except Exception as e:
+                logger.warning("Could not read [%s]: %s", path, e)
+        for key, paths in segments.items():
+            try:
+                self._logs[key] = _CsvChunks(paths)
+            except Exception as e:
+                logger.warning("Could not read [%s]: %s", paths[0], e)
+
+        # The chunk times are unwrapped for each log, move them to the time
+        # base of the directory. The rows are unwrapped from them when read.
+        timed = [log for log in self._logs.values() if len(log.times)]
+        shifts = _time_shifts([(log.times[0, 0], log.times[-1, 1])
+                               for log in timed])
+        for log, shift in zip(timed, shifts):
+            log.times = log.times + shift
+
+    @property
+    def blocks(self):
+        """Names of the logs in the directory"""
+        return list(self._logs)
+
+    def columns(self, block):
+        """Names of the columns of a log"""
+        return list(self._logs[block].names)
+
+    def time_range(self):
+        """Return the first and last timestamp in the directory, None if
+        there is no data"""
+        times = [log.times for log in self._logs.values() if len(log.times)]
+        if not times:
+            return None
+        return (int(min(t[:, 0].min() for t in times)),
+                int(max(t[:, 1].max() for t in times)))
+
+    def _read_chunk(self, block, i):
+        key = (block, i)
+        if key in self._cache:
+            self._cache[key] = self._cache.pop(key)
+        else:
+            log = self._logs[block]
+            self._cache[key] = _unwrap_chunk(log.read(i), log.times[i, 0])
+            while len(self._cache) > self._cached_chunks:
+                del self._cache[next(iter(self._cache))]
+        return self._cache[key]
+
+    def read(self, start=None, end=None, blocks=None):
+        """Return the rows with a timestamp from start to end (inclusive)
+        of the logs (by default all) as a dict with the log name as key
+        and a dict with an array per column as value"""
+        result = {}
+        for name in blocks if blocks is not None else self._logs:
+            times = self._logs[name].times
+            first = 0
+            last = len(times)
+            if start is not None:
+                first = numpy.searchsorted(times[:, 1], start, "left")
+            if end is not None:
+                last = numpy.searchsorted(times[:, 0], end, "right")
+            parts = [self._read_chunk(name, i) for i in range(first, last)]
+            if not parts:
+                result[name] = {n: numpy.empty(0) for n in self.columns(name)}
+                result[name][TIMESTAMP_COLUMN] = numpy.empty(
+                    0, dtype=TIMESTAMP_DTYPE)
+                continue
+            columns = {n: numpy.concatenate([p[n] for p in parts])
+                       for n in parts[0]}
+            ts = columns[TIMESTAMP_COLUMN]
+            mask = numpy.ones(len(ts), dtype=bool)
+            if start is not None:
+                mask &= ts >= start
+            if end is not None:
+                mask &= ts <= end
+            result[name] = {n: values[mask] for n, values in columns.items()}
+        return result
+
+    def close(self):
+        for log in self._logs.values():
+            log.close()
+        for reader in self._sessions:
+            reader.close()
+        self._cache = {}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Print a summary of the logs in a session directory")
+    parser.add_argument("directory", help="Session directory")
+    args = parser.parse_args()
+
+    for name, columns in load_session(args.directory).items():
+        ts = columns[TIMESTAMP_COLUMN]
+        print("{}: {} rows".format(name, len(ts)))
+        for column, values in columns.items():
+            print("  {} ({})".format(column, values.dtype))
+
+
+if __name__ == "__main__":
+    main()
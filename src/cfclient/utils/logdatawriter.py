@@ -28,56 +28,509 @@
 
 """
 Used to write log data to files.
+
+Log data is written as CSV by default. The columnar formats store each
+variable as an array with the type the variable is fetched as: npz writes
+the rows in chunks to a directory of .npz files and parquet (if pyarrow is
+installed) writes one file with a row group per chunk. Use
+cfclient.utils.logdataloader to read the files back.
+
+CSV files can be compressed while they are written, with gzip or with zstd
+if zstandard is installed. The compressed stream is synced every
+SYNC_INTERVAL seconds, so a crash loses at most the data since the last
+sync. The columnar formats compress each chunk instead.
+
+For recordings that have to survive a crash or power loss the files can be
+fsynced at an interval and CSV files can be split in segments by size or
+time. cfclient.utils.logrecovery repairs files that were not closed.
+
+The LogSessionWriter writes all blocks of a session to one .cflog file
+instead. It holds a stream per block, the rows written in chunks, and ends
+with an index of the chunks and the timestamps they cover.
 """
 
 import os
 import datetime
+import gzip
+import io
+import json
+import struct
+from operator import itemgetter
+from threading import Condition
+from threading import Thread
+import time
 
 import logging
 
+import numpy
+
 import cfclient
+from cflib.crazyflie.log import LogTocElement
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Errors raised when reading past the end of a truncated compressed file
+TRUNCATED_ERRORS = (EOFError,)
+if zstandard is not None:
+    TRUNCATED_ERRORS += (zstandard.ZstdError,)
 
 __author__ = 'Bitcraze AB'
-__all__ = ['LogWriter']
+__all__ = ['LogWriter', 'LogSessionWriter', 'LOG_FORMATS',
+           'LOG_COMPRESSIONS', 'log_columns', 'log_dtype', 'log_raw_dtype',
+           'nearest_timestamp', 'open_log_file', 'unwrap_timestamps',
+           'write_session_index']
 
 logger = logging.getLogger(__name__)
 
+LOG_FORMAT_CSV = "csv"
+LOG_FORMAT_NPZ = "npz"
+LOG_FORMAT_PARQUET = "parquet"
+LOG_FORMATS = (LOG_FORMAT_CSV, LOG_FORMAT_NPZ, LOG_FORMAT_PARQUET)
+
+LOG_COMPRESSION_GZIP = "gzip"
+LOG_COMPRESSION_ZSTD = "zstd"
+LOG_COMPRESSIONS = (LOG_COMPRESSION_GZIP, LOG_COMPRESSION_ZSTD)
+# File extension added for each compression
+_COMPRESSION_EXTENSIONS = {LOG_COMPRESSION_GZIP: ".gz",
+                           LOG_COMPRESSION_ZSTD: ".zst"}
+# Level used if none is given
+_COMPRESSION_LEVELS = {LOG_COMPRESSION_GZIP: 6,
+                       LOG_COMPRESSION_ZSTD: 3}
+
+# Max time (s) data is buffered before it's written to the file
+FLUSH_INTERVAL = 1.0
+# Amount of buffered data (characters) that causes a write before the flush
+# interval has passed
+MAX_BUFFER = 64 * 1024
+# Max time (s) between sync points of a compressed file
+SYNC_INTERVAL = 5.0
+# Name of a segment of a CSV file, inserted before the extension
+SEGMENT_NAME = ".{:04d}"
+# Number of rows in a chunk of the columnar formats. A chunk is also written
+# when CHUNK_INTERVAL seconds have passed since the last one.
+CHUNK_ROWS = 10000
+CHUNK_INTERVAL = 10.0
+
+TIMESTAMP_COLUMN = "Timestamp"
+TIMESTAMP_DTYPE = "<u4"
+# Range of the Crazyflie log timestamps (ms), they are sent as 24 bits and
+# wrap about every 4.66 hours
+TIMESTAMP_RANGE = 1 << 24
+NPZ_CHUNK_NAME = "chunk-{:05d}.npz"
+
+# Session files start with the magic and version, followed by records. A
+# record header holds the type, stream id, number of rows, first and last
+# timestamp and the size of the data that follows it. The rows hold the
+# timestamps as sent by the Crazyflie while the first and last timestamps
+# of the records and the index are unwrapped, so they keep increasing when
+# the Crazyflie timestamps wrap. Schema records
+# describe a stream as JSON, chunk records hold rows as packed structured
+# arrays and the index record lists the streams and chunks as JSON. The
+# file ends with the offset of the index record and the index magic.
+SESSION_EXTENSION = ".cflog"
+SESSION_MAGIC = b"CFLS"
+SESSION_VERSION = 1
+SESSION_HEADER = struct.Struct("<4sH")
+SESSION_RECORD = struct.Struct("<BHIIIQ")
+SESSION_TRAILER = struct.Struct("<Q4s")
+SESSION_INDEX_MAGIC = b"CFLX"
+RECORD_SCHEMA = 1
+RECORD_CHUNK = 2
+RECORD_INDEX = 3
+
+# Numpy types of the log variable types
+_DTYPES = {"uint8_t": "<u1",
+           "uint16_t": "<u2",
+           "uint32_t": "<u4",
+           "int8_t": "<i1",
+           "int16_t": "<i2",
+           "int32_t": "<i4",
+           "FP16": "<f2",
+           "float": "<f4"}
+
+
+def _compression_of(filename):
+    for compression, ext in _COMPRESSION_EXTENSIONS.items():
+        if filename.endswith(ext):
+            return compression
+    return None
+
+
+def open_log_file(filename, mode="r", level=None):
+    """Open a text log file for reading ("r") or writing ("w"), or for
+    reading or writing bytes ("rb", "wb"), files ending with .gz or .zst
+    are (de)compressed on the fly"""
+    compression = _compression_of(filename)
+    if compression is None:
+        return open(filename, mode)
+    if level is None:
+        level = _COMPRESSION_LEVELS[compression]
+    if compression == LOG_COMPRESSION_GZIP:
+        if mode in ("w", "wb"):
+            return gzip.open(filename, "wb" if mode == "wb" else "wt",
+                             compresslevel=level)
+        return gzip.open(filename, "rb" if mode == "rb" else "rt")
+    if zstandard is None:
+        raise Exception("zstd compressed logs need zstandard")
+    if mode in ("w", "wb"):
+        stream = zstandard.ZstdCompressor(level=level).stream_writer(
+            open(filename, "wb"))
+        if mode == "wb":
+            return stream
+    else:
+        stream = zstandard.ZstdDecompressor().stream_reader(
+            open(filename, "rb"))
+        if mode == "rb":
+            return io.BufferedReader(stream)
+    return io.TextIOWrapper(stream)
+
+
+def log_dtype(variables):
+    """Return the structured numpy type of the rows of a log block with the
+    variables, a timestamp column followed by one column per variable"""
+    return numpy.dtype(
+        [(TIMESTAMP_COLUMN, TIMESTAMP_DTYPE)] +
+        [(v.name, _DTYPES[LogTocElement.get_cstring_from_id(v.fetch_as)])
+         for v in variables])
+
+
+def log_raw_dtype(dtype):
+    """Return the type the rows of a log dtype are built with from the
+    values of log callbacks. FP16 variables arrive as the int16 bits of the
+    half float, so their columns are int16 and arrays of the raw type are
+    viewed as dtype to decode them."""
+    return numpy.dtype([(n, "<i2" if dtype[n] == numpy.float16 else dtype[n])
+                        for n in dtype.names])
+
+
+def unwrap_timestamps(ts, previous=None):
+    """Return the Crazyflie timestamps ts as int64 with the wraps of the 24
+    bit timestamps removed. previous is the timestamp and the unwrapped
+    timestamp of the row before ts, to continue from earlier rows."""
+    ts = numpy.asarray(ts, dtype=numpy.int64)
+    if not len(ts):
+        return ts
+    if previous is None:
+        previous = (ts[0], ts[0])
+    deltas = numpy.diff(ts, prepend=previous[0]) % TIMESTAMP_RANGE
+    deltas[0] += previous[1]
+    return numpy.cumsum(deltas)
+
+
+def nearest_timestamp(ts, reference):
+    """Return the unwrapped timestamp of the Crazyflie timestamp ts that
+    is closest to reference, the timestamp and unwrapped timestamp of a row
+    of any block of the same Crazyflie"""
+    half = TIMESTAMP_RANGE // 2
+    return int(reference[1] +
+               (int(ts) - int(reference[0]) + half) % TIMESTAMP_RANGE - half)
+
+
+def log_columns(names):
+    """Return a function that returns the values of the variables with the
+    names, in order, as a tuple from the data of a log callback"""
+    if len(names) == 1:
+        name = names[0]
+        return lambda data: (data[name],)
+    elif names:
+        return itemgetter(*names)
+    return lambda data: ()
+
+
+class _BufferThread(Thread):
+    """Writes data in batches. The data is buffered in memory and written
+    when the interval has passed or the limit is reached, so the threads
+    adding data never wait for the disk."""
+
+    def __init__(self, name, interval, limit, fsync_interval=None):
+        super(_BufferThread, self).__init__(daemon=True)
+        self.name = name
+        self._interval = interval
+        if fsync_interval:
+            self._interval = min(interval, fsync_interval)
+        self._limit = limit
+        self._fsync_interval = fsync_interval
+        self._fsynced = time.monotonic()
+        self._buffer = []
+        self._size = 0
+        self._closing = False
+        self._cond = Condition()
+
+    def _add(self, data, size):
+        with self._cond:
+            self._buffer.append(data)
+            self._size += size
+            if self._size >= self._limit:
+                self._cond.notify()
+
+    def close(self):
+        """Write the remaining data, close the file and end the thread"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self.join()
+
+    def run(self):
+        closing = False
+        while not closing:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closing or self._size >= self._limit,
+                    self._interval)
+                closing = self._closing
+                data = self._buffer
+                self._buffer = []
+                self._size = 0
+            try:
+                self._write_batch(data)
+            except (IOError, ValueError) as e:
+                logger.error("Could not write to [%s]: %s", self.name, e)
+        try:
+            self._finish()
+        except IOError as e:
+            logger.error("Could not close [%s]: %s", self.name, e)
+
+    def _write_batch(self, data):
+        raise NotImplementedError()
+
+    def _finish(self):
+        pass
+
+    def _fsync(self, file, force=False):
+        """Flush the file and make sure it's on the disk if fsync is
+        enabled and the fsync interval has passed"""
+        if self._fsync_interval is None:
+            return
+        now = time.monotonic()
+        if force or now - self._fsynced >= self._fsync_interval:
+            file.flush()
+            os.fsync(file.fileno())
+            self._fsynced = now
+
+
+class _BufferedFileThread(_BufferThread):
+    """Writes text to a file in batches. The file is flushed at most every
+    sync_interval seconds, for compressed files a flush is a sync point.
+
+    Files are opened by open_segment with the number of the segment, a new
+    segment is started when segment_size characters have been written or
+    segment_time seconds have passed. Each segment starts with the
+    header."""
+
+    def __init__(self, open_segment, header="", flush_interval=FLUSH_INTERVAL,
+                 max_buffer=MAX_BUFFER, sync_interval=0, fsync_interval=None,
+                 segment_size=None, segment_time=None):
+        self._open_segment = open_segment
+        self._header = header
+        self._segment_size = segment_size
+        self._segment_time = segment_time
+        self._segment = 0
+        self._open()
+        super(_BufferedFileThread, self).__init__(
+            getattr(self._file, "name", "log file"), flush_interval,
+            max_buffer, fsync_interval)
+        self._sync_interval = sync_interval
+        self._synced = time.monotonic()
+
+    def _open(self):
+        self._file = self._open_segment(self._segment)
+        self._file.write(self._header)
+        self._written = len(self._header)
+        self._opened = time.monotonic()
+
+    def _rotate(self, now):
+        if ((self._segment_size and self._written >= self._segment_size) or
+                (self._segment_time and
+                 now - self._opened >= self._segment_time)):
+            self._fsync(self._file, True)
+            self._file.close()
+            self._segment += 1
+            self._open()
+
+    def write(self, data):
+        self._add(data, len(data))
+
+    def _write_batch(self, data):
+        if data:
+            now = time.monotonic()
+            self._rotate(now)
+            data = "".join(data)
+            self._file.write(data)
+            self._written += len(data)
+            if now - self._synced >= self._sync_interval:
+                self._file.flush()
+                self._synced = now
+            self._fsync(self._file)
+
+    def _finish(self):
+        self._fsync(self._file, True)
+        self._file.close()
+
+
+class _ColumnarFileThread(_BufferThread):
+    """Writes rows as typed columns in chunks, either as .npz files in a
+    directory or as row groups of a Parquet file"""
+
+    def __init__(self, path, dtype, file_format, chunk_rows=CHUNK_ROWS,
+                 chunk_interval=CHUNK_INTERVAL, compression=None,
+                 level=None, fsync_interval=None):
+        super(_ColumnarFileThread, self).__init__(path, chunk_interval,
+                                                  chunk_rows, fsync_interval)
+        self._path = path
+        self._dtype = dtype
+        self._raw_dtype = log_raw_dtype(dtype)
+        self._format = file_format
+        self._compression = compression
+        self._chunks = 0
+        self._parquet = None
+        if file_format == LOG_FORMAT_NPZ:
+            os.makedirs(path, exist_ok=True)
+        else:
+            self._schema = pyarrow.schema(
+                [(n, pyarrow.from_numpy_dtype(dtype[n]))
+                 for n in dtype.names])
+            self._parquet_file = open(path, "wb")
+            self._parquet = pyarrow.parquet.ParquetWriter(
+                self._parquet_file, self._schema,
+                compression=compression or "none",
+                compression_level=level if compression else None)
+
+    def write(self, row):
+        self._add(row, 1)
+
+    def _write_batch(self, rows):
+        for i in range(0, len(rows), self._limit):
+            self._write_chunk(rows[i:i + self._limit])
+
+    def _write_chunk(self, rows):
+        rows = numpy.array(rows, dtype=self._raw_dtype).view(self._dtype)
+        if self._parquet:
+            self._parquet.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(rows[n]) for n in self._dtype.names],
+                schema=self._schema))
+            self._fsync(self._parquet_file)
+        else:
+            save = numpy.savez_compressed if self._compression else \
+                numpy.savez
+            # Chunks are written to a temporary file and renamed when they
+            # are complete, so a crash never leaves a partial chunk
+            name = os.path.join(self._path,
+                                NPZ_CHUNK_NAME.format(self._chunks))
+            with open(name + ".tmp", "wb") as f:
+                save(f, **{n: rows[n] for n in self._dtype.names})
+                self._fsync(f, True)
+            os.replace(name + ".tmp", name)
+        self._chunks += 1
+
+    def _finish(self):
+        # Keep an empty chunk if there's no data so the file holds the types
+        if not self._chunks:
+            self._write_chunk([])
+        if self._parquet:
+            self._parquet.close()
+            self._fsync(self._parquet_file, True)
+            self._parquet_file.close()
+
 
 class LogWriter():
     """Create a writer for a specific log block"""
 
-    def __init__(self, logblock, connected_ts=None, directory=None):
-        """Initialize the writer"""
+    def __init__(self, logblock, connected_ts=None, directory=None,
+                 flush_interval=FLUSH_INTERVAL, max_buffer=MAX_BUFFER,
+                 file_format=LOG_FORMAT_CSV, chunk_rows=CHUNK_ROWS,
+                 compression=None, compression_level=None,
+                 sync_interval=SYNC_INTERVAL, fsync_interval=None,
+                 segment_size=None, segment_time=None):
+        """Initialize the writer. CSV rows are written to the file at least
+        every flush_interval seconds, or when max_buffer characters are
+        buffered. The columnar formats write a chunk every chunk_rows rows,
+        or every CHUNK_INTERVAL seconds. A compressed CSV file is synced
+        every sync_interval seconds, npz chunks are always compressed with
+        the default level.
+
+        If fsync_interval is given the data is fsynced at most that many
+        seconds after it's written, 0 fsyncs after every batch of rows the
+        writer thread writes. CSV files are split in segments of
+        segment_size characters or segment_time seconds if given.
+
+        The files are written to a directory named after connected_ts (by
+        default the time the writer is created) in the logdata directory
+        of the configuration, or to directory if given."""
+        if file_format not in LOG_FORMATS:
+            raise ValueError("Unknown log file format [{}]".format(
+                file_format))
+        if compression and compression not in LOG_COMPRESSIONS:
+            raise ValueError("Unknown log compression [{}]".format(
+                compression))
+        if file_format == LOG_FORMAT_PARQUET and pyarrow is None:
+            raise Exception("Writing Parquet files needs pyarrow")
+        if (compression == LOG_COMPRESSION_ZSTD and zstandard is None and
+                file_format == LOG_FORMAT_CSV):
+            raise Exception("zstd compressed logs need zstandard")
         self._block = logblock
         self._dir = directory
         self._connected_ts = connected_ts
+        self._flush_interval = flush_interval
+        self._max_buffer = max_buffer
+        self._format = file_format
+        self._chunk_rows = chunk_rows
+        self._compression = compression or None
+        self._compression_level = compression_level
+        self._sync_interval = sync_interval
+        self._fsync_interval = fsync_interval
+        self._segment_size = segment_size
+        self._segment_time = segment_time
 
-        self._dir = os.path.join(cfclient.config_path, "logdata",
-                                 connected_ts.strftime("%Y%m%dT%H-%M-%S"))
+        if directory is None:
+            if connected_ts is None:
+                connected_ts = datetime.datetime.now()
+            self._dir = os.path.join(
+                cfclient.config_path, "logdata",
+                connected_ts.strftime("%Y%m%dT%H-%M-%S"))
         self._file = None
+        self._header = ""
         self._header_written = False
         self._header_values = []
         self._filename = None
+        self._row_format = None
+        self._columns = None
 
     def _write_header(self):
-        """Write the header to the file"""
+        """Create the header of the file"""
         if not self._header_written:
-            s = "Timestamp"
+            s = TIMESTAMP_COLUMN
             for v in self._block.variables:
                 s += "," + v.name
                 self._header_values.append(v.name)
             s += '\n'
-            self._file.write(s)
+            self._header = s
             self._header_written = True
+            # Rows are formatted in one go, %s gives the same result as str()
+            self._row_format = "%d" + ",%s" * len(self._header_values) + "\n"
+            self._columns = log_columns(self._header_values)
 
     def _new_data(self, timestamp, data, logconf):
         """Callback when new data arrives from the Crazyflie"""
-        if self._file:
-            s = "%d" % timestamp
-            for col in self._header_values:
-                s += "," + str(data[col])
-            s += '\n'
-            self._file.write(s)
+        writer = self._file
+        if writer:
+            writer.write(self._row_format % (
+                (timestamp,) + self._columns(data)))
+
+    def _new_row(self, timestamp, data, logconf):
+        """Callback when new data arrives from the Crazyflie, for the
+        columnar formats"""
+        writer = self._file
+        if writer:
+            writer.write((timestamp,) + self._columns(data))
 
     def writing(self):
         """Return True if the file is open and we are using it,
@@ -87,14 +540,19 @@ class LogWriter():
     def stop(self):
         """Stop the logging to file"""
         if self._file:
+            self._block.data_received_cb.remove_callback(self._callback())
             self._file.close()
             self._file = None
-            self._block.data_received_cb.remove_callback(self._new_data)
             logger.info("Stopped logging of block [%s] to file [%s]",
                         self._block.name, self._filename)
             self._header_values = []
             self._header_written = False
 
+    def _callback(self):
+        if self._format == LOG_FORMAT_CSV:
+            return self._new_data
+        return self._new_row
+
     def start(self):
         """Start the logging to file"""
 
@@ -107,12 +565,211 @@ class LogWriter():
         if not self._file:
             time_now = datetime.datetime.now()
             block_name_corr = self._block.name.replace('/', '-')
-            name = "{0}-{1}.csv".format(block_name_corr,
-                                        time_now.strftime(
-                                            "%Y%m%dT%H-%M-%S"))
-            self._filename = os.path.join(self._dir, name)
-            self._file = open(self._filename, 'w')
+            name = "{0}-{1}".format(block_name_corr,
+                                    time_now.strftime("%Y%m%dT%H-%M-%S"))
+            base = os.path.join(self._dir, name)
+            ext = ""
+            if self._format != LOG_FORMAT_NPZ:
+                ext = "." + self._format
+            if self._format == LOG_FORMAT_CSV and self._compression:
+                ext += _COMPRESSION_EXTENSIONS[self._compression]
+            self._filename = base + ext
             self._write_header()
-            self._block.data_received_cb.add_callback(self._new_data)
+            if self._format == LOG_FORMAT_CSV:
+                segmented = self._segment_size or self._segment_time
+
+                def open_segment(segment):
+                    filename = self._filename
+                    if segmented:
+                        filename = base + SEGMENT_NAME.format(segment) + ext
+                    return open_log_file(filename, 'w',
+                                         self._compression_level)
+
+                sync_interval = self._sync_interval if self._compression \
+                    else 0
+                self._file = _BufferedFileThread(
+                    open_segment, self._header, self._flush_interval,
+                    self._max_buffer, sync_interval, self._fsync_interval,
+                    self._segment_size, self._segment_time)
+            else:
+                self._file = _ColumnarFileThread(
+                    self._filename, log_dtype(self._block.variables),
+                    self._format, self._chunk_rows,
+                    compression=self._compression,
+                    level=self._compression_level,
+                    fsync_interval=self._fsync_interval)
+            self._file.start()
+            self._block.data_received_cb.add_callback(self._callback())
             logger.info("Started logging of block [%s] to file [%s]",
                         self._block.name, self._filename)
+
+
+def write_session_record(file, kind, stream, data, rows=0, first=0, last=0):
+    """Write a record to a session file and return its offset"""
+    offset = file.tell()
+    file.write(SESSION_RECORD.pack(kind, stream, rows, first, last,
+                                   len(data)))
+    file.write(data)
+    return offset
+
+
+def write_session_index(file, streams, chunks):
+    """Write the index record and the trailer that end a session file"""
+    index = json.dumps({"streams": streams,
+                        "chunks": chunks}).encode("utf-8")
+    offset = write_session_record(file, RECORD_INDEX, 0, index)
+    file.write(SESSION_TRAILER.pack(offset, SESSION_INDEX_MAGIC))
+
+
+class _SessionFileThread(_BufferThread):
+    """Writes the rows of several streams to a session file in chunks"""
+
+    def __init__(self, file, chunk_rows=CHUNK_ROWS,
+                 chunk_interval=CHUNK_INTERVAL, fsync_interval=None):
+        super(_SessionFileThread, self).__init__(file.name, chunk_interval,
+                                                 chunk_rows, fsync_interval)
+        self._file = file
+        self._dtypes = {}
+        self._new_streams = []
+        self._streams = []
+        self._chunks = []
+        # Timestamp and unwrapped timestamp of the newest row of all
+        # streams, the streams are unwrapped from it so blocks added after
+        # the timestamps wrapped share the time base of the others
+        self._reference = None
+        file.write(SESSION_HEADER.pack(SESSION_MAGIC, SESSION_VERSION))
+
+    def add_stream(self, stream, name, dtype):
+        """Add a stream, rows for it can be written after this"""
+        with self._cond:
+            self._dtypes[stream] = dtype
+            self._new_streams.append({"id": stream, "name": name,
+                                      "dtype": dtype.descr})
+
+    def write(self, stream, row):
+        self._add((stream, row), 1)
+
+    def _write_record(self, kind, stream, data, rows=0, first=0, last=0):
+        return write_session_record(self._file, kind, stream, data, rows,
+                                    first, last)
+
+    def _write_batch(self, data):
+        with self._cond:
+            streams = self._new_streams
+            self._new_streams = []
+        for schema in streams:
+            self._write_record(RECORD_SCHEMA, schema["id"],
+                               json.dumps(schema).encode("utf-8"))
+            self._streams.append(schema)
+
+        rows = {}
+        for stream, row in data:
+            rows.setdefault(stream, []).append(row)
+        for stream, stream_rows in rows.items():
+            for i in range(0, len(stream_rows), self._limit):
+                chunk = numpy.array(
+                    stream_rows[i:i + self._limit],
+                    dtype=log_raw_dtype(self._dtypes[stream])).view(
+                    self._dtypes[stream])
+                raw = chunk[TIMESTAMP_COLUMN]
+                first = raw[0]
+                if self._reference:
+                    first = nearest_timestamp(raw[0], self._reference)
+                ts = unwrap_timestamps(raw, (raw[0], first))
+                if not self._reference or ts[-1] > self._reference[1]:
+                    self._reference = (raw[-1], ts[-1])
+                offset = self._write_record(
+                    RECORD_CHUNK, stream, chunk.tobytes(), len(chunk),
+                    ts[0], ts[-1])
+                self._chunks.append(
+                    [stream, offset, len(chunk), int(ts[0]), int(ts[-1])])
+        if data or streams:
+            self._file.flush()
+            self._fsync(self._file)
+
+    def _finish(self):
+        write_session_index(self._file, self._streams, self._chunks)
+        self._fsync(self._file, True)
+        self._file.close()
+
+
+class LogSessionWriter():
+    """Write the data of several log blocks to one session file"""
+
+    def __init__(self, filename, chunk_rows=CHUNK_ROWS,
+                 chunk_interval=CHUNK_INTERVAL, fsync_interval=None):
+        """Initialize the writer. A chunk is written for each block every
+        chunk_rows rows, or every chunk_interval seconds. The file is
+        fsynced at most every fsync_interval seconds if given."""
+        self._filename = filename
+        self._chunk_rows = chunk_rows
+        self._chunk_interval = chunk_interval
+        self._fsync_interval = fsync_interval
+        self._file = None
+        self._blocks = {}
+        self._names = set()
+
+    def add_block(self, logblock):
+        """Start writing the data of a block, the block keeps its stream if
+        it's added again"""
+        if not self._file:
+            raise Exception("The session is not started")
+        if logblock in self._blocks:
+            stream, callback = self._blocks[logblock]
+            if callback:
+                return
+        else:
+            stream = len(self._blocks)
+            name = logblock.name
+            n = 1
+            while name in self._names:
+                n += 1
+                name = "{}-{}".format(logblock.name, n)
+            self._names.add(name)
+            self._file.add_stream(stream, name, log_dtype(logblock.variables))
+
+        columns = log_columns([v.name for v in logblock.variables])
+        writer = self._file
+
+        def callback(timestamp, data, logconf):
+            writer.write(stream, (timestamp,) + columns(data))
+
+        self._blocks[logblock] = (stream, callback)
+        logblock.data_received_cb.add_callback(callback)
+        logger.info("Started logging of block [%s] to session [%s]",
+                    logblock.name, self._filename)
+
+    def remove_block(self, logblock):
+        """Stop writing the data of a block"""
+        stream, callback = self._blocks.get(logblock, (None, None))
+        if callback:
+            logblock.data_received_cb.remove_callback(callback)
+            self._blocks[logblock] = (stream, None)
+
+    def writing(self):
+        """Return True if the file is open and we are using it,
+        otherwise false"""
+        return True if self._file else False
+
+    def start(self):
+        """Create the session file"""
+        if not self._file:
+            directory = os.path.dirname(self._filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = _SessionFileThread(open(self._filename, 'wb'),
+                                            self._chunk_rows,
+                                            self._chunk_interval,
+                                            self._fsync_interval)
+            self._file.start()
+
+    def stop(self):
+        """Stop writing all blocks and close the session file"""
+        if self._file:
+            for logblock in list(self._blocks):
+                self.remove_block(logblock)
+            self._file.close()
+            self._file = None
+            self._blocks = {}
+            self._names = set()
+            logger.info("Closed session [%s]", self._filename)
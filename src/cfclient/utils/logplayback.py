@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+
+"""
+Playback of the logs in a session directory.
+
+The position of the playback moves with the time of the logs, speed times
+faster than real time. The rows that have been played since the last call
+are returned by advance(), read in chunks by a LogDirectoryReader so only
+the data around the position is kept in memory. The positions are
+unwrapped timestamps as returned by the reader, so the playback continues
+past a wrap of the 24 bit Crazyflie timestamps.
+"""
+
+import logging
+import math
+
+from cfclient.utils.logdataloader import LogDirectoryReader
+
+__author__ = 'Bitcraze AB'
+__all__ = ['LogPlayback']
+
+logger = logging.getLogger(__name__)
+
+# Playback speeds, times real time
+SPEEDS = (1, 2, 5, 10, 20, 50)
+
+
+class LogPlayback():
+    """Plays back the logs of a session directory"""
+
+    def __init__(self, directory):
+        """Open the session directory, the playback is paused at the first
+        timestamp of the logs"""
+        self.reader = LogDirectoryReader(directory)
+        time_range = self.reader.time_range()
+        if time_range is None:
+            self.reader.close()
+            raise ValueError("No log data in [{}]".format(directory))
+        self.start, self.end = time_range
+        self.speed = 1
+        self.playing = False
+        # Unwrapped timestamp of the last row played, in ms
+        self._position = float(self.start)
+
+    @property
+    def position(self):
+        """Timestamp of the last row that has been played"""
+        return int(math.floor(self._position))
+
+    @property
+    def blocks(self):
+        """Names of the logs that are played"""
+        return self.reader.blocks
+
+    def play(self):
+        """Start playing from the position, from the start if the end has
+        been reached"""
+        if self.position >= self.end:
+            self.seek(self.start)
+        self.playing = True
+
+    def pause(self):
+        self.playing = False
+
+    def seek(self, ts):
+        """Move the position to the timestamp ts"""
+        self._position = float(min(max(ts, self.start), self.end))
+
+    def set_speed(self, speed):
+        """Set the speed, times real time"""
+        self.speed = speed
+
+    def advance(self, elapsed):
+        """
+        Move the position elapsed seconds times the speed forward if
+        playing and return the rows played, as a dict with the log name as
+        key and a dict with an array per column as value. The playback is
+        paused at the end of the logs.
+        """
+        if not self.playing:
+            return {}
+        last = self.position
+        self._position = min(self._position + elapsed * 1000.0 * self.speed,
+                             self.end)
+        if self.position >= self.end:
+            self.playing = False
+        if self.position == last:
+            return {}
+        return self.reader.read(last + 1, self.position)
+
+    def history(self, duration):
+        """Return the rows of the duration in ms up to the position"""
+        return self.reader.read(max(self.position - duration, self.start),
+                                self.position)
+
+    def close(self):
+        self.reader.close()
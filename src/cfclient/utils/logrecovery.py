@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+
+"""
+Checks and repairs log files that were not closed, for instance because the
+client crashed or the computer lost power while recording.
+
+CSV files are cut after the last complete row (compressed files are
+recompressed up to their last sync point), npz chunks that can't be read
+are renamed to .bad and session files get a new index. Parquet files can
+only be checked, a file without its footer can't be repaired.
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+import logging
+
+import numpy
+
+from cfclient.utils.logdataloader import LogSessionReader
+from cfclient.utils.logdatawriter import SESSION_EXTENSION
+from cfclient.utils.logdatawriter import TRUNCATED_ERRORS
+from cfclient.utils.logdatawriter import open_log_file
+from cfclient.utils.logdatawriter import write_session_index
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+__author__ = 'Bitcraze AB'
+__all__ = ['recover', 'RECOVERY_OK', 'RECOVERY_REPAIRED', 'RECOVERY_DAMAGED']
+
+logger = logging.getLogger(__name__)
+
+RECOVERY_OK = "ok"
+RECOVERY_REPAIRED = "repaired"
+RECOVERY_DAMAGED = "damaged"
+
+
+def _recover_csv(path, dry_run):
+    # The file is read as bytes so the rows are cut at their exact offset,
+    # whatever line endings they were written with
+    compressed = path.endswith((".gz", ".zst"))
+    lines = []
+    truncated = False
+    with open_log_file(path, "rb") as f:
+        header = f.readline()
+        try:
+            for line in f:
+                lines.append(line)
+        except TRUNCATED_ERRORS:
+            truncated = True
+    if not header.endswith(b"\n"):
+        return RECOVERY_DAMAGED, "no header"
+
+    # Keep the rows up to the first one that is incomplete, rows written
+    # before a power loss can end up as zeros
+    separators = header.count(b",")
+    rows = 0
+    for line in lines:
+        if (not line.endswith(b"\n") or line.count(b",") != separators or
+                b"\0" in line):
+            break
+        rows += 1
+    if rows == len(lines) and not truncated:
+        return RECOVERY_OK, "{} rows".format(rows)
+
+    message = "{} rows kept, {} dropped".format(rows, len(lines) - rows)
+    if dry_run:
+        return RECOVERY_DAMAGED, message
+    if compressed:
+        tmp = path + ".tmp" + os.path.splitext(path)[1]
+        with open_log_file(tmp, "wb") as f:
+            f.write(header)
+            for line in lines[:rows]:
+                f.write(line)
+        os.replace(tmp, path)
+    else:
+        size = len(header) + sum(len(line) for line in lines[:rows])
+        with open(path, "r+b") as f:
+            f.truncate(size)
+    return RECOVERY_REPAIRED, message
+
+
+def _recover_npz(path, dry_run):
+    bad = []
+    for name in glob.glob(os.path.join(path, "*.tmp")):
+        bad.append(name)
+        if not dry_run:
+            os.remove(name)
+    chunks = sorted(glob.glob(os.path.join(path, "chunk-*.npz")))
+    for name in chunks:
+        try:
+            with numpy.load(name) as chunk:
+                for n in chunk.files:
+                    chunk[n]
+        except Exception:
+            bad.append(name)
+            if not dry_run:
+                os.replace(name, name + ".bad")
+    if not bad:
+        return RECOVERY_OK, "{} chunks".format(len(chunks))
+    message = "{} unreadable or partial chunks".format(len(bad))
+    if dry_run:
+        return RECOVERY_DAMAGED, message
+    return RECOVERY_REPAIRED, message
+
+
+def _recover_session(path, dry_run):
+    reader = LogSessionReader(path)
+    try:
+        streams, chunks = reader.index
+        complete = reader.complete
+        end = reader.end
+    finally:
+        reader.close()
+    message = "{} blocks, {} chunks".format(len(streams), len(chunks))
+    if complete:
+        return RECOVERY_OK, message
+    if dry_run:
+        return RECOVERY_DAMAGED, message + ", no index"
+    with open(path, "r+b") as f:
+        f.truncate(end)
+        f.seek(end)
+        write_session_index(f, streams, chunks)
+        f.flush()
+        os.fsync(f.fileno())
+    return RECOVERY_REPAIRED, message + ", index rebuilt"
+
+
+def _recover_parquet(path, dry_run):
+    if pyarrow is None:
+        raise Exception("Checking Parquet files needs pyarrow")
+    try:
+        rows = pyarrow.parquet.ParquetFile(path).metadata.num_rows
+    except Exception as e:
+        return RECOVERY_DAMAGED, str(e)
+    return RECOVERY_OK, "{} rows".format(rows)
+
+
+def recover(path, dry_run=False):
+    """Check and repair a log file, a directory of npz chunks or all logs
+    in a session directory. Return a list of (path, status, message) where
+    status is one of RECOVERY_OK, RECOVERY_REPAIRED or RECOVERY_DAMAGED.
+    With dry_run the files are only checked."""
+    if os.path.isdir(path):
+        if glob.glob(os.path.join(path, "chunk-*.npz*")):
+            return [(path,) + _recover_npz(path, dry_run)]
+        results = []
+        for name in sorted(os.listdir(path)):
+            results += recover(os.path.join(path, name), dry_run)
+        return results
+
+    if path.endswith((".csv", ".csv.gz", ".csv.zst")):
+        recover_file = _recover_csv
+    elif path.endswith(".parquet"):
+        recover_file = _recover_parquet
+    elif path.endswith(SESSION_EXTENSION):
+        recover_file = _recover_session
+    else:
+        return []
+    try:
+        return [(path,) + recover_file(path, dry_run)]
+    except Exception as e:
+        return [(path, RECOVERY_DAMAGED, str(e))]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check and repair log files that were not closed")
+    parser.add_argument("paths", nargs="+",
+                        help="Log files or session directories")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="Only check the files")
+    args = parser.parse_args()
+
+    damaged = False
+    for path in args.paths:
+        for name, status, message in recover(path, args.dry_run):
+            print("{}: {} ({})".format(name, status, message))
+            damaged |= status == RECOVERY_DAMAGED
+    sys.exit(1 if damaged else 0)
+
+
+if __name__ == "__main__":
+    main()
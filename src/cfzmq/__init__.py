@@ -31,17 +31,33 @@ Server used to connect to a Crazyflie using ZMQ.
 
 import sys
 import os
+import json
+import itertools
 import logging
 import signal
+import struct
+import time
+import zlib
 import zmq
 import queue
+from collections import deque
+from threading import Condition
+from threading import Lock
 from threading import Thread
 import cflib.crtp
 from cflib.crazyflie import Crazyflie
+from cflib.crazyflie.commander import Commander
 from cflib.crazyflie.log import LogConfig
+from cflib.crazyflie.log import LogTocElement
 
 import cfclient
 
+try:
+    from cfzmq.shm import LogRingWriter
+except Exception as e:
+    LogRingWriter = None
+    _shm_error = str(e)
+
 if os.name == 'posix':
     print('Disabling standard output for libraries!')
     stdout = os.dup(1)
@@ -52,15 +68,19 @@ if os.name == 'posix':
 #   so it doesn't need a windowing system.
 os.environ["SDL_VIDEODRIVER"] = "dummy"
 
-# Main command socket for control (ping/pong)
+# Main command socket for control (ping/pong), the socket is a ROUTER so
+# both REQ and DEALER clients can be used. Commands containing an "id" get
+# it echoed in the response so several commands can be in flight at once.
 ZMQ_SRV_PORT = 0
-# Log data socket (publish)
+# Log data socket (publish), messages are sent as two frames where the
+# first frame is the name of the log block (used as subscription topic)
 ZMQ_LOG_PORT = 1
 # Param value updated (publish)
 ZMQ_PARAM_PORT = 2
 # Async event for connection, like connection lost (publish)
 ZMQ_CONN_PORT = 3
-# Control set-poins for Crazyflie (pull)
+# Control set-poins for Crazyflie (pull), either JSON or binary frames. In
+# multi mode binary frames are preceded by a frame with the URI.
 ZMQ_CTRL_PORT = 4
 
 # Timeout before giving up when verifying param write
@@ -70,19 +90,411 @@ CONNECT_TIMEOUT = 5
 # Timeout before giving up adding/starting log config
 LOG_TIMEOUT = 10
 
+# First byte of binary control set-point frames
+CTRL_BINARY_MAGIC = 0xCF
+# Header of binary control set-point frames (magic, set-point type), the
+# values follow packed as described by the set-point type
+CTRL_BINARY_HEADER = "<BB"
+
+# Set-point types for the control socket
+SETPOINT_STOP = 0
+SETPOINT_RPYT = 1
+SETPOINT_VELOCITY_WORLD = 2
+SETPOINT_ZDISTANCE = 3
+SETPOINT_HOVER = 4
+SETPOINT_POSITION = 5
+SETPOINT_FULL_STATE = 6
+
+# Max number of queued set-points read before forwarding the newest
+CTRL_MAX_BATCH = 1000
+
+# Set-points sent when no set-point has been received within the timeout
+CTRL_SAFE_STOP = "stop"
+CTRL_SAFE_ZERO_THRUST = "zero-thrust"
+CTRL_SAFE_HOVER = "hover"
+CTRL_SAFES = (CTRL_SAFE_STOP, CTRL_SAFE_ZERO_THRUST, CTRL_SAFE_HOVER)
+# Height (m) used for the hover safe set-point
+CTRL_HOVER_HEIGHT = 0.3
+# Rate (Hz) the safe set-point is resent at while timed out, if set-points
+# are not forwarded at a fixed rate. The Crazyflie stops following
+# set-points that are not sent again within 500 ms.
+CTRL_SAFE_RATE = 10
+
+# Number of messages buffered for the publish sockets before the oldest
+# messages are dropped
+PUB_QUEUE_SIZE = 1000
+
+# Number of commands that can be executed at the same time
+CMD_WORKERS = 4
+# Internal socket used to hand back responses from the command workers
+_CMD_RESP_ADDR = "inproc://cfzmq-cmd-responses"
+
+# Encodings of the log data published on the log socket. With shm the
+# data is written to a ring in shared memory (see cfzmq.shm) and only the
+# sequence number of the newest sample is published.
+LOG_ENCODING_JSON = "json"
+LOG_ENCODING_BINARY = "binary"
+LOG_ENCODING_SHM = "shm"
+LOG_ENCODINGS = (LOG_ENCODING_JSON, LOG_ENCODING_BINARY, LOG_ENCODING_SHM)
+
+# First byte of binary log data frames
+LOG_BINARY_MAGIC = 0xCF
+# Header of binary log data frames (magic, block id, timestamp, sequence
+# number, host timestamp), the values follow packed as described by the
+# schema of the block
+LOG_BINARY_HEADER = "<BHIId"
+
+# Interval (s) of the stats messages published for each started log block
+LOG_STATS_INTERVAL = 1.0
+# Range of the Crazyflie log timestamps (ms), they are sent as 24 bits
+LOG_TIMESTAMP_RANGE = 1 << 24
+
 logger = logging.getLogger(__name__)
 
 
-class _SrvThread(Thread):
+def _log_layout(conf):
+    """Return the struct format of the values in a log configuration and
+    the description of the variables"""
+    fmt = ""
+    variables = []
+    for v in conf.variables:
+        fmt += LogTocElement.get_unpack_string_from_id(v.fetch_as)[1:]
+        variables.append({
+            "name": v.name,
+            "type": LogTocElement.get_cstring_from_id(v.fetch_as)})
+    return (fmt, variables)
+
+
+class _LogBinaryEncoder():
+    """Packs the log data of one block into fixed-layout binary frames"""
+
+    def __init__(self, block_id, conf):
+        self.block_id = block_id
+        self._names = [v.name for v in conf.variables]
+        (fmt, variables) = _log_layout(conf)
+        fmt = LOG_BINARY_HEADER + fmt
+        self._struct = struct.Struct(fmt)
+        self.schema = {"encoding": LOG_ENCODING_BINARY, "id": block_id,
+                       "format": fmt, "variables": variables}
+
+    def encode(self, seq, host_ts, ts, data):
+        return self._struct.pack(LOG_BINARY_MAGIC, self.block_id, ts, seq,
+                                 host_ts,
+                                 *[data[name] for name in self._names])
+
+    def close(self):
+        pass
+
+
+class _LogShmEncoder():
+    """Writes the log data of one block to a ring in shared memory, the
+    published message only tells that new data is available"""
+
+    def __init__(self, block_id, conf, uri):
+        self.block_id = block_id
+        self._names = [v.name for v in conf.variables]
+        (fmt, variables) = _log_layout(conf)
+        self._ring = LogRingWriter(
+            "cfzmq_{}_{}".format(os.getpid(), block_id), fmt, variables)
+        self._uri = uri
+        self._name = conf.name
+        self.schema = {"encoding": LOG_ENCODING_SHM, "id": block_id,
+                       "shm_name": self._ring.name,
+                       "format": self._ring.schema["format"],
+                       "variables": variables}
+
+    def encode(self, seq, host_ts, ts, data):
+        self._ring.write(seq, ts, host_ts,
+                         [data[name] for name in self._names])
+        return {"version": 1, "uri": self._uri, "name": self._name,
+                "event": "shm", "seq": seq}
+
+    def close(self):
+        if self._ring:
+            self._ring.close()
+            self._ring = None
+
+
+class _LogStats():
+    """Counters for the samples of a log block. Samples missed on the radio
+    link are estimated from the gaps in the Crazyflie timestamps, the
+    jitter is the variation of the transit time (as in RFC 3550)."""
+
+    def __init__(self, period):
+        self._period = period
+        self.seq = 0
+        self.published = 0
+        self.dropped = 0
+        self.missed = 0
+        self.jitter = 0.0
+        self._last = None
+        self._reported = (time.time(), 0)
+
+    def sample(self, host_ts, ts):
+        """Count a received sample and return its sequence number"""
+        self.seq += 1
+        if self._last:
+            (last_host_ts, last_ts) = self._last
+            delta = (ts - last_ts) % LOG_TIMESTAMP_RANGE
+            self.missed += max(0, int(round(delta / self._period)) - 1)
+            transit = (host_ts - last_host_ts) * 1000 - delta
+            self.jitter += (abs(transit) - self.jitter) / 16
+        self._last = (host_ts, ts)
+        return self.seq
+
+    def report(self):
+        """Return the counters and the sample rate since the last report"""
+        now = time.time()
+        (last_report, last_seq) = self._reported
+        self._reported = (now, self.seq)
+        return {"received": self.seq, "published": self.published,
+                "dropped": self.dropped, "missed": self.missed,
+                "jitter": round(self.jitter, 3),
+                "rate": round((self.seq - last_seq) / (now - last_report),
+                              3)}
+
+
+class _LogBlock():
+    """A log configuration created through the server"""
+
+    def __init__(self, conf, encoder=None):
+        self.conf = conf
+        self.encoder = encoder
+        self.stats = _LogStats(conf.period_in_ms)
+        # Actions on a block are serialized, since they share the queues
+        # used for waiting on the confirmations
+        self.lock = Lock()
+        self.added_queue = queue.Queue(1)
+        self.started_queue = queue.Queue(1)
+
+    def set_added(self, added):
+        _notify(self.added_queue, added)
+
+    def set_started(self, started):
+        _notify(self.started_queue, started)
+
+
+def _notify(q, value):
+    """Put a value in a single-slot queue, replacing any unconsumed value"""
+    _drain(q)
+    q.put_nowait(value)
+
+
+def _drain(q):
+    """Remove any stale value from a single-slot queue"""
+    try:
+        q.get_nowait()
+    except queue.Empty:
+        pass
+
+
+class _CmdWorkerThread(Thread):
+    """Executes commands and hands the responses back to the server thread"""
+
+    def __init__(self, context, cmd_queue, handler, *args):
+        super(_CmdWorkerThread, self).__init__(*args)
+        self._context = context
+        self._cmd_queue = cmd_queue
+        self._handler = handler
+
+    def run(self):
+        # ZMQ sockets can not be shared, so each worker has its own
+        socket = self._context.socket(zmq.PUSH)
+        socket.connect(_CMD_RESP_ADDR)
+        while True:
+            (envelope, cmd) = self._cmd_queue.get()
+            response = self._handler(cmd)
+            socket.send_multipart(
+                envelope + [json.dumps(response).encode("utf-8")])
+
+
+class _PubQueue():
+    """Messages waiting to be sent on the publish sockets. The queue is
+    bounded and drops the oldest message when full, so a slow network or
+    subscriber never stalls the cflib callbacks."""
+
+    def __init__(self, names, size=PUB_QUEUE_SIZE, wakeup=None):
+        self._size = size
+        self._queue = deque()
+        self._cond = Condition()
+        # Called when a message is queued while the queue is empty, for
+        # consumers that do not wait on the condition
+        self._wakeup = wakeup
+        self._max_depth = 0
+        self._counters = {}
+        for name in names:
+            self._counters[name] = {"queued": 0, "sent": 0, "dropped": 0}
+
+    def publish(self, name, payload, topic=None, stats=None):
+        """Queue a message for the socket called name. The payload is
+        either bytes or a dict that is sent as JSON. If a topic is supplied
+        the message is sent as two frames with the topic first. If stats is
+        supplied its published or dropped counter is updated."""
+        with self._cond:
+            was_empty = not self._queue
+            if len(self._queue) >= self._size:
+                dropped = self._queue.popleft()
+                self._counters[dropped[0]]["dropped"] += 1
+                if dropped[3]:
+                    dropped[3].dropped += 1
+            self._queue.append((name, payload, topic, stats))
+            self._counters[name]["queued"] += 1
+            self._max_depth = max(self._max_depth, len(self._queue))
+            self._cond.notify()
+        if was_empty and self._wakeup:
+            self._wakeup()
+
+    def stats(self):
+        """Return the counters for the queue and each socket"""
+        with self._cond:
+            sockets = {}
+            for name in self._counters:
+                sockets[name] = dict(self._counters[name])
+            return {"size": self._size, "depth": len(self._queue),
+                    "max_depth": self._max_depth, "sockets": sockets}
+
+    def get(self, block=True):
+        """Remove and return all queued messages, if block is set wait
+        until there is at least one"""
+        with self._cond:
+            while block and not self._queue:
+                self._cond.wait()
+            messages = list(self._queue)
+            self._queue.clear()
+            return messages
+
+    def sent(self, messages):
+        """Count messages returned by get as sent"""
+        with self._cond:
+            for (name, _, _, stats) in messages:
+                self._counters[name]["sent"] += 1
+                if stats:
+                    stats.published += 1
+
+    @staticmethod
+    def frames(payload, topic):
+        """Return the frames of a message"""
+        # Encoding is done by the consumer to keep it off the callback
+        # threads
+        if isinstance(payload, dict):
+            payload = json.dumps(payload).encode("utf-8")
+        if topic is None:
+            return [payload]
+        return [topic.encode("utf-8"), payload]
 
-    def __init__(self, socket, log_socket, param_socket, conn_socket, cf,
-                 *args):
-        super(_SrvThread, self).__init__(*args)
-        self._socket = socket
-        self._log_socket = log_socket
-        self._param_socket = param_socket
-        self._conn_socket = conn_socket
-        self._cf = cf
+
+class _PubThread(Thread):
+    """Sends the queued messages on the publish sockets"""
+
+    def __init__(self, sockets, size=PUB_QUEUE_SIZE, *args):
+        super(_PubThread, self).__init__(*args)
+        self._sockets = sockets
+        self._queue = _PubQueue(sockets, size)
+
+    def publish(self, name, payload, topic=None, stats=None):
+        self._queue.publish(name, payload, topic, stats)
+
+    def stats(self):
+        return self._queue.stats()
+
+    def run(self):
+        while True:
+            messages = self._queue.get()
+            for (name, payload, topic, _) in messages:
+                self._sockets[name].send_multipart(
+                    _PubQueue.frames(payload, topic))
+            self._queue.sent(messages)
+
+
+class _TocSnapshot():
+    """The log and param TOC in the form sent to clients"""
+
+    def __init__(self, crc, log_toc, param_toc):
+        self.crc = crc
+        self.log = {}
+        for group in log_toc:
+            self.log[group] = {}
+            for name in log_toc[group]:
+                self.log[group][name] = {"type": log_toc[group][name].ctype}
+        self.param = {}
+        for group in param_toc:
+            self.param[group] = {}
+            for name in param_toc[group]:
+                self.param[group][name] = {
+                    "type": param_toc[group][name].ctype,
+                    "access": "RW" if param_toc[group][
+                        name].access == 0 else "RO"}
+
+
+class _TocCrcs():
+    """Wraps the cflib TOC cache to keep the CRCs the firmware reports for
+    the log and param TOC, cflib looks them up in its cache on every fetch
+    but does not keep them"""
+
+    def __init__(self, toc_cache):
+        self._toc_cache = toc_cache
+        # The log TOC is fetched before the param TOC
+        self._crcs = deque(maxlen=2)
+
+    def fetch(self, crc):
+        self._crcs.append(crc)
+        return self._toc_cache.fetch(crc)
+
+    def insert(self, crc, toc):
+        self._toc_cache.insert(crc, toc)
+
+    def crc(self):
+        """Return the CRC of the last fetched log and param TOC, or None if
+        they have not been fetched"""
+        if len(self._crcs) < 2:
+            return None
+        return zlib.crc32(struct.pack("<II", *self._crcs))
+
+
+class _TocCache():
+    """Snapshots of TOCs by CRC, shared by all Crazyflies"""
+
+    def __init__(self):
+        self._snapshots = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def _crc(log_toc, param_toc):
+        items = []
+        for toc in (log_toc, param_toc):
+            for group in toc:
+                for name in toc[group]:
+                    element = toc[group][name]
+                    items.append("{}.{}:{}:{}:{}".format(
+                        group, name, element.ident, element.ctype,
+                        getattr(element, "access", "")))
+            items.append("|")
+        return zlib.crc32(",".join(items).encode("utf-8"))
+
+    def get(self, log_toc, param_toc, crc=None):
+        """Return the snapshot for the TOCs, creating it if not cached. The
+        CRC is calculated over the TOC content if not given."""
+        if crc is None:
+            crc = self._crc(log_toc, param_toc)
+        with self._lock:
+            if crc not in self._snapshots:
+                self._snapshots[crc] = _TocSnapshot(crc, log_toc, param_toc)
+            return self._snapshots[crc]
+
+
+class _CrazyflieHandler():
+    """Handles the commands and callbacks for one Crazyflie"""
+
+    def __init__(self, publisher, log_block_ids, log_encoding, multi,
+                 toc_cache):
+        self._publisher = publisher
+        self._cf = Crazyflie(ro_cache=None,
+                             rw_cache=cfclient.config_path + "/cache")
+        self._toc_crcs = _TocCrcs(self._cf._toc_cache)
+        self._cf._toc_cache = self._toc_crcs
+        self.uri = None
+        # With several Crazyflies the topics are prefixed by the URI
+        self._multi = multi
 
         self._cf.connected.add_callback(self._connected)
         self._cf.connection_failed.add_callback(self._connection_failed)
@@ -93,103 +505,245 @@ class _SrvThread(Thread):
         self._cf.param.all_update_callback.add_callback(self._all_param_update)
 
         self._conn_queue = queue.Queue(1)
-        self._param_queue = queue.Queue(1)
-        self._log_started_queue = queue.Queue(1)
-        self._log_added_queue = queue.Queue(1)
+        self._conn_lock = Lock()
+        self._toc_cache = toc_cache
+        self._toc = None
 
-        self._logging_configs = {}
+        self._param_waiters = {}
+        self._param_lock = Lock()
+
+        self._log_blocks = {}
+        self._log_encoding = log_encoding
+        self._log_block_ids = log_block_ids
+
+    @property
+    def cf(self):
+        return self._cf
+
+    def disconnect(self):
+        self._cf.close_link()
+
+    def _topic(self, name):
+        """Return the topic used when publishing data for a log block"""
+        if self._multi:
+            return "{} {}".format(self.uri, name)
+        return name
 
     def _connection_requested(self, uri):
         conn_ev = {"version": 1, "event": "requested", "uri": uri}
-        self._conn_socket.send_json(conn_ev)
+        self._publisher.publish("conn", conn_ev)
 
     def _connected(self, uri):
         conn_ev = {"version": 1, "event": "connected", "uri": uri}
-        self._conn_socket.send_json(conn_ev)
+        self._publisher.publish("conn", conn_ev)
 
     def _connection_failed(self, uri, msg):
         logger.info("Connection failed to {}: {}".format(uri, msg))
-        resp = {"version": 1, "status": 1, "msg": msg}
-        self._conn_queue.put_nowait(resp)
+        self._connection_done({"version": 1, "status": 1, "msg": msg})
         conn_ev = {"version": 1, "event": "failed", "uri": uri, "msg": msg}
-        self._conn_socket.send_json(conn_ev)
+        self._publisher.publish("conn", conn_ev)
 
     def _connection_lost(self, uri, msg):
         conn_ev = {"version": 1, "event": "lost", "uri": uri, "msg": msg}
-        self._conn_socket.send_json(conn_ev)
+        self._publisher.publish("conn", conn_ev)
 
     def _disconnected(self, uri):
         conn_ev = {"version": 1, "event": "disconnected", "uri": uri}
-        self._conn_socket.send_json(conn_ev)
+        self._publisher.publish("conn", conn_ev)
 
     def _tocs_updated(self):
-        # First do the log
-        log_toc = self._cf.log.toc.toc
-        log = {}
-        for group in log_toc:
-            log[group] = {}
-            for name in log_toc[group]:
-                log[group][name] = {"type": log_toc[group][name].ctype}
-        # The the params
-        param_toc = self._cf.param.toc.toc
-        param = {}
-        for group in param_toc:
-            param[group] = {}
-            for name in param_toc[group]:
-                param[group][name] = {
-                    "type": param_toc[group][name].ctype,
-                    "access": "RW" if param_toc[group][
-                        name].access == 0 else "RO",
-                    "value": self._cf.param.values[group][name]}
+        # The response is built by the command worker, keep the callback
+        # thread free for the radio traffic
+        self._connection_done({"version": 1, "status": 0})
 
-        resp = {"version": 1, "status": 0, "log": log, "param": param}
-        self._conn_queue.put_nowait(resp)
+    def _connection_done(self, resp):
+        """Hand the result of a connection attempt to connect"""
+        _notify(self._conn_queue, resp)
 
-    def _handle_scanning(self):
-        resp = {"version": 1}
-        interfaces = cflib.crtp.scan_interfaces()
-        resp["interfaces"] = []
-        for i in interfaces:
-            resp["interfaces"].append({"uri": i[0], "info": i[1]})
+    def connect(self, uri, toc_crc=None):
+        """Connect to the Crazyflie. The TOC is left out of the response if
+        the client already has the TOC with the CRC toc_crc. Fails at once
+        if a connection attempt is in progress, so retries to a Crazyflie
+        that does not answer don't tie up the command workers."""
+        if not self._conn_lock.acquire(blocking=False):
+            return self._connect_busy_response()
+        try:
+            _drain(self._conn_queue)
+            self.uri = uri
+            self._cf.open_link(uri)
+            try:
+                resp = self._conn_queue.get(block=True,
+                                            timeout=CONNECT_TIMEOUT)
+            except queue.Empty:
+                self._cf.close_link()
+                return self._connect_timeout_response(uri)
+            if resp["status"] != 0:
+                return resp
+            return self._connected_response(resp, toc_crc)
+        finally:
+            self._conn_lock.release()
+
+    def _connect_busy_response(self):
+        """Return the response of a connection attempt made while another
+        one is in progress"""
+        return {"version": 1, "status": 3,
+                "msg": "Already connecting to {}".format(self.uri)}
+
+    @staticmethod
+    def _connect_timeout_response(uri):
+        """Return the response of a connection attempt that timed out"""
+        logger.info("Connection to {} timed out".format(uri))
+        return {"version": 1, "status": 2,
+                "msg": "Timeout when connecting to {}".format(uri)}
+
+    def _connected_response(self, resp, toc_crc):
+        """Add the TOC to the response of a successful connection"""
+        self._toc = self._toc_cache.get(self._cf.log.toc.toc,
+                                        self._cf.param.toc.toc,
+                                        self._toc_crcs.crc())
+        resp["uri"] = self.uri
+        resp["log_encoding"] = self._log_encoding
+        resp["setpoints"] = _supported_setpoints()
+        resp["toc_crc"] = self._toc.crc
+        if toc_crc == self._toc.crc:
+            resp["toc_cached"] = True
+        else:
+            resp["log"] = self._toc.log
+            resp["param"] = self._param_values(self._toc.param)
         return resp
 
-    def _handle_connect(self, uri):
-        self._cf.open_link(uri)
-        return self._conn_queue.get(block=True)
+    def _param_values(self, param):
+        """Return the param TOC with the current values added"""
+        values = self._cf.param.values
+        out = {}
+        for group in param:
+            out[group] = {}
+            for name in param[group]:
+                out[group][name] = dict(param[group][name],
+                                        value=values[group][name])
+        return out
+
+    def handle_toc(self, data):
+        """Return the CRC of the TOC, and unless only the CRC is requested
+        the TOC filtered by the requested groups"""
+        resp = {"version": 1}
+        if not self._toc or not self._cf.is_connected():
+            resp["status"] = 1
+            resp["msg"] = "Not connected"
+            return resp
+        resp["status"] = 0
+        resp["toc_crc"] = self._toc.crc
+        if data.get("crc_only"):
+            return resp
+        log = self._toc.log
+        param = self._toc.param
+        if "groups" in data:
+            log = {g: log[g] for g in data["groups"] if g in log}
+            param = {g: param[g] for g in data["groups"] if g in param}
+        resp["log"] = log
+        resp["param"] = self._param_values(param)
+        return resp
 
     def _logging_started(self, conf, started):
-        out = {"version": 1, "name": conf.name}
+        out = {"version": 1, "uri": self.uri, "name": conf.name}
         if started:
             out["event"] = "started"
         else:
             out["event"] = "stopped"
-        self._log_socket.send_json(out)
-        self._log_started_queue.put_nowait(started)
+        self._publisher.publish("log", out, self._topic(conf.name))
+        if conf.name in self._log_blocks:
+            self._log_blocks[conf.name].set_started(started)
 
     def _logging_added(self, conf, added):
-        out = {"version": 1, "name": conf.name}
+        out = {"version": 1, "uri": self.uri, "name": conf.name}
         if added:
             out["event"] = "created"
+            out.update(self._log_schema(conf.name))
         else:
             out["event"] = "deleted"
-        self._log_socket.send_json(out)
-        self._log_added_queue.put_nowait(added)
+        self._publisher.publish("log", out, self._topic(conf.name))
+        if conf.name in self._log_blocks:
+            self._log_blocks[conf.name].set_added(added)
+
+    def _log_schema(self, name):
+        """Return the schema of the data frames published for a block"""
+        block = self._log_blocks.get(name)
+        if block and block.encoder:
+            return block.encoder.schema
+        return {"encoding": LOG_ENCODING_JSON}
+
+    def _create_encoding(self, data):
+        """Return the encoding for a create command, raises ValueError if
+        the encoding can not be used"""
+        encoding = data.get("encoding", self._log_encoding)
+        if encoding not in LOG_ENCODINGS:
+            raise ValueError("Unknown log encoding {}".format(encoding))
+        if encoding == LOG_ENCODING_SHM and not LogRingWriter:
+            raise ValueError(_shm_error)
+        return encoding
 
-    def _handle_logging(self, data):
+    def _new_encoder(self, encoding, conf):
+        """Return the encoder for a log configuration, None for JSON. The
+        variable types are known once the configuration is added."""
+        if encoding == LOG_ENCODING_BINARY:
+            return _LogBinaryEncoder(next(self._log_block_ids), conf)
+        if encoding == LOG_ENCODING_SHM:
+            return _LogShmEncoder(next(self._log_block_ids), conf, self.uri)
+        return None
+
+    def _new_log_config(self, data):
+        """Return a log configuration for a create command"""
+        lg = LogConfig(data["name"], data["period"])
+        for v in data["variables"]:
+            lg.add_variable(v)
+        lg.started_cb.add_callback(self._logging_started)
+        lg.added_cb.add_callback(self._logging_added)
+        lg.data_received_cb.add_callback(self._logdata_callback)
+        return lg
+
+    def _add_log_block(self, block):
+        """Add a block, a block created earlier with the same name is
+        closed so its encoder (and shared memory ring) is released"""
+        old = self._log_blocks.get(block.conf.name)
+        self._log_blocks[block.conf.name] = block
+        if old is None:
+            return
+        old.conf.data_received_cb.remove_callback(self._logdata_callback)
+        old.conf.started_cb.remove_callback(self._logging_started)
+        old.conf.added_cb.remove_callback(self._logging_added)
+        # Blocks of an earlier connection are already gone from the
+        # Crazyflie
+        if old.conf.added and old.conf in self._cf.log.log_blocks:
+            try:
+                old.conf.delete()
+            except Exception as e:
+                logger.warning("Could not delete log config {}: {}".format(
+                    old.conf.name, e))
+        if old.encoder:
+            old.encoder.close()
+
+    def handle_logging(self, data):
         resp = {"version": 1}
         if data["action"] == "create":
-            lg = LogConfig(data["name"], data["period"])
-            for v in data["variables"]:
-                lg.add_variable(v)
-            lg.started_cb.add_callback(self._logging_started)
-            lg.added_cb.add_callback(self._logging_added)
             try:
-                lg.data_received_cb.add_callback(self._logdata_callback)
-                self._logging_configs[data["name"]] = lg
-                self._cf.log.add_config(lg)
-                lg.create()
-                self._log_added_queue.get(block=True, timeout=LOG_TIMEOUT)
+                encoding = self._create_encoding(data)
+            except ValueError as e:
+                resp["status"] = 4
+                resp["msg"] = str(e)
+                return resp
+            lg = self._new_log_config(data)
+            block = _LogBlock(lg)
+            try:
+                with block.lock:
+                    # The block replaces an existing one of the same name
+                    # only once the configuration is valid
+                    self._cf.log.add_config(lg)
+                    self._add_log_block(block)
+                    block.encoder = self._new_encoder(encoding, lg)
+                    lg.create()
+                    block.added_queue.get(block=True, timeout=LOG_TIMEOUT)
                 resp["status"] = 0
+                resp.update(self._log_schema(data["name"]))
             except KeyError as e:
                 resp["status"] = 1
                 resp["msg"] = str(e)
@@ -201,8 +755,11 @@ class _SrvThread(Thread):
                 resp["msg"] = "Log configuration did not start"
         if data["action"] == "start":
             try:
-                self._logging_configs[data["name"]].start()
-                self._log_started_queue.get(block=True, timeout=LOG_TIMEOUT)
+                block = self._log_blocks[data["name"]]
+                with block.lock:
+                    _drain(block.started_queue)
+                    block.conf.start()
+                    block.started_queue.get(block=True, timeout=LOG_TIMEOUT)
                 resp["status"] = 0
             except KeyError as e:
                 resp["status"] = 1
@@ -212,8 +769,11 @@ class _SrvThread(Thread):
                 resp["msg"] = "Log configuration did not stop"
         if data["action"] == "stop":
             try:
-                self._logging_configs[data["name"]].stop()
-                self._log_started_queue.get(block=True, timeout=LOG_TIMEOUT)
+                block = self._log_blocks[data["name"]]
+                with block.lock:
+                    _drain(block.started_queue)
+                    block.conf.stop()
+                    block.started_queue.get(block=True, timeout=LOG_TIMEOUT)
                 resp["status"] = 0
             except KeyError as e:
                 resp["status"] = 1
@@ -223,8 +783,13 @@ class _SrvThread(Thread):
                 resp["msg"] = "Log configuration did not stop"
         if data["action"] == "delete":
             try:
-                self._logging_configs[data["name"]].delete()
-                self._log_added_queue.get(block=True, timeout=LOG_TIMEOUT)
+                block = self._log_blocks[data["name"]]
+                with block.lock:
+                    _drain(block.added_queue)
+                    block.conf.delete()
+                    block.added_queue.get(block=True, timeout=LOG_TIMEOUT)
+                    if block.encoder:
+                        block.encoder.close()
                 resp["status"] = 0
             except KeyError as e:
                 resp["status"] = 1
@@ -235,17 +800,13 @@ class _SrvThread(Thread):
 
         return resp
 
-    def _handle_param(self, data):
+    def handle_param(self, data):
         resp = {"version": 1}
-        group = data["name"].split(".")[0]
-        name = data["name"].split(".")[1]
-        self._cf.param.add_update_callback(group=group, name=name,
-                                           cb=self._param_callback)
+        waiter = self._add_param_waiter(data["name"])
         try:
             self._cf.param.set_value(data["name"], str(data["value"]))
-            answer = self._param_queue.get(block=True, timeout=PARAM_TIMEOUT)
-            resp["name"] = answer["name"]
-            resp["value"] = answer["value"]
+            resp["value"] = waiter.get(block=True, timeout=PARAM_TIMEOUT)
+            resp["name"] = data["name"]
             resp["status"] = 0
         except KeyError as e:
             resp["status"] = 1
@@ -255,80 +816,577 @@ class _SrvThread(Thread):
             resp["msg"] = str(e)
         except queue.Empty:
             resp["status"] = 3
-            resp["msg"] = "Timeout when setting parameter" \
+            resp["msg"] = "Timeout when setting parameter " \
                           "{}".format(data["name"])
+        finally:
+            self._remove_param_waiter(data["name"], waiter)
         return resp
 
-    def _all_param_update(self, name, value):
-        resp = {"version": 1, "name": name, "value": value}
-        self._param_socket.send_json(resp)
+    def handle_params(self, data):
+        """Set or get a batch of parameters. All requests are sent at once
+        and the confirmations are collected concurrently, entries without a
+        value are read back from the Crazyflie."""
+        (resp, pending) = self._request_params(data)
+        deadline = time.time() + PARAM_TIMEOUT
+        for (result, waiter) in pending:
+            try:
+                result["value"] = waiter.get(
+                    block=True, timeout=max(0, deadline - time.time()))
+                result["status"] = 0
+            except queue.Empty:
+                result["status"] = 3
+                result["msg"] = "Timeout when accessing parameter " \
+                                "{}".format(result["name"])
+            finally:
+                self._remove_param_waiter(result["name"], waiter)
+        return self._params_status(resp)
+
+    def _request_params(self, data):
+        """Send the requests of a params command. Return the response and
+        the results that are waiting for a value, with their waiters."""
+        resp = {"version": 1, "params": []}
+        pending = []
+        for p in data["params"]:
+            result = {"name": p["name"]}
+            resp["params"].append(result)
+            waiter = self._add_param_waiter(p["name"])
+            try:
+                if "value" in p:
+                    self._cf.param.set_value(p["name"], str(p["value"]))
+                else:
+                    if not self._cf.param.toc.get_element_by_complete_name(
+                            p["name"]):
+                        raise KeyError("{} not in param TOC".format(
+                            p["name"]))
+                    self._cf.param.request_param_update(p["name"])
+                pending.append((result, waiter))
+                continue
+            except KeyError as e:
+                result["status"] = 1
+                result["msg"] = str(e)
+            except AttributeError as e:
+                result["status"] = 2
+                result["msg"] = str(e)
+            self._remove_param_waiter(p["name"], waiter)
+        return (resp, pending)
+
+    @staticmethod
+    def _params_status(resp):
+        """Set the overall status of a params response"""
+        failed = len([r for r in resp["params"] if r["status"] != 0])
+        if failed:
+            resp["status"] = 1
+            resp["msg"] = "{} of {} parameters failed".format(
+                failed, len(resp["params"]))
+        else:
+            resp["status"] = 0
+        return resp
 
-    def _param_callback(self, name, value):
-        group = name.split(".")[0]
-        name_short = name.split(".")[1]
-        self._cf.param.remove_update_callback(group=group, name=name_short)
-        self._param_queue.put_nowait({"name": name, "value": value})
+    def _add_param_waiter(self, name):
+        """Return a waiter that receives the next value of a parameter"""
+        waiter = self._new_waiter()
+        with self._param_lock:
+            self._param_waiters.setdefault(name, []).append(waiter)
+        return waiter
+
+    def _new_waiter(self):
+        return queue.Queue(1)
+
+    def _notify_waiter(self, waiter, value):
+        _notify(waiter, value)
+
+    def _remove_param_waiter(self, name, waiter):
+        with self._param_lock:
+            self._param_waiters[name].remove(waiter)
+            if not self._param_waiters[name]:
+                del self._param_waiters[name]
+
+    def _all_param_update(self, name, value):
+        resp = {"version": 1, "uri": self.uri, "name": name, "value": value}
+        self._publisher.publish("param", resp)
+        with self._param_lock:
+            for waiter in self._param_waiters.get(name, []):
+                self._notify_waiter(waiter, value)
 
     def _logdata_callback(self, ts, data, conf):
-        out = {"version": 1, "name": conf.name, "event": "data",
-               "timestamp": ts, "variables": {}}
+        block = self._log_blocks.get(conf.name)
+        if not block:
+            return
+        host_ts = time.time()
+        seq = block.stats.sample(host_ts, ts)
+        if block.encoder:
+            self._publisher.publish(
+                "log", block.encoder.encode(seq, host_ts, ts, data),
+                self._topic(conf.name), block.stats)
+            return
+        out = {"version": 1, "uri": self.uri, "name": conf.name,
+               "event": "data", "timestamp": ts, "seq": seq,
+               "host_timestamp": host_ts, "variables": {}}
         for d in data:
             out["variables"][d] = data[d]
-        self._log_socket.send_json(out)
+        self._publisher.publish("log", out, self._topic(conf.name),
+                                block.stats)
+
+    def publish_log_stats(self):
+        """Publish the counters of the started log blocks"""
+        for (name, block) in list(self._log_blocks.items()):
+            if not block.conf.started:
+                continue
+            out = {"version": 1, "uri": self.uri, "name": name,
+                   "event": "stats", "period": block.conf.period_in_ms}
+            out.update(block.stats.report())
+            self._publisher.publish("log", out, self._topic(name))
+
+
+class _LogStatsThread(Thread):
+    """Publishes the counters of the log blocks at a fixed interval"""
+
+    def __init__(self, handlers, interval=LOG_STATS_INTERVAL, *args):
+        super(_LogStatsThread, self).__init__(*args)
+        self._handlers = handlers
+        self._interval = interval
 
     def run(self):
-        logger.info("Starting server thread")
         while True:
-            # Wait for the command
-            cmd = self._socket.recv_json()
-            response = {"version": 1}
-            logger.info("Got command {}".format(cmd))
+            time.sleep(self._interval)
+            for handler in self._handlers():
+                handler.publish_log_stats()
+
+
+class _HandlerRegistry():
+    """The Crazyflie handlers by URI, in single mode there's only one
+    Crazyflie which is re-used for all URIs"""
+
+    def __init__(self, new_handler, multi=False):
+        self._new_handler = new_handler
+        self._handlers = {}
+        self._lock = Lock()
+        self._single = None
+        if not multi:
+            self._single = new_handler()
+
+    def find(self, uri=None):
+        """Return the handler for the Crazyflie with the URI. The URI can be
+        left out if only one Crazyflie is used."""
+        if self._single:
+            return self._single
+        with self._lock:
+            if uri is None and len(self._handlers) == 1:
+                return next(iter(self._handlers.values()))
+            if uri not in self._handlers:
+                raise KeyError("No Crazyflie with URI {}".format(uri))
+            return self._handlers[uri]
+
+    def all(self):
+        """Return all handlers"""
+        if self._single:
+            return [self._single]
+        with self._lock:
+            return list(self._handlers.values())
+
+    def for_connect(self, uri):
+        """Return the handler to connect to the URI with, creating it if
+        needed"""
+        if self._single:
+            return self._single
+        with self._lock:
+            if uri not in self._handlers:
+                self._handlers[uri] = self._new_handler()
+            return self._handlers[uri]
+
+
+def _scan_interfaces():
+    resp = {"version": 1}
+    interfaces = cflib.crtp.scan_interfaces()
+    resp["interfaces"] = []
+    for i in interfaces:
+        resp["interfaces"].append({"uri": i[0], "info": i[1]})
+    return resp
+
+
+class _SrvThread(Thread):
+
+    def __init__(self, socket, publisher, log_encoding=LOG_ENCODING_JSON,
+                 multi=False, *args):
+        super(_SrvThread, self).__init__(*args)
+        self._socket = socket
+        self._publisher = publisher
+        self._log_encoding = log_encoding
+        self._stats_sources = {"publisher": publisher.stats}
+        # Block ids of binary log frames are unique for all Crazyflies
+        self._log_block_ids = itertools.count(1)
+        self._toc_cache = _TocCache()
+
+        self._multi = multi
+        self._handlers = _HandlerRegistry(self._new_handler, multi)
+
+        # Commands are executed by the workers, the responses are sent back
+        # to this thread that owns the command socket
+        self._resp_socket = self._socket.context.socket(zmq.PULL)
+        self._resp_socket.bind(_CMD_RESP_ADDR)
+        self._cmd_queue = queue.Queue()
+        for _ in range(CMD_WORKERS):
+            _CmdWorkerThread(self._socket.context, self._cmd_queue,
+                             self._handle_command).start()
+
+    def add_stats_source(self, name, stats):
+        """Add a function returning counters for the stats command"""
+        self._stats_sources[name] = stats
+
+    def _new_handler(self):
+        return _CrazyflieHandler(self._publisher, self._log_block_ids,
+                                 self._log_encoding, self._multi,
+                                 self._toc_cache)
+
+    def find_handler(self, uri=None):
+        return self._handlers.find(uri)
+
+    def all_handlers(self):
+        return self._handlers.all()
+
+    def _handle_command(self, cmd):
+        """Execute a command, called from the worker threads"""
+        response = {"version": 1}
+        logger.info("Got command {}".format(cmd))
+        try:
             if cmd["cmd"] == "scan":
-                response = self._handle_scanning()
+                response = _scan_interfaces()
             elif cmd["cmd"] == "connect":
-                response = self._handle_connect(cmd["uri"])
+                response = self._handlers.for_connect(cmd["uri"]).connect(
+                    cmd["uri"], cmd.get("toc_crc"))
             elif cmd["cmd"] == "disconnect":
-                self._cf.close_link()
+                self.find_handler(cmd.get("uri")).disconnect()
                 response["status"] = 0
             elif cmd["cmd"] == "log":
-                response = self._handle_logging(cmd)
+                response = self.find_handler(
+                    cmd.get("uri")).handle_logging(cmd)
             elif cmd["cmd"] == "param":
-                response = self._handle_param(cmd)
+                response = self.find_handler(cmd.get("uri")).handle_param(cmd)
+            elif cmd["cmd"] == "params":
+                response = self.find_handler(
+                    cmd.get("uri")).handle_params(cmd)
+            elif cmd["cmd"] == "toc":
+                response = self.find_handler(cmd.get("uri")).handle_toc(cmd)
+            elif cmd["cmd"] == "stats":
+                for name in self._stats_sources:
+                    response[name] = self._stats_sources[name]()
+                response["status"] = 0
             else:
                 response["status"] = 0xFF
                 response["msg"] = "Unknown command {}".format(cmd["cmd"])
-            self._socket.send_json(response)
+        except Exception as e:
+            logger.warning("Error when handling command {}: {}".format(
+                cmd, e))
+            response = {"version": 1, "status": 0xFE, "msg": str(e)}
+        # Used by clients to match responses with pipelined requests
+        if "id" in cmd:
+            response["id"] = cmd["id"]
+        return response
+
+    def run(self):
+        logger.info("Starting server thread")
+        poller = zmq.Poller()
+        poller.register(self._socket, zmq.POLLIN)
+        poller.register(self._resp_socket, zmq.POLLIN)
+        while True:
+            events = dict(poller.poll())
+            if self._resp_socket in events:
+                # A command is done, the response carries the envelope
+                self._socket.send_multipart(
+                    self._resp_socket.recv_multipart())
+            if self._socket in events:
+                # The last frame is the command, the frames before it are
+                # the routing envelope (identity and REQ delimiter)
+                frames = self._socket.recv_multipart()
+                try:
+                    cmd = json.loads(frames[-1])
+                except ValueError as e:
+                    response = {"version": 1, "status": 0xFE,
+                                "msg": "Malformed command: {}".format(e)}
+                    self._socket.send_multipart(
+                        frames[:-1] + [json.dumps(response).encode("utf-8")])
+                    continue
+                self._cmd_queue.put((frames[:-1], cmd))
+
+
+class _Setpoint():
+    """A type of set-point that can be sent on the control socket"""
+
+    def __init__(self, name, method, fields, fmt, sizes=None):
+        self.name = name
+        self._method = method
+        # JSON field names, in the order of the commander arguments
+        self._fields = fields
+        self._struct = struct.Struct(CTRL_BINARY_HEADER + fmt)
+        # Number of binary values making up each argument, for arguments
+        # that are vectors
+        self._sizes = sizes
+        # Older cflib versions lack some of the commander methods
+        self.supported = hasattr(Commander, method)
+
+    def decode(self, frame):
+        """Return the commander arguments in a binary frame"""
+        values = self._struct.unpack(frame)[2:]
+        if not self._sizes:
+            return values
+        args = []
+        for size in self._sizes:
+            args.append(values[:size] if size > 1 else values[0])
+            values = values[size:]
+        return args
+
+    def decode_json(self, cmd):
+        """Return the commander arguments in a JSON set-point"""
+        return [cmd[field] for field in self._fields]
+
+    def send(self, cf, args):
+        getattr(cf.commander, self._method)(*args)
+
+
+_SETPOINTS = {
+    SETPOINT_STOP: _Setpoint("stop", "send_stop_setpoint", [], ""),
+    SETPOINT_RPYT: _Setpoint("rpyt", "send_setpoint",
+                             ["roll", "pitch", "yaw", "thrust"], "fffH"),
+    SETPOINT_VELOCITY_WORLD: _Setpoint(
+        "velocity_world", "send_velocity_world_setpoint",
+        ["vx", "vy", "vz", "yawrate"], "ffff"),
+    SETPOINT_ZDISTANCE: _Setpoint(
+        "zdistance", "send_zdistance_setpoint",
+        ["roll", "pitch", "yawrate", "zdistance"], "ffff"),
+    SETPOINT_HOVER: _Setpoint("hover", "send_hover_setpoint",
+                              ["vx", "vy", "yawrate", "zdistance"], "ffff"),
+    SETPOINT_POSITION: _Setpoint("position", "send_position_setpoint",
+                                 ["x", "y", "z", "yaw"], "ffff"),
+    SETPOINT_FULL_STATE: _Setpoint(
+        "full_state", "send_full_state_setpoint",
+        ["pos", "vel", "acc", "orientation", "rollrate", "pitchrate",
+         "yawrate"], "f" * 16, [3, 3, 3, 4, 1, 1, 1]),
+}
+_SETPOINTS_BY_NAME = {sp.name: sp for sp in _SETPOINTS.values()}
+
+
+def _supported_setpoints():
+    """Return the names of the set-point types the installed cflib can
+    send"""
+    return [sp.name for sp in _SETPOINTS.values() if sp.supported]
+
+
+class _SetpointForwarder():
+    """Forwards set-points to the Crazyflies. Only the newest set-point for
+    each Crazyflie is used, older received ones are counted as conflated.
+
+    If a rate is set the newest set-point is forwarded at that fixed rate,
+    otherwise set-points are forwarded as they arrive. If a timeout is set
+    the safe set-point replaces the set-point of a Crazyflie that has not
+    received any set-point within the timeout, without a rate it's resent
+    at CTRL_SAFE_RATE until a new set-point is received."""
+
+    def __init__(self, find_handler, rate=0, timeout=0, safe=CTRL_SAFE_STOP,
+                 hover_height=CTRL_HOVER_HEIGHT):
+        self._find_handler = find_handler
+        self._period = 1.0 / rate if rate else 0
+        self._next_tick = time.time() + self._period
+        self._timeout = timeout / 1000.0
+        self._safe_period = 1.0 / CTRL_SAFE_RATE
+        if safe == CTRL_SAFE_HOVER:
+            self._safe = (_SETPOINTS[SETPOINT_HOVER], [0, 0, 0, hover_height])
+        elif safe == CTRL_SAFE_ZERO_THRUST:
+            self._safe = (_SETPOINTS[SETPOINT_RPYT], [0, 0, 0, 0])
+        else:
+            self._safe = (_SETPOINTS[SETPOINT_STOP], [])
+        if not self._safe[0].supported:
+            raise ValueError("The safe set-point {} is not supported by the "
+                             "installed cflib".format(safe))
+        unsupported = [sp.name for sp in _SETPOINTS.values()
+                       if not sp.supported]
+        if unsupported:
+            logger.warning("Set-point types not supported by the installed "
+                           "cflib, they will be dropped: {}".format(
+                               ", ".join(unsupported)))
+
+        # Newest set-point and the time it was received for each URI
+        self._setpoints = {}
+        self._received_at = {}
+        # URIs with a set-point that has not been forwarded yet
+        self._pending = set()
+        # URIs where the safe set-point is used
+        self._timed_out = set()
+        # Time the last set-point was forwarded for each URI
+        self._forwarded_at = {}
+
+        self._lock = Lock()
+        self._counters = {"received": 0, "forwarded": 0, "conflated": 0,
+                          "timeouts": 0, "safe_sent": 0, "errors": 0,
+                          "unsupported": 0}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    @staticmethod
+    def _decode(frames):
+        """Return the URI, set-point type and commander arguments"""
+        uri = None
+        if len(frames) > 1:
+            uri = frames[0].decode("utf-8")
+        frame = frames[-1]
+        if frame[0] == CTRL_BINARY_MAGIC:
+            setpoint = _SETPOINTS[frame[1]]
+            return (uri, setpoint, setpoint.decode(frame))
+        cmd = json.loads(frame)
+        setpoint = _SETPOINTS_BY_NAME[cmd.get("type", "rpyt")]
+        return (cmd.get("uri", uri), setpoint, setpoint.decode_json(cmd))
+
+    def receive(self, messages, now):
+        """Keep the newest of the received set-points for each URI"""
+        for frames in messages:
+            try:
+                (uri, setpoint, args) = self._decode(frames)
+            except (KeyError, IndexError, TypeError, ValueError,
+                    struct.error) as e:
+                logger.warning("Dropping malformed set-point: {}".format(e))
+                self._count("errors")
+                continue
+            if not setpoint.supported:
+                logger.debug("Dropping unsupported set-point {}".format(
+                    setpoint.name))
+                self._count("unsupported")
+                continue
+            if uri in self._pending:
+                self._count("conflated")
+            self._setpoints[uri] = (setpoint, args)
+            self._received_at[uri] = now
+            self._pending.add(uri)
+            self._timed_out.discard(uri)
+        self._count("received", len(messages))
+
+    def _check_timeouts(self, now):
+        """Switch to the safe set-point for URIs without recent set-points"""
+        if not self._timeout:
+            return
+        for uri in self._setpoints:
+            if (uri not in self._timed_out and
+                    now - self._received_at[uri] > self._timeout):
+                logger.info("No set-point for {} in {} ms, using the safe "
+                            "set-point".format(uri, self._timeout * 1000))
+                self._setpoints[uri] = self._safe
+                self._timed_out.add(uri)
+                self._pending.add(uri)
+                self._count("timeouts")
+
+    def poll_timeout(self, now):
+        """Return the time (ms) until update has to be called without new
+        set-points, None if there is nothing to wait for"""
+        deadlines = []
+        if self._period:
+            deadlines.append(self._next_tick)
+        if self._timeout:
+            for uri in self._setpoints:
+                if uri not in self._timed_out:
+                    deadlines.append(self._received_at[uri] + self._timeout)
+                elif not self._period:
+                    deadlines.append(self._forwarded_at[uri] +
+                                     self._safe_period)
+        if not deadlines:
+            return None
+        return max(0, int((min(deadlines) - now) * 1000))
+
+    def _forward(self, uri, now):
+        (setpoint, args) = self._setpoints[uri]
+        self._pending.discard(uri)
+        self._forwarded_at[uri] = now
+        try:
+            setpoint.send(self._find_handler(uri).cf, args)
+            self._count("forwarded")
+            if uri in self._timed_out:
+                self._count("safe_sent")
+        except KeyError as e:
+            # No Crazyflie with this URI, forget about it
+            logger.warning("Dropping set-point: {}".format(e))
+            del self._setpoints[uri]
+            del self._received_at[uri]
+            del self._forwarded_at[uri]
+            self._timed_out.discard(uri)
+            self._count("errors")
+        except (AttributeError, TypeError, ValueError, struct.error) as e:
+            logger.warning("Dropping set-point: {}".format(e))
+            self._count("errors")
+
+    def update(self, now):
+        """Apply the timeouts and forward the set-points that are due"""
+        self._check_timeouts(now)
+        if not self._period:
+            for uri in self._timed_out:
+                if now - self._forwarded_at[uri] >= self._safe_period:
+                    self._pending.add(uri)
+            for uri in list(self._pending):
+                self._forward(uri, now)
+        elif now >= self._next_tick:
+            for uri in list(self._setpoints):
+                self._forward(uri, now)
+            self._next_tick += self._period
+            # Skip the ticks that were missed instead of bursting
+            if self._next_tick < now:
+                self._next_tick = now + self._period
 
 
 class _CtrlThread(Thread):
+    """Reads the set-points from the control socket"""
 
-    def __init__(self, socket, cf, *args):
+    def __init__(self, socket, forwarder, *args):
         super(_CtrlThread, self).__init__(*args)
         self._socket = socket
-        self._cf = cf
+        self._forwarder = forwarder
+
+    def _receive(self):
+        """Read all queued set-points"""
+        messages = []
+        while len(messages) < CTRL_MAX_BATCH:
+            try:
+                messages.append(self._socket.recv_multipart(zmq.NOBLOCK))
+            except zmq.Again:
+                break
+        return messages
 
     def run(self):
         while True:
-            cmd = self._socket.recv_json()
-            self._cf.commander.send_setpoint(cmd["roll"], cmd["pitch"],
-                                             cmd["yaw"], cmd["thrust"])
+            if self._socket.poll(self._forwarder.poll_timeout(time.time())):
+                self._forwarder.receive(self._receive(), time.time())
+            self._forwarder.update(time.time())
+
+
+def _bind_zmq_socket(context, base_url, pattern, name, port):
+    srv = context.socket(pattern)
+    srv_addr = "{}:{}".format(base_url, port)
+    srv.bind(srv_addr)
+    logger.info("Biding ZMQ {} server"
+                "at {}".format(name, srv_addr))
+    return srv
 
 
 class ZMQServer():
     """Crazyflie ZMQ server"""
 
-    def __init__(self, base_url, base_port):
-        """Start threads and bind ports"""
+    def __init__(self, base_url, base_port, log_encoding=LOG_ENCODING_JSON,
+                 pub_queue_size=PUB_QUEUE_SIZE, multi=False, ctrl_rate=0,
+                 ctrl_timeout=0, ctrl_safe=CTRL_SAFE_STOP,
+                 ctrl_hover_height=CTRL_HOVER_HEIGHT,
+                 log_stats_interval=LOG_STATS_INTERVAL):
+        """Start threads and bind ports. In multi mode one server handles
+        several Crazyflies, the commands and set-points then carry the URI
+        of the Crazyflie."""
         cflib.crtp.init_drivers(enable_debug_driver=True)
-        self._cf = Crazyflie(ro_cache=None,
-                             rw_cache=cfclient.config_path + "/cache")
 
         signal.signal(signal.SIGINT, signal.SIG_DFL)
 
         self._base_url = base_url
         self._context = zmq.Context()
 
-        cmd_srv = self._bind_zmq_socket(zmq.REP, "cmd",
+        cmd_srv = self._bind_zmq_socket(zmq.ROUTER, "cmd",
                                         base_port + ZMQ_SRV_PORT)
         log_srv = self._bind_zmq_socket(zmq.PUB, "log",
                                         base_port + ZMQ_LOG_PORT)
@@ -339,20 +1397,29 @@ class ZMQServer():
         conn_srv = self._bind_zmq_socket(zmq.PUB, "conn",
                                          base_port + ZMQ_CONN_PORT)
 
-        self._scan_thread = _SrvThread(cmd_srv, log_srv, param_srv, conn_srv,
-                                       self._cf)
+        self._pub_thread = _PubThread({"log": log_srv, "param": param_srv,
+                                       "conn": conn_srv}, pub_queue_size)
+        self._pub_thread.start()
+
+        self._scan_thread = _SrvThread(cmd_srv, self._pub_thread,
+                                       log_encoding, multi)
         self._scan_thread.start()
 
-        self._ctrl_thread = _CtrlThread(ctrl_srv, self._cf)
+        forwarder = _SetpointForwarder(self._scan_thread.find_handler,
+                                       ctrl_rate, ctrl_timeout, ctrl_safe,
+                                       ctrl_hover_height)
+        self._ctrl_thread = _CtrlThread(ctrl_srv, forwarder)
         self._ctrl_thread.start()
+        self._scan_thread.add_stats_source("ctrl", forwarder.stats)
+
+        if log_stats_interval:
+            self._log_stats_thread = _LogStatsThread(
+                self._scan_thread.all_handlers, log_stats_interval)
+            self._log_stats_thread.start()
 
     def _bind_zmq_socket(self, pattern, name, port):
-        srv = self._context.socket(pattern)
-        srv_addr = "{}:{}".format(self._base_url, port)
-        srv.bind(srv_addr)
-        logger.info("Biding ZMQ {} server"
-                    "at {}".format(name, srv_addr))
-        return srv
+        return _bind_zmq_socket(self._context, self._base_url, pattern, name,
+                                port)
 
 
 def main():
@@ -368,6 +1435,39 @@ def main():
     parser.add_argument("-p", "--port", action="store", dest="port", type=int,
                         default=2000,
                         help="Base port to used for ZMQ sockets")
+    parser.add_argument("--log-encoding", action="store", dest="log_encoding",
+                        choices=LOG_ENCODINGS, default=LOG_ENCODING_JSON,
+                        help="Default encoding of published log data")
+    parser.add_argument("--pub-queue", action="store", dest="pub_queue",
+                        type=int, default=PUB_QUEUE_SIZE,
+                        help="Number of messages buffered for publishing "
+                             "before dropping the oldest")
+    parser.add_argument("-m", "--multi", action="store_true", dest="multi",
+                        help="Handle several Crazyflies, selected by the URI "
+                             "in the commands and set-points")
+    parser.add_argument("--ctrl-rate", action="store", dest="ctrl_rate",
+                        type=float, default=0,
+                        help="Forward the newest set-point at this rate (Hz) "
+                             "instead of when received")
+    parser.add_argument("--ctrl-timeout", action="store",
+                        dest="ctrl_timeout", type=int, default=0,
+                        help="Send the safe set-point until a new "
+                             "set-point is received if no set-point is "
+                             "received within this time (ms)")
+    parser.add_argument("--ctrl-safe", action="store", dest="ctrl_safe",
+                        choices=CTRL_SAFES, default=CTRL_SAFE_STOP,
+                        help="Set-point sent when the set-points time out")
+    parser.add_argument("--ctrl-hover-height", action="store",
+                        dest="ctrl_hover_height", type=float,
+                        default=CTRL_HOVER_HEIGHT,
+                        help="Height (m) used by the hover safe set-point")
+    parser.add_argument("--log-stats", action="store", dest="log_stats",
+                        type=float, default=LOG_STATS_INTERVAL,
+                        help="Interval (s) of the stats messages for the log "
+                             "blocks, 0 to disable")
+    parser.add_argument("--asyncio", action="store_true", dest="asyncio",
+                        help="Run the server on one asyncio event loop "
+                             "instead of threads")
     (args, _) = parser.parse_known_args()
 
     if args.debug:
@@ -375,7 +1475,14 @@ def main():
     else:
         logging.basicConfig(level=logging.INFO)
 
-    ZMQServer(args.url, args.port)
+    server_args = (args.url, args.port, args.log_encoding, args.pub_queue,
+                   args.multi, args.ctrl_rate, args.ctrl_timeout,
+                   args.ctrl_safe, args.ctrl_hover_height, args.log_stats)
+    if args.asyncio:
+        from cfzmq.asyncserver import AsyncZMQServer
+        AsyncZMQServer(*server_args).run()
+    else:
+        ZMQServer(*server_args)
 
     # CRTL-C to exit
 
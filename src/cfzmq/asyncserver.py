@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2015 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+"""
+Crazyflie ZMQ server running on one asyncio event loop. The protocol is the
+same as for the threaded server. The command, control and publish sockets
+are served by the loop, the cflib callbacks run on the cflib threads and
+hand their results to the loop with call_soon_threadsafe.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import signal
+import time
+import zmq
+import zmq.asyncio
+import cflib.crtp
+
+from cfzmq import CONNECT_TIMEOUT
+from cfzmq import CTRL_HOVER_HEIGHT
+from cfzmq import CTRL_MAX_BATCH
+from cfzmq import CTRL_SAFE_STOP
+from cfzmq import LOG_ENCODING_JSON
+from cfzmq import LOG_STATS_INTERVAL
+from cfzmq import LOG_TIMEOUT
+from cfzmq import PARAM_TIMEOUT
+from cfzmq import PUB_QUEUE_SIZE
+from cfzmq import ZMQ_CONN_PORT
+from cfzmq import ZMQ_CTRL_PORT
+from cfzmq import ZMQ_LOG_PORT
+from cfzmq import ZMQ_PARAM_PORT
+from cfzmq import ZMQ_SRV_PORT
+from cfzmq import _bind_zmq_socket
+from cfzmq import _CrazyflieHandler
+from cfzmq import _HandlerRegistry
+from cfzmq import _LogBlock
+from cfzmq import _PubQueue
+from cfzmq import _scan_interfaces
+from cfzmq import _SetpointForwarder
+from cfzmq import _TocCache
+
+__all__ = ['AsyncZMQServer']
+
+logger = logging.getLogger(__name__)
+
+
+def _set_result(future, value):
+    """Complete a future unless it's already done, e.g. timed out"""
+    if future is not None and not future.done():
+        future.set_result(value)
+
+
+class _AsyncPublisher():
+    """Sends the queued messages on the publish sockets from the loop"""
+
+    def __init__(self, loop, sockets, size=PUB_QUEUE_SIZE):
+        self._loop = loop
+        self._sockets = sockets
+        self._wakeup = asyncio.Event()
+        self._queue = _PubQueue(sockets, size, self._wake)
+
+    def _wake(self):
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def publish(self, name, payload, topic=None, stats=None):
+        self._queue.publish(name, payload, topic, stats)
+
+    def stats(self):
+        return self._queue.stats()
+
+    async def run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            messages = self._queue.get(block=False)
+            for (name, payload, topic, _) in messages:
+                await self._sockets[name].send_multipart(
+                    _PubQueue.frames(payload, topic))
+            self._queue.sent(messages)
+
+
+class _AsyncLogBlock(_LogBlock):
+    """A log configuration created through the asyncio server"""
+
+    def __init__(self, conf, loop, encoder=None):
+        super(_AsyncLogBlock, self).__init__(conf, encoder)
+        self._loop = loop
+        self.lock = asyncio.Lock()
+        self._waiting = {"added": None, "started": None}
+
+    async def wait(self, event, action):
+        """Run an action on the configuration and return the value of the
+        added or started event it results in. Must be called with the lock
+        held."""
+        future = self._loop.create_future()
+        self._waiting[event] = future
+        action()
+        return await asyncio.wait_for(future, LOG_TIMEOUT)
+
+    def set_added(self, added):
+        self._loop.call_soon_threadsafe(self._resolve, "added", added)
+
+    def set_started(self, started):
+        self._loop.call_soon_threadsafe(self._resolve, "started", started)
+
+    def _resolve(self, event, value):
+        _set_result(self._waiting[event], value)
+
+
+class _AsyncCrazyflieHandler(_CrazyflieHandler):
+    """Handles the commands and callbacks for one Crazyflie. The commands
+    that wait for the Crazyflie are coroutines run on the loop."""
+
+    def __init__(self, loop, *args):
+        self._loop = loop
+        super(_AsyncCrazyflieHandler, self).__init__(*args)
+        self._conn_lock = asyncio.Lock()
+        self._conn_future = None
+
+    def _connection_done(self, resp):
+        self._loop.call_soon_threadsafe(self._resolve_connect, resp)
+
+    def _resolve_connect(self, resp):
+        _set_result(self._conn_future, resp)
+
+    def _new_waiter(self):
+        return self._loop.create_future()
+
+    def _notify_waiter(self, waiter, value):
+        self._loop.call_soon_threadsafe(_set_result, waiter, value)
+
+    async def disconnect(self):
+        await self._loop.run_in_executor(None, self._cf.close_link)
+
+    async def connect(self, uri, toc_crc=None):
+        if self._conn_lock.locked():
+            return self._connect_busy_response()
+        async with self._conn_lock:
+            self._conn_future = self._loop.create_future()
+            self.uri = uri
+            # Opening the link can block while the radio is set up
+            await self._loop.run_in_executor(None, self._cf.open_link, uri)
+            try:
+                resp = await asyncio.wait_for(self._conn_future,
+                                              CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
+                self._conn_future = None
+                await self._loop.run_in_executor(None, self._cf.close_link)
+                return self._connect_timeout_response(uri)
+            if resp["status"] != 0:
+                return resp
+            return self._connected_response(resp, toc_crc)
+
+    async def handle_logging(self, data):
+        resp = {"version": 1}
+        if data["action"] == "create":
+            try:
+                encoding = self._create_encoding(data)
+            except ValueError as e:
+                resp["status"] = 4
+                resp["msg"] = str(e)
+                return resp
+            lg = self._new_log_config(data)
+            block = _AsyncLogBlock(lg, self._loop)
+            try:
+                async with block.lock:
+                    # The block replaces an existing one of the same name
+                    # only once the configuration is valid
+                    self._cf.log.add_config(lg)
+                    self._add_log_block(block)
+                    block.encoder = self._new_encoder(encoding, lg)
+                    await block.wait("added", lg.create)
+                resp["status"] = 0
+                resp.update(self._log_schema(data["name"]))
+            except KeyError as e:
+                resp["status"] = 1
+                resp["msg"] = str(e)
+            except AttributeError as e:
+                resp["status"] = 2
+                resp["msg"] = str(e)
+            except asyncio.TimeoutError:
+                resp["status"] = 3
+                resp["msg"] = "Log configuration did not start"
+            return resp
+
+        events = {"start": "started", "stop": "started", "delete": "added"}
+        if data["action"] not in events:
+            return resp
+        try:
+            block = self._log_blocks[data["name"]]
+            async with block.lock:
+                await block.wait(events[data["action"]],
+                                 getattr(block.conf, data["action"]))
+                if data["action"] == "delete" and block.encoder:
+                    block.encoder.close()
+            resp["status"] = 0
+        except KeyError as e:
+            resp["status"] = 1
+            resp["msg"] = "{} config not found".format(str(e))
+        except asyncio.TimeoutError:
+            resp["status"] = 2
+            resp["msg"] = "Log configuration did not {}".format(
+                data["action"])
+        return resp
+
+    async def handle_param(self, data):
+        resp = {"version": 1}
+        waiter = self._add_param_waiter(data["name"])
+        try:
+            self._cf.param.set_value(data["name"], str(data["value"]))
+            resp["value"] = await asyncio.wait_for(waiter, PARAM_TIMEOUT)
+            resp["name"] = data["name"]
+            resp["status"] = 0
+        except KeyError as e:
+            resp["status"] = 1
+            resp["msg"] = str(e)
+        except AttributeError as e:
+            resp["status"] = 2
+            resp["msg"] = str(e)
+        except asyncio.TimeoutError:
+            resp["status"] = 3
+            resp["msg"] = "Timeout when setting parameter " \
+                          "{}".format(data["name"])
+        finally:
+            self._remove_param_waiter(data["name"], waiter)
+        return resp
+
+    async def handle_params(self, data):
+        (resp, pending) = self._request_params(data)
+        if pending:
+            await asyncio.wait([waiter for (_, waiter) in pending],
+                               timeout=PARAM_TIMEOUT)
+        for (result, waiter) in pending:
+            if waiter.done():
+                result["value"] = waiter.result()
+                result["status"] = 0
+            else:
+                waiter.cancel()
+                result["status"] = 3
+                result["msg"] = "Timeout when accessing parameter " \
+                                "{}".format(result["name"])
+            self._remove_param_waiter(result["name"], waiter)
+        return self._params_status(resp)
+
+
+class AsyncZMQServer():
+    """Crazyflie ZMQ server running on one asyncio event loop"""
+
+    def __init__(self, base_url, base_port, log_encoding=LOG_ENCODING_JSON,
+                 pub_queue_size=PUB_QUEUE_SIZE, multi=False, ctrl_rate=0,
+                 ctrl_timeout=0, ctrl_safe=CTRL_SAFE_STOP,
+                 ctrl_hover_height=CTRL_HOVER_HEIGHT,
+                 log_stats_interval=LOG_STATS_INTERVAL):
+        """Bind ports, the server is started by run. The arguments are the
+        same as for ZMQServer."""
+        cflib.crtp.init_drivers(enable_debug_driver=True)
+
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._context = zmq.asyncio.Context()
+
+        self._cmd_socket = _bind_zmq_socket(self._context, base_url,
+                                            zmq.ROUTER, "cmd",
+                                            base_port + ZMQ_SRV_PORT)
+        self._ctrl_socket = _bind_zmq_socket(self._context, base_url,
+                                             zmq.PULL, "ctrl",
+                                             base_port + ZMQ_CTRL_PORT)
+        pub_sockets = {}
+        for (name, port) in (("log", ZMQ_LOG_PORT), ("param", ZMQ_PARAM_PORT),
+                             ("conn", ZMQ_CONN_PORT)):
+            pub_sockets[name] = _bind_zmq_socket(self._context, base_url,
+                                                 zmq.PUB, name,
+                                                 base_port + port)
+        self._publisher = _AsyncPublisher(self._loop, pub_sockets,
+                                          pub_queue_size)
+
+        self._log_encoding = log_encoding
+        self._multi = multi
+        # Block ids of binary log frames are unique for all Crazyflies
+        self._log_block_ids = itertools.count(1)
+        self._toc_cache = _TocCache()
+        self._handlers = _HandlerRegistry(self._new_handler, multi)
+
+        self._forwarder = _SetpointForwarder(self._handlers.find, ctrl_rate,
+                                             ctrl_timeout, ctrl_safe,
+                                             ctrl_hover_height)
+        self._stats_sources = {"publisher": self._publisher.stats,
+                               "ctrl": self._forwarder.stats}
+        self._log_stats_interval = log_stats_interval
+        # The loop only keeps weak references to tasks
+        self._cmd_tasks = set()
+
+    def _new_handler(self):
+        return _AsyncCrazyflieHandler(self._loop, self._publisher,
+                                      self._log_block_ids,
+                                      self._log_encoding, self._multi,
+                                      self._toc_cache)
+
+    def run(self):
+        """Serve the sockets, does not return"""
+        logger.info("Starting asyncio server")
+        tasks = [self._publisher.run(), self._serve_commands(),
+                 self._serve_ctrl()]
+        if self._log_stats_interval:
+            tasks.append(self._publish_log_stats())
+        self._loop.run_until_complete(asyncio.gather(*tasks))
+
+    async def _publish_log_stats(self):
+        while True:
+            await asyncio.sleep(self._log_stats_interval)
+            for handler in self._handlers.all():
+                handler.publish_log_stats()
+
+    async def _handle_command(self, cmd):
+        response = {"version": 1}
+        logger.info("Got command {}".format(cmd))
+        try:
+            uri = cmd.get("uri")
+            if cmd["cmd"] == "scan":
+                response = await self._loop.run_in_executor(
+                    None, _scan_interfaces)
+            elif cmd["cmd"] == "connect":
+                response = await self._handlers.for_connect(
+                    cmd["uri"]).connect(cmd["uri"], cmd.get("toc_crc"))
+            elif cmd["cmd"] == "disconnect":
+                await self._handlers.find(uri).disconnect()
+                response["status"] = 0
+            elif cmd["cmd"] == "log":
+                response = await self._handlers.find(uri).handle_logging(cmd)
+            elif cmd["cmd"] == "param":
+                response = await self._handlers.find(uri).handle_param(cmd)
+            elif cmd["cmd"] == "params":
+                response = await self._handlers.find(uri).handle_params(cmd)
+            elif cmd["cmd"] == "toc":
+                response = self._handlers.find(uri).handle_toc(cmd)
+            elif cmd["cmd"] == "stats":
+                for name in self._stats_sources:
+                    response[name] = self._stats_sources[name]()
+                response["status"] = 0
+            else:
+                response["status"] = 0xFF
+                response["msg"] = "Unknown command {}".format(cmd["cmd"])
+        except Exception as e:
+            logger.warning("Error when handling command {}: {}".format(
+                cmd, e))
+            response = {"version": 1, "status": 0xFE, "msg": str(e)}
+        # Used by clients to match responses with pipelined requests
+        if "id" in cmd:
+            response["id"] = cmd["id"]
+        return response
+
+    async def _run_command(self, envelope, cmd):
+        response = await self._handle_command(cmd)
+        await self._cmd_socket.send_multipart(
+            envelope + [json.dumps(response).encode("utf-8")])
+
+    async def _serve_commands(self):
+        while True:
+            # The last frame is the command, the frames before it are the
+            # routing envelope (identity and REQ delimiter)
+            frames = await self._cmd_socket.recv_multipart()
+            try:
+                cmd = json.loads(frames[-1])
+            except ValueError as e:
+                response = {"version": 1, "status": 0xFE,
+                            "msg": "Malformed command: {}".format(e)}
+                await self._cmd_socket.send_multipart(
+                    frames[:-1] + [json.dumps(response).encode("utf-8")])
+                continue
+            # Commands run concurrently, a slow command does not hold up
+            # the others
+            task = self._loop.create_task(self._run_command(frames[:-1], cmd))
+            self._cmd_tasks.add(task)
+            task.add_done_callback(self._cmd_tasks.discard)
+
+    async def _serve_ctrl(self):
+        while True:
+            timeout = self._forwarder.poll_timeout(time.time())
+            if await self._ctrl_socket.poll(timeout):
+                messages = []
+                while len(messages) < CTRL_MAX_BATCH:
+                    try:
+                        messages.append(await self._ctrl_socket.recv_multipart(
+                            zmq.NOBLOCK))
+                    except zmq.Again:
+                        break
+                self._forwarder.receive(messages, time.time())
+            self._forwarder.update(time.time())
@@ -0,0 +1,491 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2015 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+"""
+Benchmark for the Crazyflie ZMQ server. The server is started in a
+subprocess and connected to a Crazyflie on the debug driver, then SUB
+clients read log data, PUSH clients send set-points and REQ clients send
+commands for a fixed time.
+
+Log data is timestamped by the debug driver, so the log delay is reported
+relative to the smallest delay seen for each block. The CPU time is the
+time used by the server process during the measurement, it's left out on
+platforms where it can't be read.
+"""
+
+import json
+import os
+import struct
+import subprocess
+import sys
+import time
+import zmq
+from threading import Event
+from threading import Thread
+
+from cfzmq import CTRL_BINARY_HEADER
+from cfzmq import CTRL_BINARY_MAGIC
+from cfzmq import LOG_BINARY_HEADER
+from cfzmq import LOG_BINARY_MAGIC
+from cfzmq import LOG_ENCODINGS
+from cfzmq import LOG_ENCODING_BINARY
+from cfzmq import SETPOINT_RPYT
+from cfzmq import ZMQ_CTRL_PORT
+from cfzmq import ZMQ_LOG_PORT
+from cfzmq import ZMQ_SRV_PORT
+
+__all__ = ['main']
+
+# Time to wait for the server to start
+SERVER_START_TIMEOUT = 20
+# Timeout for the commands used to set up the benchmark
+SETUP_TIMEOUT = 15
+
+_RPYT_SETPOINT = struct.pack(CTRL_BINARY_HEADER + "fffH", CTRL_BINARY_MAGIC,
+                             SETPOINT_RPYT, 0, 0, 0, 0)
+
+
+def _percentiles(values, scale=1000.0):
+    """Return the percentiles of values, scaled (by default to ms)"""
+    if not values:
+        return None
+    values = sorted(values)
+    out = {}
+    for p in (50, 90, 99):
+        index = min(len(values) - 1, int(len(values) * p / 100.0))
+        out["p{}".format(p)] = values[index] * scale
+    out["max"] = values[-1] * scale
+    return out
+
+
+def _process_cpu(pid):
+    """Return the CPU time (s) used so far by a process, or None if it's not
+    available on this platform"""
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            # The command may contain spaces, the fields follow the last ')'
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / float(
+            os.sysconf("SC_CLK_TCK"))
+    except (IOError, IndexError, ValueError):
+        return None
+
+
+def _children_cpu():
+    """Return the CPU time (s) used so far by the terminated child
+    processes, or None if it's not available on this platform"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class _SubClient(Thread):
+    """Receives log data and measures the delay of the data frames"""
+
+    def __init__(self, context, address, stop, *args):
+        super(_SubClient, self).__init__(*args)
+        self._socket = context.socket(zmq.SUB)
+        self._socket.connect(address)
+        self._socket.setsockopt(zmq.SUBSCRIBE, b"")
+        self._finished = stop
+        self.frames = 0
+        self.events = 0
+        # Host receive time minus Crazyflie timestamp for each block
+        self._offsets = {}
+        # Samples missing in the sequence numbers, dropped by the server or
+        # by ZMQ before reaching this client
+        self.lost = 0
+        self._seqs = {}
+
+    def run(self):
+        while not self._finished.is_set():
+            if not self._socket.poll(100):
+                continue
+            (topic, payload) = self._socket.recv_multipart()
+            now = time.time()
+            if payload[0] == LOG_BINARY_MAGIC:
+                (_, _, ts, seq, _) = struct.unpack_from(LOG_BINARY_HEADER,
+                                                        payload)
+            else:
+                msg = json.loads(payload)
+                if msg["event"] != "data":
+                    self.events += 1
+                    continue
+                ts = msg["timestamp"]
+                seq = msg["seq"]
+            self.frames += 1
+            if topic in self._seqs:
+                self.lost += max(0, seq - self._seqs[topic] - 1)
+            self._seqs[topic] = seq
+            self._offsets.setdefault(topic, []).append(now - ts / 1000.0)
+        self._socket.close()
+
+    def delays(self):
+        """Return the delays relative to the smallest delay of each block"""
+        out = []
+        for offsets in self._offsets.values():
+            smallest = min(offsets)
+            out += [offset - smallest for offset in offsets]
+        return out
+
+
+class _PushClient(Thread):
+    """Sends set-points, at a fixed rate or as fast as possible"""
+
+    def __init__(self, context, address, uri, rate, stop, *args):
+        super(_PushClient, self).__init__(*args)
+        self._socket = context.socket(zmq.PUSH)
+        self._socket.connect(address)
+        self._uri = uri.encode("utf-8")
+        self._period = 1.0 / rate if rate else 0
+        self._finished = stop
+        self.sent = 0
+
+    def run(self):
+        next_send = time.time()
+        while not self._finished.is_set():
+            if self._period:
+                delay = next_send - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                next_send += self._period
+            # The URI frame is ignored unless the server is in multi mode
+            self._socket.send_multipart([self._uri, _RPYT_SETPOINT])
+            self.sent += 1
+        self._socket.close(linger=0)
+
+
+class _ReqClient(Thread):
+    """Sends commands one at a time and measures the round trip time"""
+
+    def __init__(self, context, address, cmd, stop, *args):
+        super(_ReqClient, self).__init__(*args)
+        self._context = context
+        self._address = address
+        self._cmd = json.dumps(cmd).encode("utf-8")
+        self._finished = stop
+        self.latencies = []
+        self.failed = 0
+
+    def run(self):
+        socket = self._context.socket(zmq.REQ)
+        socket.connect(self._address)
+        while not self._finished.is_set():
+            start = time.time()
+            socket.send(self._cmd)
+            if not socket.poll(SETUP_TIMEOUT * 1000):
+                # A REQ socket can not send again without a response
+                self.failed += 1
+                break
+            resp = json.loads(socket.recv())
+            if resp["status"] != 0:
+                self.failed += 1
+            self.latencies.append(time.time() - start)
+        socket.close(linger=0)
+
+
+class _Benchmark():
+    """Runs the server and the clients"""
+
+    def __init__(self, args):
+        self._args = args
+        self._context = zmq.Context()
+        self._server = None
+        self._req = None
+        self._total_cpu = None
+
+    def _address(self, port):
+        return "{}:{}".format(self._args.url, self._args.port + port)
+
+    def _start_server(self):
+        cmd = [sys.executable, "-m", "cfzmq", "-u", self._args.url,
+               "-p", str(self._args.port), "--log-encoding",
+               self._args.encoding] + self._args.server_args
+        output = None if self._args.verbose else subprocess.DEVNULL
+        self._server = subprocess.Popen(cmd, stdout=output, stderr=output)
+
+    def _command(self, cmd, timeout=SETUP_TIMEOUT):
+        """Send a command on the setup socket and return the response"""
+        cmd = dict(cmd, version=1)
+        self._req.send(json.dumps(cmd).encode("utf-8"))
+        if not self._req.poll(timeout * 1000):
+            raise RuntimeError("No response to {}".format(cmd))
+        return json.loads(self._req.recv())
+
+    def _wait_for_server(self):
+        deadline = time.time() + SERVER_START_TIMEOUT
+        while time.time() < deadline:
+            if self._server.poll() is not None:
+                raise RuntimeError("Server exited with {}".format(
+                    self._server.returncode))
+            self._req = self._context.socket(zmq.REQ)
+            self._req.connect(self._address(ZMQ_SRV_PORT))
+            try:
+                self._command({"cmd": "stats"}, timeout=1)
+                return
+            except RuntimeError:
+                # The REQ socket is stuck waiting for the response
+                self._req.close(linger=0)
+        raise RuntimeError("Server did not start")
+
+    def _setup(self):
+        """Connect to the Crazyflie and start the log blocks"""
+        resp = self._command({"cmd": "connect", "uri": self._args.uri})
+        if resp["status"] != 0:
+            raise RuntimeError("Could not connect to {}: {}".format(
+                self._args.uri, resp.get("msg")))
+        events = self._context.socket(zmq.SUB)
+        events.connect(self._address(ZMQ_LOG_PORT))
+        events.setsockopt(zmq.SUBSCRIBE, b"")
+        try:
+            for i in range(self._args.blocks):
+                name = "bench{}".format(i)
+                self._log_command({"cmd": "log", "action": "create",
+                                   "name": name, "period": self._args.period,
+                                   "variables": self._args.variables})
+                # Some versions of cflib start the block when it's created
+                if not self._wait_started(events, name):
+                    self._log_command({"cmd": "log", "action": "start",
+                                       "name": name})
+        finally:
+            events.close(linger=0)
+
+    def _log_command(self, cmd):
+        resp = self._command(dict(cmd, uri=self._args.uri))
+        if resp["status"] != 0:
+            raise RuntimeError("Could not {} log block {}: {}".format(
+                cmd["action"], cmd["name"], resp.get("msg")))
+
+    @staticmethod
+    def _wait_started(events, name, timeout=1):
+        """Return True if the block is reported as started within timeout"""
+        deadline = time.time() + timeout
+        while events.poll(max(0, int((deadline - time.time()) * 1000))):
+            payload = events.recv_multipart()[-1]
+            if payload[0] == LOG_BINARY_MAGIC:
+                continue
+            msg = json.loads(payload)
+            if msg["name"] == name and msg["event"] == "started":
+                return True
+        return False
+
+    def run(self):
+        """Run the benchmark and return the results"""
+        cpu_before = _children_cpu()
+        self._start_server()
+        try:
+            self._wait_for_server()
+            return self._measure()
+        finally:
+            if self._req:
+                self._req.close(linger=0)
+            self._server.kill()
+            self._server.wait()
+            self._context.term()
+            if cpu_before is not None:
+                self._total_cpu = _children_cpu() - cpu_before
+
+    def total_cpu(self):
+        """Return the CPU time used by the server in total, including the
+        start-up, None if it's not available on this platform"""
+        return self._total_cpu
+
+    def _measure(self):
+        args = self._args
+        self._setup()
+        stop = Event()
+        subs = [_SubClient(self._context, self._address(ZMQ_LOG_PORT), stop)
+                for _ in range(args.sub)]
+        pushes = [_PushClient(self._context, self._address(ZMQ_CTRL_PORT),
+                              args.uri, args.ctrl_rate, stop)
+                  for _ in range(args.push)]
+        reqs = [_ReqClient(self._context, self._address(ZMQ_SRV_PORT),
+                           {"version": 1, "cmd": "toc", "crc_only": True,
+                            "uri": args.uri}, stop)
+                for _ in range(args.req)]
+        clients = subs + pushes + reqs
+        stats_before = self._command({"cmd": "stats"})
+        cpu_before = _process_cpu(self._server.pid)
+        start = time.time()
+        for client in clients:
+            client.start()
+        time.sleep(args.duration)
+        stop.set()
+        for client in clients:
+            client.join()
+        elapsed = time.time() - start
+        cpu_after = _process_cpu(self._server.pid)
+        stats = self._command({"cmd": "stats"})
+
+        results = {"duration": elapsed, "sub": args.sub, "push": args.push,
+                   "req": args.req, "blocks": args.blocks,
+                   "encoding": args.encoding,
+                   "server_args": args.server_args}
+        frames = sum(c.frames for c in subs)
+        delays = []
+        for client in subs:
+            delays += client.delays()
+        results["log"] = {"frames": frames, "rate": frames / elapsed,
+                          "lost": sum(c.lost for c in subs),
+                          "delay_ms": _percentiles(delays)}
+        sent = sum(c.sent for c in pushes)
+        ctrl = {}
+        for name in stats["ctrl"]:
+            ctrl[name] = stats["ctrl"][name] - stats_before["ctrl"][name]
+        results["ctrl"] = dict(ctrl, sent=sent, rate=sent / elapsed)
+        latencies = []
+        for client in reqs:
+            latencies += client.latencies
+        results["cmd"] = {"commands": len(latencies),
+                          "rate": len(latencies) / elapsed,
+                          "failed": sum(c.failed for c in reqs),
+                          "latency_ms": _percentiles(latencies)}
+        dropped = 0
+        for name in stats["publisher"]["sockets"]:
+            dropped += (stats["publisher"]["sockets"][name]["dropped"] -
+                        stats_before["publisher"]["sockets"][name]["dropped"])
+        results["publisher"] = {"dropped": dropped,
+                                "max_depth": stats["publisher"]["max_depth"]}
+        if cpu_before is not None and cpu_after is not None:
+            cpu = cpu_after - cpu_before
+            # Each message is handled once by the server, no matter how
+            # many subscribers receive it
+            messages = (frames / max(1, args.sub) + ctrl["received"] +
+                        len(latencies))
+            results["cpu"] = {"seconds": cpu,
+                              "percent": 100.0 * cpu / elapsed,
+                              "us_per_message": 1e6 * cpu / max(1, messages)}
+        return results
+
+
+def _format(results):
+    lines = ["Duration {:.1f} s, {} SUB, {} PUSH, {} REQ clients, {} log "
+             "blocks ({})".format(results["duration"], results["sub"],
+                                  results["push"], results["req"],
+                                  results["blocks"], results["encoding"])]
+
+    def percentiles(p):
+        if not p:
+            return "-"
+        return "p50 {p50:.2f} p90 {p90:.2f} p99 {p99:.2f} max {max:.2f} " \
+               "ms".format(**p)
+
+    log = results["log"]
+    lines.append("Log:      {} frames, {:.0f} frames/s, {} lost, delay "
+                 "{}".format(log["frames"], log["rate"], log["lost"],
+                             percentiles(log["delay_ms"])))
+    ctrl = results["ctrl"]
+    lines.append("Control:  {} sent, {:.0f} set-points/s, {} received, {} "
+                 "forwarded, {} conflated, {} errors".format(
+                     ctrl["sent"], ctrl["rate"], ctrl["received"],
+                     ctrl["forwarded"], ctrl["conflated"], ctrl["errors"]))
+    cmd = results["cmd"]
+    lines.append("Commands: {} done, {:.0f} commands/s, {} failed, latency "
+                 "{}".format(cmd["commands"], cmd["rate"], cmd["failed"],
+                             percentiles(cmd["latency_ms"])))
+    lines.append("Publish:  {} dropped, max queue depth {}".format(
+        results["publisher"]["dropped"], results["publisher"]["max_depth"]))
+    if "cpu" in results:
+        cpu = results["cpu"]
+        lines.append("Server:   {:.2f} s CPU ({:.0f}%), {:.1f} us per "
+                     "message".format(cpu["seconds"], cpu["percent"],
+                                      cpu["us_per_message"]))
+    if "total_cpu" in results:
+        lines.append("Server:   {:.2f} s CPU in total".format(
+            results["total_cpu"]))
+    return "\n".join(lines)
+
+
+def main():
+    """Benchmark the Crazyflie ZMQ server"""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="cfzmq-bench")
+    parser.add_argument("-u", "--url", action="store", dest="url", type=str,
+                        default="tcp://127.0.0.1",
+                        help="URL where the server accepts connections")
+    parser.add_argument("-p", "--port", action="store", dest="port", type=int,
+                        default=2100,
+                        help="Base port used for the server ZMQ sockets")
+    parser.add_argument("--uri", action="store", dest="uri", type=str,
+                        default="debug://0/0",
+                        help="URI of the Crazyflie the server connects to")
+    parser.add_argument("-t", "--duration", action="store", dest="duration",
+                        type=float, default=5,
+                        help="Time (s) to run the clients")
+    parser.add_argument("--sub", action="store", dest="sub", type=int,
+                        default=1, help="Number of log SUB clients")
+    parser.add_argument("--push", action="store", dest="push", type=int,
+                        default=1, help="Number of set-point PUSH clients")
+    parser.add_argument("--req", action="store", dest="req", type=int,
+                        default=1, help="Number of command REQ clients")
+    parser.add_argument("--ctrl-rate", action="store", dest="ctrl_rate",
+                        type=float, default=0,
+                        help="Set-points/s sent by each PUSH client, 0 to "
+                             "send as fast as possible")
+    parser.add_argument("--blocks", action="store", dest="blocks", type=int,
+                        default=4, help="Number of log blocks")
+    parser.add_argument("--period", action="store", dest="period", type=int,
+                        default=10, help="Log period (ms)")
+    parser.add_argument("--variables", action="store", dest="variables",
+                        nargs="+", default=["stabilizer.roll",
+                                            "stabilizer.pitch",
+                                            "stabilizer.yaw"],
+                        help="Variables in each log block")
+    parser.add_argument("--encoding", action="store", dest="encoding",
+                        choices=LOG_ENCODINGS, default=LOG_ENCODING_BINARY,
+                        help="Encoding of the log data")
+    parser.add_argument("--json", action="store_true", dest="json",
+                        help="Print the results as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        dest="verbose", help="Show the server output")
+    parser.add_argument("server_args", nargs=argparse.REMAINDER,
+                        help="Extra arguments for the server, after --")
+    args = parser.parse_args()
+    if args.server_args[:1] == ["--"]:
+        args.server_args = args.server_args[1:]
+
+    bench = _Benchmark(args)
+    try:
+        results = bench.run()
+    except RuntimeError as e:
+        print("Benchmark failed: {}".format(e))
+        sys.exit(1)
+    total_cpu = bench.total_cpu()
+    if total_cpu is not None:
+        results["total_cpu"] = total_cpu
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(_format(results))
+
+
+if __name__ == "__main__":
+    main()
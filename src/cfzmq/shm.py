@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2015 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+"""
+Ring buffers in shared memory used to hand log data to local clients.
+
+A ring starts with a header, followed by the schema as JSON and the slots.
+The header holds the sequence number of the newest sample, each slot holds
+a sample packed as the format in the schema: sequence number, timestamp,
+host timestamp and the values of the variables. Sequence numbers start at 1
+and the sample with sequence number N is stored in slot N % slots.
+
+There's one writer (the server) and any number of readers. A reader checks
+the sequence number of a slot after unpacking it to detect samples that
+were overwritten while being read.
+"""
+
+import json
+import struct
+
+try:
+    from multiprocessing import resource_tracker
+    from multiprocessing import shared_memory
+except ImportError as e:
+    raise Exception("Shared memory needs Python 3.8 or later ({})".format(e))
+
+__all__ = ['LogRingReader', 'LogRingWriter']
+
+RING_MAGIC = b"CFLR"
+RING_VERSION = 1
+# Number of samples kept in a ring
+RING_SLOTS = 1024
+# Start of the slot format (sequence number, timestamp, host timestamp), the
+# values follow
+SLOT_HEADER = "<QId"
+
+# Magic, version, reserved, number of slots, slot size and schema length
+_HEADER = struct.Struct("<4sHHIII")
+_SEQ = struct.Struct("<Q")
+_SEQ_OFFSET = 24
+_SCHEMA_OFFSET = _SEQ_OFFSET + _SEQ.size
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+def _attach(name):
+    """Attach to an existing segment without taking ownership of it"""
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13 the resource tracker removes all segments a
+        # process has used when it exits, not only the ones it created
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class LogRingWriter():
+    """Writes the samples of one log block to a new ring"""
+
+    def __init__(self, name, value_format, variables, slots=RING_SLOTS):
+        self._slot = struct.Struct(SLOT_HEADER + value_format)
+        self._slot_size = _align(self._slot.size)
+        self._slots = slots
+        self.schema = {"format": self._slot.format, "variables": variables}
+        schema = json.dumps(self.schema).encode("utf-8")
+        self._data_offset = _align(_SCHEMA_OFFSET + len(schema))
+        self._shm = shared_memory.SharedMemory(
+            name, create=True,
+            size=self._data_offset + slots * self._slot_size)
+        self.name = self._shm.name
+
+        buf = self._shm.buf
+        _HEADER.pack_into(buf, 0, RING_MAGIC, RING_VERSION, 0, slots,
+                          self._slot_size, len(schema))
+        _SEQ.pack_into(buf, _SEQ_OFFSET, 0)
+        buf[_SCHEMA_OFFSET:_SCHEMA_OFFSET + len(schema)] = schema
+
+    def write(self, seq, ts, host_ts, values):
+        """Write a sample, the sequence number has to be larger than the one
+        of the previous sample"""
+        offset = self._data_offset + (seq % self._slots) * self._slot_size
+        buf = self._shm.buf
+        # Invalidate the slot before the values change, so readers of the
+        # old sample can tell it was overwritten
+        _SEQ.pack_into(buf, offset, 0)
+        self._slot.pack_into(buf, offset, seq, ts, host_ts, *values)
+        _SEQ.pack_into(buf, _SEQ_OFFSET, seq)
+
+    def close(self):
+        """Close and remove the ring, readers keep their mapping"""
+        self._shm.close()
+        self._shm.unlink()
+
+
+class LogRingReader():
+    """Reads the samples of one log block from a ring. Only samples written
+    after the reader was opened are returned."""
+
+    def __init__(self, name):
+        self._shm = _attach(name)
+        buf = self._shm.buf
+        (magic, version, _, self.slots, self._slot_size,
+         schema_size) = _HEADER.unpack_from(buf, 0)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            self._shm.close()
+            raise ValueError("{} is not a log ring".format(name))
+        self.schema = json.loads(bytes(
+            buf[_SCHEMA_OFFSET:_SCHEMA_OFFSET + schema_size]).decode("utf-8"))
+        self.variables = [v["name"] for v in self.schema["variables"]]
+        self._slot = struct.Struct(self.schema["format"])
+        self._data_offset = _align(_SCHEMA_OFFSET + schema_size)
+        self._next = self.latest_seq + 1
+        # Samples that were overwritten before they were read
+        self.lost = 0
+
+    @property
+    def latest_seq(self):
+        """Sequence number of the newest sample, 0 if none is written"""
+        return _SEQ.unpack_from(self._shm.buf, _SEQ_OFFSET)[0]
+
+    def read(self, up_to=None):
+        """Return the samples not read yet, up to and including the sequence
+        number up_to (by default the newest), as a list of (sequence number,
+        timestamp, host timestamp, values) with the values in the order of
+        variables"""
+        buf = self._shm.buf
+        latest = self.latest_seq
+        if up_to is not None:
+            latest = min(latest, up_to)
+        first = max(self._next, latest - self.slots + 1)
+        self.lost += first - self._next
+        samples = []
+        for seq in range(first, latest + 1):
+            offset = self._data_offset + (seq % self.slots) * self._slot_size
+            sample = self._slot.unpack_from(buf, offset)
+            if (sample[0] != seq or
+                    _SEQ.unpack_from(buf, offset)[0] != seq):
+                self.lost += 1
+                continue
+            samples.append((seq, sample[1], sample[2], sample[3:]))
+        self._next = max(self._next, latest + 1)
+        return samples
+
+    def close(self):
+        self._shm.close()
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+import asyncio
+import itertools
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+from cflib.crazyflie.log import LogConfig
+from cflib.crazyflie.toc import Toc
+
+from cfzmq import LOG_ENCODING_JSON
+from cfzmq import _CrazyflieHandler
+from cfzmq import _HandlerRegistry
+from cfzmq import _LogBlock
+from cfzmq import _TocCache
+from cfzmq import _TocSnapshot
+from cfzmq.asyncserver import _AsyncCrazyflieHandler
+
+URI = "debug://0/0"
+
+
+class _FakePublisher():
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, name, payload, topic=None, stats=None):
+        self.messages.append((name, payload, topic))
+
+
+def _handler():
+    return _CrazyflieHandler(_FakePublisher(), itertools.count(1),
+                             LOG_ENCODING_JSON, False, _TocCache())
+
+
+class ConnectTest(unittest.TestCase):
+
+    @mock.patch("cfzmq.CONNECT_TIMEOUT", 0.05)
+    def test_connect_times_out_when_link_never_answers(self):
+        handler = _handler()
+        with mock.patch.object(handler.cf, "open_link"), \
+                mock.patch.object(handler.cf, "close_link") as close_link:
+            resp = handler.connect(URI)
+
+        self.assertEqual(2, resp["status"])
+        self.assertIn(URI, resp["msg"])
+        close_link.assert_called_once_with()
+
+    @mock.patch("cfzmq.CONNECT_TIMEOUT", 0.05)
+    def test_connect_after_timeout_is_not_blocked(self):
+        handler = _handler()
+        with mock.patch.object(handler.cf, "open_link"), \
+                mock.patch.object(handler.cf, "close_link"):
+            handler.connect(URI)
+            resp = handler.connect(URI)
+
+        self.assertEqual(2, resp["status"])
+
+    def test_failed_connect_is_reported(self):
+        handler = _handler()
+
+        def open_link(uri):
+            handler._connection_failed(uri, "No answer")
+        with mock.patch.object(handler.cf, "open_link", open_link):
+            resp = handler.connect(URI)
+
+        self.assertEqual({"version": 1, "status": 1, "msg": "No answer"},
+                         resp)
+        self.assertEqual("failed", handler._publisher.messages[-1][1]["event"])
+
+
+class CreateLogBlockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = _handler()
+        self.old = _LogBlock(LogConfig("block", 10), mock.Mock())
+        self.handler._log_blocks["block"] = self.old
+        self.create = {"version": 1, "cmd": "log", "action": "create",
+                       "name": "block", "period": 10,
+                       "variables": ["no.such"]}
+
+    def test_invalid_config_keeps_existing_block(self):
+        with mock.patch.object(self.handler.cf.log, "add_config",
+                               side_effect=KeyError("no.such")):
+            resp = self.handler.handle_logging(self.create)
+
+        self.assertEqual(1, resp["status"])
+        self.assertIs(self.old, self.handler._log_blocks["block"])
+        self.old.encoder.close.assert_not_called()
+
+    def test_async_invalid_config_keeps_existing_block(self):
+        async def create():
+            handler = _AsyncCrazyflieHandler(
+                asyncio.get_running_loop(), _FakePublisher(),
+                itertools.count(1), LOG_ENCODING_JSON, False, _TocCache())
+            handler._log_blocks["block"] = self.old
+            with mock.patch.object(handler.cf.log, "add_config",
+                                   side_effect=KeyError("no.such")):
+                resp = await handler.handle_logging(self.create)
+            return (handler, resp)
+
+        (handler, resp) = asyncio.run(create())
+
+        self.assertEqual(1, resp["status"])
+        self.assertIs(self.old, handler._log_blocks["block"])
+        self.old.encoder.close.assert_not_called()
+
+
+class ParamsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = _handler()
+        self.values = {"ring.effect": "7"}
+        param = self.handler.cf.param
+        patches = [
+            mock.patch.object(param, "set_value", self._set_value),
+            mock.patch.object(param, "request_param_update",
+                              self._request_update),
+            mock.patch.object(param.toc, "get_element_by_complete_name",
+                              lambda name: name in self.values or None)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _set_value(self, name, value):
+        if name == "no.such":
+            raise KeyError("{} not in param TOC".format(name))
+        if name != "slow.param":
+            self.handler._all_param_update(name, value)
+
+    def _request_update(self, name):
+        self.handler._all_param_update(name, self.values[name])
+
+    @mock.patch("cfzmq.PARAM_TIMEOUT", 0.05)
+    def test_partial_failure(self):
+        resp = self.handler.handle_params({"params": [
+            {"name": "buzzer.freq", "value": 4000},
+            {"name": "no.such", "value": 1},
+            {"name": "ring.effect"},
+            {"name": "no.such.read"},
+            {"name": "slow.param", "value": 1}]})
+
+        self.assertEqual(1, resp["status"])
+        self.assertEqual("3 of 5 parameters failed", resp["msg"])
+        results = resp["params"]
+        self.assertEqual({"name": "buzzer.freq", "value": "4000",
+                          "status": 0}, results[0])
+        self.assertEqual(1, results[1]["status"])
+        self.assertEqual({"name": "ring.effect", "value": "7", "status": 0},
+                         results[2])
+        self.assertEqual(1, results[3]["status"])
+        self.assertEqual(3, results[4]["status"])
+        self.assertEqual({}, self.handler._param_waiters)
+
+    def test_all_succeed(self):
+        resp = self.handler.handle_params({"params": [
+            {"name": "buzzer.freq", "value": 4000}, {"name": "ring.effect"}]})
+
+        self.assertEqual(0, resp["status"])
+        self.assertEqual(["4000", "7"], [r["value"] for r in resp["params"]])
+
+
+class TocCrcTest(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = _handler()
+        element = types.SimpleNamespace(ident=0, ctype="uint8_t", access=0)
+        self.handler.cf.log.toc = Toc()
+        self.handler.cf.log.toc.toc = {"pm": {"state": element}}
+        self.handler.cf.param.toc = Toc()
+        self.handler.cf.param.toc.toc = {"ring": {"effect": element}}
+        self.handler.cf.param.values = {"ring": {"effect": "7"}}
+
+    def _connect(self, log_crc, param_crc):
+        self.handler.cf._toc_cache.fetch(log_crc)
+        self.handler.cf._toc_cache.fetch(param_crc)
+        return self.handler._connected_response({"version": 1, "status": 0},
+                                                None)
+
+    def test_crc_is_taken_from_the_fetched_tocs(self):
+        with mock.patch.object(_TocCache, "_crc") as crc:
+            first = self._connect(0x1234, 0x5678)
+            toc = self.handler._toc
+            again = self._connect(0x1234, 0x5678)
+            other = self._connect(0x1234, 0x9abc)
+
+        crc.assert_not_called()
+        self.assertEqual(first["toc_crc"], again["toc_crc"])
+        self.assertNotEqual(first["toc_crc"], other["toc_crc"])
+        self.assertIsNot(toc, self.handler._toc)
+        self.assertEqual({"type": "uint8_t", "access": "RW", "value": "7"},
+                         first["param"]["ring"]["effect"])
+
+
+class HandleTocTest(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = _handler()
+        element = types.SimpleNamespace(ident=0, ctype="float", access=1)
+        tocs = {"pm": {"vbat": element}, "ring": {"effect": element}}
+        self.handler._toc = _TocSnapshot(0x1234, tocs, tocs)
+        self.handler.cf.param.values = {"pm": {"vbat": "3.7"},
+                                        "ring": {"effect": "7"}}
+        patch = mock.patch.object(self.handler.cf, "is_connected",
+                                  return_value=True)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_crc_only(self):
+        resp = self.handler.handle_toc({"crc_only": True})
+
+        self.assertEqual({"version": 1, "status": 0, "toc_crc": 0x1234},
+                         resp)
+
+    def test_groups(self):
+        resp = self.handler.handle_toc({"groups": ["ring", "no.such"]})
+
+        self.assertEqual(0x1234, resp["toc_crc"])
+        self.assertEqual({"ring": {"effect": {"type": "float"}}},
+                         resp["log"])
+        self.assertEqual({"ring": {"effect": {"type": "float",
+                                              "access": "RO",
+                                              "value": "7"}}},
+                         resp["param"])
+
+    def test_all_groups(self):
+        resp = self.handler.handle_toc({})
+
+        self.assertEqual(["pm", "ring"], sorted(resp["log"]))
+        self.assertEqual("3.7", resp["param"]["pm"]["vbat"]["value"])
+
+    def test_not_connected(self):
+        self.handler._toc = None
+
+        self.assertEqual(1, self.handler.handle_toc({})["status"])
+
+
+class MultiConnectTest(unittest.TestCase):
+
+    @mock.patch("cfzmq.CONNECT_TIMEOUT", 1)
+    def test_hung_connect_does_not_block_other_crazyflies(self):
+        registry = _HandlerRegistry(_handler, multi=True)
+        hung = registry.for_connect("debug://0/1")
+        other = registry.for_connect("debug://0/2")
+        responses = []
+
+        def failed(uri):
+            other._connection_failed(uri, "No answer")
+        with mock.patch.object(hung.cf, "open_link"), \
+                mock.patch.object(hung.cf, "close_link"), \
+                mock.patch.object(other.cf, "open_link", failed):
+            thread = threading.Thread(
+                target=lambda: responses.append(hung.connect("debug://0/1")))
+            thread.start()
+            time.sleep(0.1)
+            start = time.time()
+            retry = hung.connect("debug://0/1")
+            resp = other.connect("debug://0/2")
+            elapsed = time.time() - start
+            thread.join()
+
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(3, retry["status"])
+        self.assertEqual(1, resp["status"])
+        self.assertEqual(2, responses[0]["status"])
+
+
+class AsyncConnectTest(unittest.TestCase):
+
+    @mock.patch("cfzmq.asyncserver.CONNECT_TIMEOUT", 0.05)
+    def test_connect_times_out_when_link_never_answers(self):
+        async def connect():
+            handler = _AsyncCrazyflieHandler(
+                asyncio.get_running_loop(), _FakePublisher(),
+                itertools.count(1), LOG_ENCODING_JSON, False, _TocCache())
+            with mock.patch.object(handler.cf, "open_link"), \
+                    mock.patch.object(handler.cf, "close_link") as close:
+                resp = await handler.connect(URI)
+            return (handler, resp, close)
+
+        (handler, resp, close_link) = asyncio.run(connect())
+
+        self.assertEqual(2, resp["status"])
+        self.assertIsNone(handler._conn_future)
+        close_link.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+import struct
+import unittest
+
+from cflib.crazyflie.log import LogConfig
+
+from cfzmq import LOG_BINARY_HEADER
+from cfzmq import LOG_BINARY_MAGIC
+from cfzmq import LOG_ENCODING_BINARY
+from cfzmq import _LogBinaryEncoder
+
+
+def _block():
+    conf = LogConfig("stab", 10)
+    conf.add_variable("stabilizer.roll", "float")
+    conf.add_variable("pm.state", "int8_t")
+    conf.add_variable("motor.m1", "uint16_t")
+    return conf
+
+
+class LogBinaryEncoderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.encoder = _LogBinaryEncoder(7, _block())
+        self.data = {"stabilizer.roll": 1.5, "pm.state": -2,
+                     "motor.m1": 60000}
+
+    def test_schema_describes_the_frames(self):
+        schema = self.encoder.schema
+
+        self.assertEqual(LOG_ENCODING_BINARY, schema["encoding"])
+        self.assertEqual(7, schema["id"])
+        self.assertEqual(LOG_BINARY_HEADER + "fbH", schema["format"])
+        self.assertEqual([{"name": "stabilizer.roll", "type": "float"},
+                          {"name": "pm.state", "type": "int8_t"},
+                          {"name": "motor.m1", "type": "uint16_t"}],
+                         schema["variables"])
+
+    def test_frame_round_trip(self):
+        frame = self.encoder.encode(42, 1234.25, 16777215, self.data)
+
+        values = struct.unpack(self.encoder.schema["format"], frame)
+
+        self.assertEqual((LOG_BINARY_MAGIC, 7, 16777215, 42, 1234.25),
+                         values[:5])
+        self.assertEqual((1.5, -2, 60000), values[5:])
+        self.assertEqual(struct.calcsize(self.encoder.schema["format"]),
+                         len(frame))
+
+    def test_values_follow_the_variable_order(self):
+        data = dict(reversed(list(self.data.items())))
+
+        frame = self.encoder.encode(1, 0.0, 0, data)
+
+        header = struct.calcsize(LOG_BINARY_HEADER)
+        self.assertEqual((1.5, -2, 60000),
+                         struct.unpack("<fbH", frame[header:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
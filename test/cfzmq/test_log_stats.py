@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+import itertools
+import unittest
+from unittest import mock
+
+from cflib.crazyflie.log import LogConfig
+
+from cfzmq import LOG_ENCODING_JSON
+from cfzmq import LOG_TIMESTAMP_RANGE
+from cfzmq import _CrazyflieHandler
+from cfzmq import _LogBlock
+from cfzmq import _LogStats
+from cfzmq import _TocCache
+
+
+class _FakePublisher():
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, name, payload, topic=None, stats=None):
+        self.messages.append(payload)
+
+
+class LogStatsTest(unittest.TestCase):
+
+    def test_seq_counts_samples(self):
+        stats = _LogStats(10)
+
+        self.assertEqual([1, 2, 3], [stats.sample(t / 100, t * 10)
+                                     for t in range(3)])
+        self.assertEqual(0, stats.missed)
+
+    def test_missed_from_timestamp_gaps(self):
+        stats = _LogStats(10)
+        for ts in (100, 110, 140, 150, 180):
+            stats.sample(ts / 1000, ts)
+
+        self.assertEqual(5, stats.seq)
+        self.assertEqual(4, stats.missed)
+
+    def test_missed_across_timestamp_wrap(self):
+        stats = _LogStats(10)
+        stats.sample(0.0, LOG_TIMESTAMP_RANGE - 10)
+        stats.sample(0.01, 0)
+        stats.sample(0.04, 20)
+
+        self.assertEqual(1, stats.missed)
+
+    def test_jitter(self):
+        stats = _LogStats(10)
+        stats.sample(0.0, 0)
+        stats.sample(0.010, 10)
+        self.assertAlmostEqual(0.0, stats.jitter)
+        stats.sample(0.036, 20)
+
+        self.assertAlmostEqual(1.0, stats.jitter)
+
+    def test_report_rate(self):
+        with mock.patch("time.time", return_value=100.0):
+            stats = _LogStats(10)
+        for t in range(50):
+            stats.sample(100 + t / 100, t * 10)
+        stats.published = 48
+        stats.dropped = 2
+        with mock.patch("time.time", return_value=102.0):
+            report = stats.report()
+        with mock.patch("time.time", return_value=103.0):
+            second = stats.report()
+
+        self.assertEqual({"received": 50, "published": 48, "dropped": 2,
+                          "missed": 0, "jitter": 0.0, "rate": 25.0},
+                         report)
+        self.assertEqual(0.0, second["rate"])
+
+
+class PublishLogStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.publisher = _FakePublisher()
+        self.handler = _CrazyflieHandler(self.publisher, itertools.count(1),
+                                         LOG_ENCODING_JSON, False,
+                                         _TocCache())
+        self.conf = LogConfig("imu", 10)
+        self.handler._log_blocks["imu"] = _LogBlock(self.conf)
+
+    def test_data_carries_seq(self):
+        for ts in (0, 10, 30):
+            self.handler._logdata_callback(ts, {"acc.x": 0.5}, self.conf)
+
+        self.assertEqual([1, 2, 3], [m["seq"] for m in self.publisher.messages])
+
+    def test_stats_only_for_started_blocks(self):
+        for ts in (0, 10, 30):
+            self.handler._logdata_callback(ts, {"acc.x": 0.5}, self.conf)
+        self.handler.publish_log_stats()
+        self.assertEqual(3, len(self.publisher.messages))
+
+        self.conf.started = True
+        self.handler.publish_log_stats()
+
+        stats = self.publisher.messages[-1]
+        self.assertEqual("stats", stats["event"])
+        self.assertEqual("imu", stats["name"])
+        self.assertEqual(10, stats["period"])
+        self.assertEqual(3, stats["received"])
+        self.assertEqual(1, stats["missed"])
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+import itertools
+import json
+import time
+import unittest
+
+import zmq
+from cflib.crazyflie.log import LogConfig
+
+from cfzmq import LOG_ENCODING_JSON
+from cfzmq import _CrazyflieHandler
+from cfzmq import _LogBlock
+from cfzmq import _LogStats
+from cfzmq import _PubQueue
+from cfzmq import _PubThread
+from cfzmq import _TocCache
+
+
+def _handler(publisher, multi):
+    handler = _CrazyflieHandler(publisher, itertools.count(1),
+                                LOG_ENCODING_JSON, multi, _TocCache())
+    handler.uri = "radio://0/80/2M"
+    conf = LogConfig("stab", 10)
+    handler._log_blocks["stab"] = _LogBlock(conf)
+    return (handler, conf)
+
+
+class TopicFramesTest(unittest.TestCase):
+
+    def test_frames_with_topic(self):
+        frames = _PubQueue.frames({"event": "data"}, "stab")
+
+        self.assertEqual([b"stab", b'{"event": "data"}'], frames)
+
+    def test_frames_without_topic(self):
+        self.assertEqual([b"\xcf\x01"], _PubQueue.frames(b"\xcf\x01", None))
+
+    def test_log_data_is_published_with_block_name_as_topic(self):
+        queue = _PubQueue(["log"])
+        (handler, conf) = _handler(queue, False)
+
+        handler._logdata_callback(100, {"stabilizer.roll": 1.0}, conf)
+
+        [(name, payload, topic, _)] = queue.get(block=False)
+        self.assertEqual("log", name)
+        self.assertEqual("stab", topic)
+        self.assertEqual("stab", payload["name"])
+
+    def test_topic_is_prefixed_by_uri_with_several_crazyflies(self):
+        queue = _PubQueue(["log"])
+        (handler, conf) = _handler(queue, True)
+
+        handler._logdata_callback(100, {"stabilizer.roll": 1.0}, conf)
+
+        [(_, _, topic, _)] = queue.get(block=False)
+        self.assertEqual("radio://0/80/2M stab", topic)
+
+
+class PubQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = _PubQueue(["log", "param"], size=3)
+
+    def test_full_queue_drops_the_oldest(self):
+        for i in range(5):
+            self.queue.publish("log", {"i": i})
+
+        messages = self.queue.get(block=False)
+
+        self.assertEqual([2, 3, 4], [m[1]["i"] for m in messages])
+
+    def test_counters(self):
+        for i in range(4):
+            self.queue.publish("log", {"i": i})
+        self.queue.publish("param", {"i": 4})
+
+        self.queue.sent(self.queue.get(block=False))
+
+        stats = self.queue.stats()
+        self.assertEqual({"queued": 4, "sent": 2, "dropped": 2},
+                         stats["sockets"]["log"])
+        self.assertEqual({"queued": 1, "sent": 1, "dropped": 0},
+                         stats["sockets"]["param"])
+        self.assertEqual(3, stats["size"])
+        self.assertEqual(3, stats["max_depth"])
+        self.assertEqual(0, stats["depth"])
+
+    def test_dropped_samples_are_counted_for_their_block(self):
+        stats = _LogStats(10)
+        for i in range(5):
+            self.queue.publish("log", {"i": i}, "stab", stats)
+
+        self.queue.sent(self.queue.get(block=False))
+
+        self.assertEqual(2, stats.dropped)
+        self.assertEqual(3, stats.published)
+
+    def test_wakeup_when_queue_becomes_non_empty(self):
+        wakeups = []
+        queue = _PubQueue(["log"], wakeup=lambda: wakeups.append(1))
+
+        queue.publish("log", {})
+        queue.publish("log", {})
+        queue.get(block=False)
+        queue.publish("log", {})
+
+        self.assertEqual(2, len(wakeups))
+
+
+class TopicSubscriptionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = zmq.Context()
+        self.pub = self.context.socket(zmq.PUB)
+        self.pub.bind("inproc://cfzmq-test-log")
+        self.sub = self.context.socket(zmq.SUB)
+        self.sub.connect("inproc://cfzmq-test-log")
+        self.sub.setsockopt(zmq.SUBSCRIBE, b"stab")
+        self.publisher = _PubThread({"log": self.pub})
+        self.publisher.daemon = True
+        self.publisher.start()
+
+    def tearDown(self):
+        self.sub.close(linger=0)
+        # The publish thread keeps using its socket, leave the context
+        # to the garbage collector
+
+    def _receive(self):
+        """Publish until the subscription is active and return the first
+        message received"""
+        for _ in range(100):
+            self.publisher.publish("log", {"name": "pos"}, "pos")
+            self.publisher.publish("log", {"name": "stab"}, "stab")
+            if self.sub.poll(20):
+                return self.sub.recv_multipart()
+        self.fail("No message received")
+
+    def test_subscriber_only_receives_its_topic(self):
+        frames = self._receive()
+        time.sleep(0.05)
+        while self.sub.poll(0):
+            frames += self.sub.recv_multipart()
+
+        self.assertEqual(0, len(frames) % 2)
+        for topic, payload in zip(frames[::2], frames[1::2]):
+            self.assertEqual(b"stab", topic)
+            self.assertEqual("stab", json.loads(payload)["name"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+import json
+import struct
+import unittest
+from unittest import mock
+
+from cfzmq import CTRL_BINARY_HEADER
+from cfzmq import CTRL_BINARY_MAGIC
+from cfzmq import CTRL_SAFE_HOVER
+from cfzmq import CTRL_SAFE_RATE
+from cfzmq import SETPOINT_FULL_STATE
+from cfzmq import SETPOINT_HOVER
+from cfzmq import _SETPOINTS
+from cfzmq import _SetpointForwarder
+
+URI = "debug://0/0"
+
+
+class _FakeCommander():
+
+    def __init__(self):
+        self.setpoints = []
+
+    def send_setpoint(self, *args):
+        self.setpoints.append(("rpyt", args))
+
+    def send_hover_setpoint(self, *args):
+        self.setpoints.append(("hover", args))
+
+
+class _FakeCf():
+
+    def __init__(self):
+        self.commander = _FakeCommander()
+
+
+class _FakeHandler():
+
+    def __init__(self):
+        self.cf = _FakeCf()
+
+
+class SetpointForwarderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = _FakeHandler()
+        self.forwarder = _SetpointForwarder(lambda uri: self.handler,
+                                            timeout=100,
+                                            safe=CTRL_SAFE_HOVER)
+        self.setpoint = [json.dumps({"uri": URI, "roll": 0, "pitch": 0,
+                                     "yaw": 0, "thrust": 0}).encode("utf-8")]
+
+    def _hovers(self):
+        return [s for s in self.handler.cf.commander.setpoints
+                if s[0] == "hover"]
+
+    def test_safe_setpoint_is_resent_while_timed_out(self):
+        self.forwarder.receive([self.setpoint], 0.0)
+        self.forwarder.update(0.0)
+        safe_period = 1.0 / CTRL_SAFE_RATE
+
+        for i in range(5):
+            now = 0.2 + i * (safe_period + 0.001)
+            self.forwarder.update(now)
+            self.forwarder.update(now + safe_period / 2)
+
+        stats = self.forwarder.stats()
+        self.assertEqual(5, len(self._hovers()))
+        self.assertEqual(1, stats["timeouts"])
+        self.assertEqual(5, stats["safe_sent"])
+        self.assertEqual(6, stats["forwarded"])
+
+    def test_poll_timeout_wakes_up_for_resend(self):
+        self.forwarder.receive([self.setpoint], 0.0)
+        self.forwarder.update(0.0)
+        self.forwarder.update(0.2)
+
+        actual = self.forwarder.poll_timeout(0.2)
+
+        self.assertEqual(int(1000.0 / CTRL_SAFE_RATE), actual)
+
+    def test_setpoint_stops_resend(self):
+        self.forwarder.receive([self.setpoint], 0.0)
+        self.forwarder.update(0.0)
+        self.forwarder.update(0.2)
+
+        self.forwarder.receive([self.setpoint], 0.25)
+        self.forwarder.update(0.25)
+        self.forwarder.update(0.3)
+
+        self.assertEqual(1, len(self._hovers()))
+        self.assertEqual(2, len(self.handler.cf.commander.setpoints) -
+                         len(self._hovers()))
+        self.assertEqual(1, self.forwarder.stats()["safe_sent"])
+
+
+class UnsupportedSetpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = _FakeHandler()
+        self.forwarder = _SetpointForwarder(lambda uri: self.handler)
+
+    @mock.patch.object(_SETPOINTS[SETPOINT_FULL_STATE], "supported", False)
+    def test_unsupported_setpoint_is_counted_and_dropped(self):
+        frame = struct.pack(CTRL_BINARY_HEADER + "f" * 16, CTRL_BINARY_MAGIC,
+                            SETPOINT_FULL_STATE, *([0.0] * 16))
+
+        self.forwarder.receive([[frame]], 0.0)
+        self.forwarder.update(0.0)
+
+        stats = self.forwarder.stats()
+        self.assertEqual(1, stats["unsupported"])
+        self.assertEqual(0, stats["errors"])
+        self.assertEqual(0, stats["forwarded"])
+
+    @mock.patch.object(_SETPOINTS[SETPOINT_HOVER], "supported", False)
+    def test_unsupported_safe_setpoint_is_rejected(self):
+        with self.assertRaises(ValueError):
+            _SetpointForwarder(lambda uri: self.handler, timeout=100,
+                               safe=CTRL_SAFE_HOVER)
+
+
+if __name__ == '__main__':
+    unittest.main()
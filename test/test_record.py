@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+import io
+import unittest
+from unittest import mock
+
+from cfclient import record
+
+
+class SessionArgumentsTest(unittest.TestCase):
+
+    def _main(self, *args):
+        stderr = io.StringIO()
+        with mock.patch("sys.argv", ["cfrecord", "--session"] + list(args)), \
+                mock.patch("sys.stderr", stderr), \
+                mock.patch("sys.stdout", io.StringIO()), \
+                mock.patch.object(record, "_read_configs",
+                                  return_value=[]), \
+                self.assertRaises(SystemExit) as exit:
+            record.main()
+        return exit.exception.code, stderr.getvalue()
+
+    def test_file_options_are_rejected(self):
+        code, error = self._main("--format", "npz", "--compression", "gzip",
+                                 "--segment-size", "1000",
+                                 "--segment-time", "60")
+
+        self.assertEqual(2, code)
+        self.assertIn("--format, --compression, --segment-size, "
+                      "--segment-time can't be used with --session", error)
+
+    def test_fsync_is_accepted(self):
+        code, error = self._main("--fsync", "1")
+
+        self.assertEqual(-1, code)
+        self.assertEqual("", error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from cflib.crazyflie.log import LogConfig
+
+from cfclient.utils.blackbox import BlackBoxRecorder
+
+
+class BlackBoxRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.block = LogConfig("block", 10)
+        self.block.add_variable("a.b", "int16_t")
+        self.recorder = BlackBoxRecorder([self.block], self.directory,
+                                         pre_trigger=1, post_trigger=0.2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stop_during_write_does_not_write_again(self):
+        saved = []
+
+        def save(path, **columns):
+            # Stopped while the capture is written after the trigger
+            if not saved:
+                self.recorder.stop()
+            saved.append(path)
+            numpy.savez(path, **columns)
+        self.recorder._save = save
+        self.recorder.start()
+        self.block.data_received_cb.call(0, {"a.b": 1}, self.block)
+
+        self.recorder.trigger()
+        timer = self.recorder._capture.timer
+        timer.join()
+
+        self.assertEqual(1, len(saved))
+        self.assertEqual(1, len(self.recorder.captures))
+        self.assertEqual(1, len(os.listdir(self.directory)))
+
+    def test_stop_writes_capture_in_progress(self):
+        recorder = BlackBoxRecorder([self.block], self.directory,
+                                    pre_trigger=1, post_trigger=60)
+        recorder.start()
+        self.block.data_received_cb.call(0, {"a.b": 1}, self.block)
+        recorder.trigger()
+
+        recorder.stop()
+
+        self.assertEqual(1, len(recorder.captures))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import unittest
+
+import numpy
+
+from cfclient.utils.decimation import Decimator
+
+
+class DecimatorTest(unittest.TestCase):
+
+    HISTORY = 30000
+
+    def setUp(self):
+        self.random = numpy.random.default_rng(1)
+        self.ts = numpy.arange(200000, dtype=float)
+        self.data = self.random.normal(size=len(self.ts))
+        self.count = 0
+
+    def _kept(self):
+        return max(self.count - self.HISTORY, 0)
+
+    def _points(self, start, stop):
+        start = max(start, self._kept())
+        stop = max(min(stop, self.count), start)
+        return self.ts[start:stop], self.data[start:stop]
+
+    def _assert_cached_equals_fresh(self, decimation):
+        cached = Decimator(decimation)
+
+        for _ in range(300):
+            self.count += int(self.random.integers(1, 500))
+            window = int(self.random.choice([1000, 20000, self.HISTORY]))
+            stop = self.count - int(self.random.choice([0, 0, 3000]))
+            start = max(stop - window, self._kept())
+            pixels = int(self.random.choice([500, 1000]))
+
+            actual = cached.decimate(self._points, start, stop, pixels,
+                                     self._kept(), self.count)
+            expected = Decimator(decimation).decimate(
+                self._points, start, stop, pixels, self._kept(), self.count)
+
+            if expected is None:
+                self.assertIsNone(actual)
+                continue
+            numpy.testing.assert_array_equal(expected[0], actual[0])
+            numpy.testing.assert_array_equal(expected[1], actual[1])
+
+    def test_cached_equals_fresh_minmax(self):
+        self._assert_cached_equals_fresh("minmax")
+
+    def test_cached_equals_fresh_lttb(self):
+        self._assert_cached_equals_fresh("lttb")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from cflib.crazyflie.log import LogConfig
+
+from cfclient.utils.logdataloader import LogDirectoryReader
+from cfclient.utils.logdataloader import LogSessionReader
+from cfclient.utils.logdataloader import load_log
+from cfclient.utils.logdataloader import load_session
+from cfclient.utils.logdatawriter import LOG_FORMAT_CSV
+from cfclient.utils.logdatawriter import LOG_FORMAT_NPZ
+from cfclient.utils.logdatawriter import LogSessionWriter
+from cfclient.utils.logdatawriter import LogWriter
+from cfclient.utils.logdatawriter import TIMESTAMP_COLUMN
+from cfclient.utils.logdatawriter import TIMESTAMP_RANGE
+from cfclient.utils.logdatawriter import open_log_file
+
+# Timestamps of rows every 10 ms, wrapping after the fifth row
+WRAP_TS = (TIMESTAMP_RANGE - 50 + 10 * numpy.arange(12)) % TIMESTAMP_RANGE
+UNWRAPPED_TS = TIMESTAMP_RANGE - 50 + 10 * numpy.arange(12)
+
+
+class LogSessionReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "session.cflog")
+        self.block = LogConfig("block", 10)
+        self.block.add_variable("a.b", "int16_t")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, timestamps):
+        writer = LogSessionWriter(self.path, chunk_rows=4)
+        writer.start()
+        writer.add_block(self.block)
+        for i, ts in enumerate(timestamps):
+            self.block.data_received_cb.call(int(ts), {"a.b": i}, self.block)
+        writer.stop()
+
+    def test_time_range_is_unwrapped(self):
+        self._write(WRAP_TS)
+        reader = LogSessionReader(self.path)
+
+        actual = reader.time_range()
+        reader.close()
+
+        self.assertEqual((UNWRAPPED_TS[0], UNWRAPPED_TS[-1]), actual)
+
+    def test_read_range_across_wrap(self):
+        self._write(WRAP_TS)
+        reader = LogSessionReader(self.path)
+
+        actual = reader.read(UNWRAPPED_TS[3], UNWRAPPED_TS[8])["block"]
+        reader.close()
+
+        numpy.testing.assert_array_equal(UNWRAPPED_TS[3:9],
+                                         actual[TIMESTAMP_COLUMN])
+        numpy.testing.assert_array_equal(numpy.arange(3, 9), actual["a.b"])
+
+    def test_read_all_across_wrap(self):
+        self._write(WRAP_TS)
+        reader = LogSessionReader(self.path)
+
+        actual = reader.read()["block"]
+        reader.close()
+
+        numpy.testing.assert_array_equal(UNWRAPPED_TS,
+                                         actual[TIMESTAMP_COLUMN])
+
+    def test_block_added_after_wrap_shares_time_base(self):
+        late = LogConfig("late", 10)
+        late.add_variable("a.b", "int16_t")
+        writer = LogSessionWriter(self.path, chunk_rows=4)
+        writer.start()
+        writer.add_block(self.block)
+        for i, ts in enumerate(WRAP_TS):
+            self.block.data_received_cb.call(int(ts), {"a.b": i}, self.block)
+        writer.add_block(late)
+        for i, ts in enumerate(WRAP_TS[6:]):
+            late.data_received_cb.call(int(ts), {"a.b": i}, late)
+        writer.stop()
+
+        reader = LogSessionReader(self.path)
+        time_range = reader.time_range()
+        rows = reader.read(UNWRAPPED_TS[8], UNWRAPPED_TS[-1])
+        reader.close()
+
+        self.assertEqual((UNWRAPPED_TS[0], UNWRAPPED_TS[-1]), time_range)
+        numpy.testing.assert_array_equal(UNWRAPPED_TS[8:],
+                                         rows["block"][TIMESTAMP_COLUMN])
+        numpy.testing.assert_array_equal(UNWRAPPED_TS[8:],
+                                         rows["late"][TIMESTAMP_COLUMN])
+
+
+class LogDirectoryReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.block = LogConfig("block", 10)
+        self.block.add_variable("a.b", "int16_t")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, file_format):
+        writer = LogWriter(self.block, directory=self.directory,
+                           file_format=file_format, chunk_rows=4)
+        writer.start()
+        for i, ts in enumerate(WRAP_TS):
+            self.block.data_received_cb.call(int(ts), {"a.b": i}, self.block)
+        writer.stop()
+
+    def _assert_read_across_wrap(self, file_format):
+        self._write(file_format)
+        reader = LogDirectoryReader(self.directory)
+
+        time_range = reader.time_range()
+        actual = reader.read(UNWRAPPED_TS[3], UNWRAPPED_TS[8])
+        reader.close()
+
+        self.assertEqual((UNWRAPPED_TS[0], UNWRAPPED_TS[-1]), time_range)
+        columns = list(actual.values())[0]
+        numpy.testing.assert_array_equal(UNWRAPPED_TS[3:9],
+                                         columns[TIMESTAMP_COLUMN])
+        numpy.testing.assert_array_equal(numpy.arange(3, 9), columns["a.b"])
+
+    def test_read_csv_across_wrap(self):
+        self._assert_read_across_wrap(LOG_FORMAT_CSV)
+
+    def test_read_npz_across_wrap(self):
+        self._assert_read_across_wrap(LOG_FORMAT_NPZ)
+
+    def _write_late_block(self, file_format):
+        """Write a block that starts logging after the wrap"""
+        late = LogConfig("late", 10)
+        late.add_variable("a.b", "int16_t")
+        writer = LogWriter(late, directory=self.directory,
+                           file_format=file_format, chunk_rows=4)
+        writer.start()
+        for i, ts in enumerate(WRAP_TS[6:]):
+            late.data_received_cb.call(int(ts), {"a.b": i}, late)
+        writer.stop()
+
+    def _assert_late_block_in_sync(self, file_format):
+        self._write(file_format)
+        self._write_late_block(file_format)
+        reader = LogDirectoryReader(self.directory)
+        time_range = reader.time_range()
+        rows = reader.read(UNWRAPPED_TS[8], UNWRAPPED_TS[-1])
+        reader.close()
+
+        self.assertEqual((UNWRAPPED_TS[0], UNWRAPPED_TS[-1]), time_range)
+        self.assertEqual(2, len(rows))
+        for columns in rows.values():
+            numpy.testing.assert_array_equal(UNWRAPPED_TS[8:],
+                                             columns[TIMESTAMP_COLUMN])
+
+    def test_csv_block_started_after_wrap(self):
+        self._assert_late_block_in_sync(LOG_FORMAT_CSV)
+
+    def test_npz_block_started_after_wrap(self):
+        self._assert_late_block_in_sync(LOG_FORMAT_NPZ)
+
+    def test_load_session_block_started_after_wrap(self):
+        self._write(LOG_FORMAT_CSV)
+        self._write_late_block(LOG_FORMAT_CSV)
+
+        logs = load_session(self.directory)
+
+        timestamps = sorted(tuple(columns[TIMESTAMP_COLUMN][-2:])
+                            for columns in logs.values())
+        self.assertEqual([tuple(UNWRAPPED_TS[-2:])] * 2, timestamps)
+
+    def test_load_session_unwraps(self):
+        self._write(LOG_FORMAT_CSV)
+
+        actual = load_session(self.directory)
+
+        numpy.testing.assert_array_equal(
+            UNWRAPPED_TS, list(actual.values())[0][TIMESTAMP_COLUMN])
+
+
+class TruncatedCsvTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "block.csv.gz")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write_cut(self, extra):
+        """Write a gzip CSV with a sync point after 5 rows, and cut it extra
+        bytes after the sync point as if the client crashed"""
+        f = open_log_file(self.path, "w")
+        f.write("Timestamp,a.b\n")
+        f.write("".join("{},{}\n".format(i * 10, i) for i in range(5)))
+        f.flush()
+        synced = os.path.getsize(self.path)
+        f.write("".join("{},{}\n".format(i * 10, i) for i in range(5, 500)))
+        f.close()
+        with open(self.path, "rb") as raw:
+            data = raw.read(synced + extra)
+        with open(self.path, "wb") as raw:
+            raw.write(data)
+
+    def test_read_up_to_sync_point(self):
+        self._write_cut(0)
+
+        columns = load_log(self.path)
+
+        numpy.testing.assert_array_equal(columns["a.b"], numpy.arange(5))
+        numpy.testing.assert_array_equal(columns[TIMESTAMP_COLUMN],
+                                         10 * numpy.arange(5))
+
+    def test_partial_block_after_sync_point(self):
+        self._write_cut(20)
+
+        columns = load_log(self.path)
+
+        rows = len(columns["a.b"])
+        self.assertGreaterEqual(rows, 5)
+        self.assertLess(rows, 500)
+        numpy.testing.assert_array_equal(columns["a.b"], numpy.arange(rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from cflib.crazyflie.log import LogConfig
+
+from cfclient.utils.blackbox import LogRingBuffer
+from cfclient.utils.logdataloader import LogSessionReader
+from cfclient.utils.logdataloader import load_session
+from cfclient.utils.logdatawriter import LOG_FORMAT_NPZ
+from cfclient.utils.logdatawriter import LogSessionWriter
+from cfclient.utils.logdatawriter import LogWriter
+
+# FP16 values as cflib hands them over, the int16 bits of the half float
+FP16_BITS = [15361, 31000, -17407, 0]
+FP16_VALUES = numpy.array(FP16_BITS, dtype="<i2").view("<f2")
+
+
+class LogDataWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.block = LogConfig("block", 10)
+        self.block.add_variable("pm.vbat", "FP16")
+        self.block.add_variable("a.b", "int16_t")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _send(self):
+        for i, bits in enumerate(FP16_BITS):
+            self.block.data_received_cb.call(
+                i * 10, {"pm.vbat": bits, "a.b": bits}, self.block)
+
+    def _assert_columns(self, columns):
+        numpy.testing.assert_array_equal(columns["pm.vbat"], FP16_VALUES)
+        self.assertEqual(columns["pm.vbat"].dtype, numpy.float16)
+        numpy.testing.assert_array_equal(columns["a.b"], FP16_BITS)
+
+    def test_fp16_round_trip_npz(self):
+        writer = LogWriter(self.block, directory=self.directory,
+                           file_format=LOG_FORMAT_NPZ)
+
+        writer.start()
+        self._send()
+        writer.stop()
+
+        logs = load_session(self.directory)
+        self.assertEqual(1, len(logs))
+        self._assert_columns(list(logs.values())[0])
+
+    def test_fp16_round_trip_session(self):
+        path = os.path.join(self.directory, "session.cflog")
+        writer = LogSessionWriter(path)
+
+        writer.start()
+        writer.add_block(self.block)
+        self._send()
+        writer.stop()
+
+        reader = LogSessionReader(path)
+        try:
+            self._assert_columns(reader.read()["block"])
+        finally:
+            reader.close()
+
+    def test_fp16_ring_buffer(self):
+        ring = LogRingBuffer(self.block, 1)
+
+        ring.start()
+        self._send()
+        ring.stop()
+
+        first, rows = ring.rows()
+        self.assertEqual(0, first)
+        self._assert_columns(rows)
+
+
+def _unbuffered_csv(variables, rows):
+    """The CSV written by LogWriter before the rows were buffered"""
+    s = "Timestamp"
+    for name in variables:
+        s += "," + name
+    s += '\n'
+    for (timestamp, data) in rows:
+        s += "%d" % timestamp
+        for name in variables:
+            s += "," + str(data[name])
+        s += '\n'
+    return s
+
+
+class BufferedCsvTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_same_bytes_as_unbuffered_writer(self):
+        block = LogConfig("block", 10)
+        block.add_variable("pm.vbat", "float")
+        block.add_variable("a.b", "int16_t")
+        block.add_variable("c.d", "uint32_t")
+        values = [0.1, -1e-07, 3.14159274, 1e+20, float("nan"), 2.5]
+        rows = [(i * 10, {"pm.vbat": v, "a.b": -i, "c.d": 2 ** 32 - 1 - i})
+                for i, v in enumerate(values * 20)]
+        writer = LogWriter(block, directory=self.directory, max_buffer=100)
+
+        writer.start()
+        for (timestamp, data) in rows:
+            block.data_received_cb.call(timestamp, data, block)
+        writer.stop()
+
+        (name,) = os.listdir(self.directory)
+        with open(os.path.join(self.directory, name), "rb") as f:
+            written = f.read()
+        expected = _unbuffered_csv(["pm.vbat", "a.b", "c.d"], rows)
+        self.assertEqual(expected.encode("utf-8"), written)
+
+
+if __name__ == '__main__':
+    unittest.main()
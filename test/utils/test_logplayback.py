@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+
+import shutil
+import tempfile
+import unittest
+
+import numpy
+from cflib.crazyflie.log import LogConfig
+
+from cfclient.utils.logdatawriter import LOG_FORMAT_NPZ
+from cfclient.utils.logdatawriter import LogWriter
+from cfclient.utils.logdatawriter import TIMESTAMP_COLUMN
+from cfclient.utils.logdatawriter import TIMESTAMP_RANGE
+from cfclient.utils.logplayback import LogPlayback
+
+# Timestamps of rows every 10 ms, wrapping after the fifth row
+WRAP_TS = (TIMESTAMP_RANGE - 50 + 10 * numpy.arange(12)) % TIMESTAMP_RANGE
+
+
+class LogPlaybackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        block = LogConfig("block", 10)
+        block.add_variable("a.b", "int16_t")
+        writer = LogWriter(block, directory=self.directory,
+                           file_format=LOG_FORMAT_NPZ, chunk_rows=4)
+        writer.start()
+        for i, ts in enumerate(WRAP_TS):
+            block.data_received_cb.call(int(ts), {"a.b": i}, block)
+        writer.stop()
+        self.playback = LogPlayback(self.directory)
+
+    def tearDown(self):
+        self.playback.close()
+        shutil.rmtree(self.directory)
+
+    def test_plays_across_wrap(self):
+        self.playback.seek(self.playback.start + 20)
+
+        self.playback.play()
+        rows = self.playback.advance(0.05)
+
+        self.assertEqual(110, self.playback.end - self.playback.start)
+        columns = list(rows.values())[0]
+        numpy.testing.assert_array_equal(numpy.arange(3, 8), columns["a.b"])
+
+    def test_history_across_wrap(self):
+        self.playback.seek(self.playback.end)
+
+        rows = self.playback.history(60)
+
+        columns = list(rows.values())[0]
+        numpy.testing.assert_array_equal(numpy.arange(5, 12), columns["a.b"])
+        self.assertTrue(numpy.all(numpy.diff(columns[TIMESTAMP_COLUMN]) > 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
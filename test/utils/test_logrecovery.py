@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+#     ||          ____  _ __
+#  +------+      / __ )(_) /_______________ _____  ___
+#  | 0xBC |     / __  / / __/ ___/ ___/ __ `/_  / / _ \
+#  +------+    / /_/ / / /_/ /__/ /  / /_/ / / /_/  __/
+#   ||  ||    /_____/_/\__/\___/_/   \__,_/ /___/\___/
+#
+#  Copyright (C) 2011-2013 Bitcraze AB
+#
+#  Crazyflie Nano Quadcopter Client
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA  02110-1301, USA.
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from cfclient.utils.logrecovery import RECOVERY_OK
+from cfclient.utils.logrecovery import RECOVERY_REPAIRED
+from cfclient.utils.logrecovery import recover
+
+HEADER = b"Timestamp,a,b\r\n"
+ROWS = [b"10,1.5,2\r\n", b"20,2.5,3\r\n", b"30,3.5,4\r\n"]
+
+
+class LogRecoveryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _recover(self, path):
+        [(_, status, _)] = recover(path)
+        return status
+
+    def test_crlf_csv_is_cut_after_last_complete_row(self):
+        path = os.path.join(self.directory, "log.csv")
+        with open(path, "wb") as f:
+            f.write(HEADER + b"".join(ROWS) + b"40,4.")
+
+        status = self._recover(path)
+
+        self.assertEqual(RECOVERY_REPAIRED, status)
+        with open(path, "rb") as f:
+            self.assertEqual(HEADER + b"".join(ROWS), f.read())
+        self.assertEqual(RECOVERY_OK, self._recover(path))
+
+    def test_crlf_gzip_csv_keeps_line_endings(self):
+        path = os.path.join(self.directory, "log.csv.gz")
+        with gzip.open(path, "wb") as f:
+            f.write(HEADER + b"".join(ROWS) + b"40,4.")
+
+        status = self._recover(path)
+
+        self.assertEqual(RECOVERY_REPAIRED, status)
+        with gzip.open(path, "rb") as f:
+            self.assertEqual(HEADER + b"".join(ROWS), f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()